@@ -0,0 +1,11 @@
+"""
+DogPVSimulation_6Comp_Python
+Canine circulation model: pressure-volume behavior of the left and right ventricles coupled to a
+circuit model of the systemic and pulmonary circulations (Santamore WP and Burkhoff D, Am J Physiol
+1991; Burkhoff D and Tyberg JV, Am J Physiol 1993).
+
+Nothing is imported here, so that importing a single module (or running the cli) only loads what
+that module needs; import from the modules directly, e.g.
+    from DogPVSimulation_6Comp_Python.simulate_heart_beat import simulate_heart_beat
+"""
+__version__ = "0.1.0"
@@ -0,0 +1,8 @@
+"""
+__main__.py
+python -m DogPVSimulation_6Comp_Python runs the command line interface, see cli.py
+"""
+import sys
+from DogPVSimulation_6Comp_Python.cli import main
+
+sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+bench_cli.py
+Start up and end to end wall time of the command line interface as separate processes (the way a
+scheduler calls it): the bare interpreter, --version, and --metrics-only runs with the default
+pipeline, with RK45 + Anderson shooting and with a warm steady state cache. Also lists the slowest
+imports of a --metrics-only run and checks that matplotlib and Numba are not among them
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+REPEATS = 5
+FAST = ["--integrator", "rk45", "--steady-state", "anderson"]
+
+
+def wall_time(args, repeats=REPEATS):
+    """Median wall time (s) of running python args as a new process"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def main():
+    cli = ["-m", "DogPVSimulation_6Comp_Python"]
+    with tempfile.TemporaryDirectory() as directory:
+        cache = os.path.join(directory, "steady_states.npz")
+        subprocess.run([sys.executable] + cli + ["--metrics-only", "--cache", cache], check=True,
+                       stdout=subprocess.DEVNULL)
+        cases = [("python -c pass", ["-c", "pass"], REPEATS),
+                 ("--version", cli + ["--version"], REPEATS),
+                 ("--metrics-only", cli + ["--metrics-only"], 1), # fixed point loop, seconds per run
+                 ("--metrics-only rk45 anderson", cli + ["--metrics-only"] + FAST, REPEATS),
+                 ("--metrics-only cached steady state", cli + ["--metrics-only", "--cache", cache], REPEATS)]
+        for name, args, repeats in cases:
+            print(name + ": " + str(round(wall_time(args, repeats) * 1e3, 1)) + " ms")
+
+    # -X importtime lines are "import time: self | cumulative | name", nested names indented
+    result = subprocess.run([sys.executable, "-X", "importtime"] + cli + ["--metrics-only"] + FAST, check=True,
+                            capture_output=True, text=True)
+    imports = [line.split("|") for line in result.stderr.splitlines() if line.startswith("import time:")][1:]
+    top_level = [(int(cumulative), name.strip()) for _, cumulative, name in imports if not name.startswith("  ")]
+    print("slowest top level imports of --metrics-only (ms): "
+          + ", ".join(name + " " + str(round(us / 1e3, 1)) for us, name in sorted(top_level, reverse=True)[:5]))
+    loaded = {name.strip().split(".")[0] for _, _, name in imports}
+    print("matplotlib imported: " + str("matplotlib" in loaded) + ", numba imported: " + str("numba" in loaded))
+
+
+if __name__ == "__main__":
+    main()
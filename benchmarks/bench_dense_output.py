@@ -0,0 +1,53 @@
+"""
+bench_dense_output.py
+Memory per stored beat, wall time and accuracy of the sampled steady state beat for several solver /
+output grid / dtype combinations, next to the full 5000 row float64 RK4 trajectory. Volume errors are
+measured at the output samples against a tight tolerance RK45 reference, metric errors against the
+reference metrics; every case samples the beat from the same steady state initial volumes
+"""
+import time
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.steady_state import periodic_steady_state
+from DogPVSimulation_6Comp_Python.dense_output import OutputGrid, simulate_sampled
+
+CASES = [("rk4", 4999, OutputGrid(samples=5000, dtype="float64"), {}),
+         ("rk4", 4999, OutputGrid(samples=500), {}),
+         ("rk45", 4999, OutputGrid(samples=5000, dtype="float64"), {}),
+         ("rk45", 4999, OutputGrid(samples=500), {}),
+         ("rk45", 4999, OutputGrid(samples=100, at_events=True), {}),
+         ("rk45", 4999, OutputGrid(samples=None, at_events=True), {}),
+         ("rk45", 4999, OutputGrid(samples=500), {"rtol": 1e-8, "atol": 1e-8}),
+         ("exponential", 4999, OutputGrid(samples=500), {})]
+
+
+def main():
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions()
+    volumes, _, _ = periodic_steady_state(resistances, capacitances, ventricles, time_vector, tes, Volumes[0, :],
+                                          method="anderson", cutoff=1e-6)
+    reference = simulate_sampled(resistances, capacitances, ventricles, time_vector[-1], tes, volumes,
+                                 OutputGrid(samples=len(time_vector), dtype="float64"), integrator="rk45",
+                                 nSteps=len(time_vector) - 1, steady_state=None, rtol=1e-10, atol=1e-10)
+
+    for integrator, nSteps, output, options in CASES:
+        simulate_sampled(resistances, capacitances, ventricles, time_vector[-1], tes, volumes, output,
+                         integrator=integrator, nSteps=nSteps, steady_state=None, **options) # warm up
+        start = time.perf_counter()
+        beat = simulate_sampled(resistances, capacitances, ventricles, time_vector[-1], tes, volumes, output,
+                                integrator=integrator, nSteps=nSteps, steady_state=None, **options)
+        wall = time.perf_counter() - start
+        expected = np.array([np.interp(beat.time.astype(float), reference.time, reference.Volumes[:, k])
+                             for k in range(6)]).T
+        metric_err = max(abs(beat.metrics[name] - reference.metrics[name]) for name in ("MAP", "SV", "EDP"))
+        grid = [str(output.samples) + " samples"] if output.samples else []
+        grid += ["events"] if output.at_events else []
+        tolerances = [key + " " + str(value) for key, value in options.items()]
+        name = " ".join([integrator] + tolerances) + ", " + " + ".join(grid) + ", " + output.dtype.name
+        print(name + ": " + str(len(beat.time)) + " rows, " + str(round(beat.nbytes / 1024, 1)) + " KiB, "
+              + str(beat.nSteps) + " steps, " + str(round(wall * 1e3, 1)) + " ms, max volume error "
+              + "{:.1e}".format(np.max(abs(beat.Volumes - expected))) + " ml, max MAP/SV/EDP error "
+              + "{:.1e}".format(metric_err))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+bench_exponential.py
+Steps per beat, wall time and maximum volume error of the exponential integrator against a tight
+tolerance RK45 reference, next to the 5000 step RK4 grid and the default RK45 solver, and the reuse of
+the propagator cache across a sweep of ventricle parameters sharing one vasculature
+"""
+import time
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.rk4_kernel import RK4Kernel
+from DogPVSimulation_6Comp_Python.rk45 import RK45Solver
+from DogPVSimulation_6Comp_Python.exponential import ExponentialSolver, propagator_cache_stats, clear_propagator_cache
+from DogPVSimulation_6Comp_Python.steady_state import periodic_steady_state
+
+STEPS = [50, 100, 200, 400, 800]
+
+
+def beat(stepper, volumes, time_vector, tes):
+    """Volumes over one beat from volumes, and the wall time of the beat"""
+    Volumes = np.zeros((len(time_vector), 6))
+    Pressures = np.zeros((len(time_vector), 6))
+    Volumes[0, :] = volumes
+    if isinstance(stepper, RK4Kernel):
+        stepper.pressures(Volumes[0, :], 0, Pressures[0, :])
+    start = time.perf_counter()
+    result = stepper.run_beat(Volumes, Pressures, time_vector, tes)
+    return Volumes, time.perf_counter() - start, getattr(result, "nSteps", len(time_vector) - 1)
+
+
+def main():
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions()
+    volumes, _, _ = periodic_steady_state(resistances, capacitances, ventricles, time_vector, tes, Volumes[0, :],
+                                          method="anderson", cutoff=1e-6)
+    reference, _, _ = beat(RK45Solver(resistances, capacitances, ventricles, rtol=1e-10, atol=1e-10), volumes,
+                           time_vector, tes)
+
+    solvers = [("rk4", RK4Kernel(resistances, capacitances, ventricles)),
+               ("rk45", RK45Solver(resistances, capacitances, ventricles))]
+    solvers += [("exponential " + str(n), ExponentialSolver(resistances, capacitances, ventricles, nSteps=n))
+                for n in STEPS]
+    for name, stepper in solvers:
+        beat(stepper, volumes, time_vector, tes) # fills the propagator cache
+        V, wall, nSteps = beat(stepper, volumes, time_vector, tes)
+        print(name + ": " + str(nSteps) + " steps, " + str(round(wall * 1e3, 1)) + " ms, max volume error "
+              + "{:.1e}".format(np.max(abs(V - reference))) + " ml")
+
+    # propagators depend on the vasculature only, so runs over the ventricle parameters share them
+    clear_propagator_cache()
+    start = time.perf_counter()
+    for LV_EES in np.linspace(3, 10, 8):
+        Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(LV_EES=LV_EES)
+        periodic_steady_state(resistances, capacitances, ventricles, time_vector, tes, Volumes[0, :],
+                              method="anderson", integrator="exponential")
+    print("LV_EES sweep, 8 steady states: " + str(round(time.perf_counter() - start, 2)) + " s, propagator cache "
+          + str(propagator_cache_stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+bench_fitting.py
+Steady state solves, beats and wall time to fit perturbed parameters back to synthetic measurements
+(MAP, SV, EDP, ESV and an LV pressure trace of the true model) with forward sensitivity Jacobians
+versus finite difference ones, and the relative error of the recovered parameters
+"""
+import time
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.sensitivity import simulate_with_sensitivities, get_parameters, set_parameters
+from DogPVSimulation_6Comp_Python.fitting import fit_parameters, model_outputs
+
+NAMES = ["Ras", "Cas", "LV_Ees", "LV_A"]
+PERTURBATION = [1.3, 0.8, 0.85, 1.2] # starting guess / true value
+N_SAMPLES = 20 # LV pressure samples over the cycle
+
+
+def main():
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(nRows=2000)
+
+    # synthetic measurements from the true parameters
+    start = time.perf_counter()
+    V, P, dV, dP, _ = simulate_with_sensitivities(resistances, capacitances, ventricles, time_vector, tes,
+                                                  Volumes[0, :], [])
+    print("one steady state solve: " + str(round(time.perf_counter() - start, 3)) + " s")
+    shape = {"MAP": 0, "SV": 0, "EDP": 0, "ESV": 0, "LV_pressure": np.zeros(N_SAMPLES)}
+    values, _ = model_outputs(V, P, dV, dP, time_vector, shape)
+    targets = {"MAP": values[0], "SV": values[1], "EDP": values[2], "ESV": values[3], "LV_pressure": values[4:]}
+
+    true = get_parameters(resistances, capacitances, ventricles, NAMES)
+    guess = set_parameters(resistances, capacitances, ventricles, NAMES, true * np.array(PERTURBATION))
+    for gradient in ("sensitivity", "finite_difference"):
+        result = fit_parameters(targets, NAMES, *guess, time_vector, tes, V[0], gradient=gradient)
+        error = np.max(abs(np.array([result.parameters[name] for name in NAMES]) / true - 1))
+        print(gradient + ": " + str(result.nIterations) + " iterations, " + str(result.nSolves) + " solves ("
+              + str(result.fd_solves) + " with finite differences), " + str(result.nBeats) + " beats, "
+              + str(round(result.wall_time, 2)) + " s, max relative parameter error " + "{:.1e}".format(error))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+bench_infarct.py
+Regression and cost of the 7 compartment circuit with the LV infarct scar. Runs simulate_heart_beat
+to steady state with and without the scar and checks that the infarct run converges, conserves blood
+volume over the beat, and that a scar cut off from the LV (infinite connecting resistance) leaves the
+6 compartment waveforms unchanged. Prints wall times and the change of MAP/SV/EDP; the exit status
+is 1 if a check fails
+"""
+import sys
+import time
+import warnings
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.simulate_heart_beat import simulate_heart_beat
+from DogPVSimulation_6Comp_Python.calculate_metrics import calculate_metrics
+
+INFARCT = [0.2, 0.35, 5, 0.002] # scar A (1/ml), B (mmHg), V0 (ml), resistance to the LV (mmHg*s/ml)
+VOLUME_TOLERANCE = 1e-6 # allowed drift of total blood volume over a beat (ml)
+ISOLATION_TOLERANCE = 1e-9 # allowed difference of the cut off scar run from the 6 compartment run (ml, mmHg)
+
+
+def run(infarct, integrator="rk4", steady_state="fixed_point", initial_volumes=None):
+    """Volumes, Pressures, Valves, Flows, time_vector, ConvergenceResult and wall time of one run"""
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(infarct=infarct)
+    if initial_volumes is not None:
+        Volumes[0, :] = initial_volumes
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning) # reported through convergence.converged
+        Volumes, Pressures, Valves, Flows, convergence = simulate_heart_beat(
+            resistances, capacitances, ventricles, time_vector, tes, Volumes, integrator=integrator,
+            steady_state=steady_state, return_convergence=True, infarct=infarct)
+    return Volumes, Pressures, Valves, Flows, time_vector, convergence, time.perf_counter() - start
+
+
+def main():
+    failures = []
+    V_base, P_base, Valves_base, _, time_vector, convergence, wall = run(None)
+    base_metrics = calculate_metrics(V_base, P_base, Valves_base, time_vector)
+    print("6 compartments: " + str(convergence.nBeats) + " beats, " + str(round(wall, 2)) + " s")
+
+    for integrator, steady_state in (("rk4", "fixed_point"), ("rk4", "anderson"), ("rk4_jit", "newton")):
+        Volumes, Pressures, Valves, Flows, time_vector, convergence, wall = run(INFARCT, integrator, steady_state)
+        name = "infarct " + integrator + " " + steady_state
+        drift = np.max(abs(np.sum(Volumes, axis=1) - np.sum(Volumes[0, :])))
+        metrics = calculate_metrics(Volumes, Pressures, Valves, time_vector)
+        print(name + ": " + str(convergence.nShootingBeats + convergence.nBeats) + " beats, " + str(round(wall, 2))
+              + " s, volume drift " + "{:.1e}".format(drift) + " ml, scar volume "
+              + str(round(float(np.mean(Volumes[:, 6])), 2)) + " ml, change of "
+              + ", ".join(key + " " + str(round(float(metrics[key] - base_metrics[key]), 2))
+                          for key in ("MAP", "SV", "EDP")))
+        if not convergence.converged:
+            failures.append(name + " did not reach steady state")
+        if drift > VOLUME_TOLERANCE:
+            failures.append(name + " does not conserve blood volume: " + str(drift) + " ml")
+
+    # a scar without a connection to the LV must not change the rest of the circulation
+    isolated = INFARCT[:3] + [np.inf]
+    Volumes, Pressures, _, Flows, _, _, _ = run(isolated, initial_volumes=np.append(V_base[0, :], 10.0))
+    difference = max(np.max(abs(Volumes[:, :6] - V_base)), np.max(abs(Pressures[:, :6] - P_base)))
+    print("isolated scar: max difference from 6 compartments " + "{:.1e}".format(difference)
+          + ", max scar flow " + "{:.1e}".format(np.max(abs(Flows[:, 6]))) + " ml/s")
+    if difference > ISOLATION_TOLERANCE or np.any(Flows[:, 6] != 0):
+        failures.append("isolated scar changes the 6 compartment circulation by " + str(difference))
+
+    for failure in failures:
+        print("FAIL: " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+bench_protocol.py
+Vena cava occlusion protocol: time per beat of the protocol engine (stream_beats with per beat
+metrics) versus the bare run_beat of the same integrator, and the ESPVR / EDPVR fitted from the
+occluded beats against the model's LV Ees and V0
+"""
+import time
+import numpy as np
+from DogPVSimulation_6Comp_Python.protocol import Protocol, occlusion, ramp
+from DogPVSimulation_6Comp_Python.integrators import make_stepper
+from DogPVSimulation_6Comp_Python.hemodynamics import fit_espvr, fit_edpvr
+
+START, N_OCCLUDED, N_BEATS = 3, 12, 20
+
+
+def main():
+    protocol = Protocol(occlusion(START, N_OCCLUDED))
+    start = time.perf_counter()
+    records = list(protocol.run(N_BEATS))
+    print("occlusion protocol, " + str(N_BEATS) + " beats incl. baseline steady state: "
+          + str(round(time.perf_counter() - start, 2)) + " s")
+    occluded = records[START:START + N_OCCLUDED]
+    Ees, V0 = fit_espvr([r.metrics["ESV"] for r in occluded], [r.metrics["ESP"] for r in occluded])
+    alpha, beta = fit_edpvr([r.metrics["EDV"] for r in occluded], [r.metrics["EDP"] for r in occluded])
+    print("EDV " + str(round(records[0].metrics["EDV"], 1)) + " -> " + str(round(occluded[-1].metrics["EDV"], 1))
+          + " ml; ESPVR Ees " + str(round(float(Ees), 2)) + " mmHg/ml, V0 " + str(round(float(V0), 2))
+          + " ml (model 7, 5); EDPVR alpha " + str(round(float(alpha), 3)) + ", beta " + str(round(float(beta), 4)))
+
+    # a ramp changes the parameters every beat, the worst case for the schedule
+    for integrator in ("rk4", "rk4_jit"):
+        protocol = Protocol([ramp("SVR", 4.0, 0, 40)])
+        Volumes, time_vector, tes, ventricles, resistances, capacitances = protocol.initial_conditions()
+        stepper = make_stepper(integrator, resistances, capacitances, ventricles)
+        Pressures = np.zeros(np.shape(Volumes))
+        stepper.run_beat(Volumes, Pressures, time_vector, tes)
+        start = time.perf_counter()
+        for _ in range(10):
+            stepper.run_beat(Volumes, Pressures, time_vector, tes)
+        single = (time.perf_counter() - start) / 10
+
+        beats = protocol.run(41, initial_volumes=Volumes[0, :], integrator=integrator)
+        next(beats)
+        start = time.perf_counter()
+        nBeats = sum(1 for _ in beats)
+        per_beat = (time.perf_counter() - start) / nBeats
+        print(integrator + ": run_beat " + str(round(single * 1e3, 2)) + " ms, protocol beat "
+              + str(round(per_beat * 1e3, 2)) + " ms (" + str(round(per_beat / single, 2)) + "x)")
+
+
+if __name__ == "__main__":
+    main()
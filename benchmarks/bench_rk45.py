@@ -0,0 +1,67 @@
+"""
+bench_rk45.py
+Compares the fixed-step RK4 grid against the adaptive RK45 solver when converging to steady state:
+steps, wall time, and the error of SBP/DBP/SV/EDP against a tightly toleranced RK45 reference
+"""
+import time
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.calculate_pressures import calculate_pressures
+from DogPVSimulation_6Comp_Python.rk4_kernel import RK4Kernel
+from DogPVSimulation_6Comp_Python.rk45 import RK45Solver
+
+CUTOFF = 0.1 # steady state cutoff used by simulate_heart_beat (ml)
+
+
+def steady_state(stepper, capacitances, ventricles, Volumes, time_vector, tes):
+    """simulate_heart_beat's steady state loop; returns Volumes, Pressures, beats and solver steps"""
+    Pressures = np.zeros(np.shape(Volumes))
+    Volumes[-1, :] = Volumes[0, :]
+    nBeats = 0
+    nSteps = 0
+    while nBeats < 100:
+        nBeats = nBeats + 1
+        Volumes[0, :] = Volumes[-1, :]
+        Pressures[0, :] = calculate_pressures(Volumes[0, :], Pressures[0, :], capacitances, ventricles, 0)
+        beat = stepper.run_beat(Volumes, Pressures, time_vector, tes)
+        nSteps = nSteps + getattr(beat, "nSteps", len(time_vector) - 1) # RK4Kernel steps every row
+        if np.all(abs(Volumes[-1, :] - Volumes[0, :]) <= CUTOFF):
+            break
+    return Volumes, Pressures, nBeats, nSteps
+
+
+def metrics(Volumes, Pressures):
+    SBP = max(Pressures[:, 2])
+    DBP = min(Pressures[:, 2])
+    SV = max(Volumes[:, 1]) - min(Volumes[:, 1])
+    mv_open = Pressures[:, 0] > Pressures[:, 1]
+    row_MV_closes = np.nonzero(np.diff(mv_open.astype(int)) == -1)[0]
+    EDP = Pressures[row_MV_closes[0], 1]
+    return {"SBP": SBP, "DBP": DBP, "SV": SV, "EDP": EDP}
+
+
+def main():
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions()
+    solvers = [("rk4 (5000 rows)", RK4Kernel(resistances, capacitances, ventricles)),
+               ("rk45 (default tol)", RK45Solver(resistances, capacitances, ventricles))]
+
+    # reference: tight tolerance adaptive solution
+    reference = RK45Solver(resistances, capacitances, ventricles, rtol=1e-10, atol=1e-10)
+    V_ref, P_ref, _, _ = steady_state(reference, capacitances, ventricles, Volumes.copy(), time_vector, tes)
+    ref = metrics(V_ref, P_ref)
+
+    rk4_time = None
+    for name, stepper in solvers:
+        start = time.perf_counter()
+        V, P, nBeats, nSteps = steady_state(stepper, capacitances, ventricles, Volumes.copy(), time_vector, tes)
+        wall = time.perf_counter() - start
+        rk4_time = rk4_time or wall
+        result = metrics(V, P)
+        errors = ", ".join(k + " " + str(round(result[k] - ref[k], 4)) for k in ref)
+        print(name + ": " + str(nBeats) + " beats, " + str(nSteps) + " steps, " + str(round(wall, 3)) + " s ("
+              + str(round(rk4_time / wall, 1)) + "x)")
+        print("    error vs reference: " + errors)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+bench_rk4_kernel.py
+Compares the reference rk4 step against the vectorized RK4Kernel and the Numba compiled beat:
+steps per second for a single circulation, steps per second per circulation when a batch is stepped
+in lockstep, and agreement of one full beat integrated each way. The vectorized kernel only pays
+off with batches; for one circulation its NumPy call overhead leaves it close to rk4
+"""
+import time
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+from DogPVSimulation_6Comp_Python.rk4 import rk4
+from DogPVSimulation_6Comp_Python.rk4_kernel import RK4Kernel, activation
+from DogPVSimulation_6Comp_Python.rk4_compiled import CompiledRK4, NUMBA_AVAILABLE, compile_stats
+
+TOLERANCE = 1e-9 # maximum allowed volume (ml) / pressure (mmHg) difference over one beat
+BATCH_SIZE = 1000
+
+
+def beat_with_rk4(Volumes, Pressures, resistances, capacitances, ventricles, time_vector, tes):
+    step_size = time_vector[1] - time_vector[0]
+    for i in range(1, len(time_vector)):
+        Volumes[i, :], Pressures[i, :] = rk4(Volumes[i - 1, :], Pressures[i - 1, :], resistances, capacitances,
+                                             ventricles, step_size, time_vector[i], tes)
+    return Volumes, Pressures
+
+
+def main():
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions()
+    nSteps = len(time_vector) - 1
+    Pressures = np.zeros(np.shape(Volumes))
+    Pressures[0, :] = canine_circuit(resistances, capacitances, ventricles).pressures(Volumes[0, :], 0)
+
+    # reference rk4
+    V_ref, P_ref = Volumes.copy(), Pressures.copy()
+    start = time.perf_counter()
+    beat_with_rk4(V_ref, P_ref, resistances.copy(), capacitances, ventricles, time_vector, tes)
+    rk4_rate = nSteps / (time.perf_counter() - start)
+
+    # vectorized kernel, one circulation
+    kernel = RK4Kernel(resistances, capacitances, ventricles)
+    V_new, P_new = Volumes.copy(), Pressures.copy()
+    start = time.perf_counter()
+    kernel.run_beat(V_new, P_new, time_vector, tes)
+    kernel_rate = nSteps / (time.perf_counter() - start)
+
+    # compiled beat, timed after a first call that loads or compiles it
+    compiled = CompiledRK4(resistances, capacitances, ventricles)
+    V_jit, P_jit = Volumes.copy(), Pressures.copy()
+    start = time.perf_counter()
+    compiled.run_beat(V_jit, P_jit, time_vector, tes)
+    first_call = time.perf_counter() - start
+    start = time.perf_counter()
+    compiled.run_beat(V_jit, P_jit, time_vector, tes)
+    compiled_rate = nSteps / (time.perf_counter() - start)
+
+    # vectorized kernel, BATCH_SIZE circulations in lockstep
+    batch_kernel = RK4Kernel(resistances, capacitances, ventricles, batch_shape=(BATCH_SIZE,))
+    V_batch = np.tile(Volumes[0, :], (2, BATCH_SIZE, 1))
+    P_batch = np.tile(Pressures[0, :], (2, BATCH_SIZE, 1))
+    step_size = time_vector[1] - time_vector[0]
+    nBatchSteps = 500
+    start = time.perf_counter()
+    for i in range(1, nBatchSteps + 1):
+        epsilon = activation(time_vector[i], tes)
+        batch_kernel.step(V_batch[(i - 1) % 2], P_batch[(i - 1) % 2], step_size, epsilon, V_batch[i % 2], P_batch[i % 2])
+    batch_rate = nBatchSteps * BATCH_SIZE / (time.perf_counter() - start)
+
+    volume_err = max(np.max(np.abs(V_new - V_ref)), np.max(np.abs(V_jit - V_ref)))
+    pressure_err = max(np.max(np.abs(P_new - P_ref)), np.max(np.abs(P_jit - P_ref)))
+
+    print("rk4 (reference):         " + str(round(rk4_rate)) + " steps/s")
+    print("RK4Kernel:               " + str(round(kernel_rate)) + " steps/s (" + str(round(kernel_rate / rk4_rate, 2)) + "x)")
+    print("CompiledRK4:             " + str(round(compiled_rate)) + " steps/s (" + str(round(compiled_rate / rk4_rate, 2))
+          + "x), first call " + str(round(first_call, 3)) + " s, Numba " + ("on " + str(compile_stats()) if NUMBA_AVAILABLE else "not installed"))
+    print("RK4Kernel, N=" + str(BATCH_SIZE) + " batch:   " + str(round(batch_rate)) + " circulation-steps/s ("
+          + str(round(batch_rate / rk4_rate, 1)) + "x)")
+    print("Max volume difference over one beat:   " + str(volume_err) + " ml")
+    print("Max pressure difference over one beat: " + str(pressure_err) + " mmHg")
+    if max(volume_err, pressure_err) > TOLERANCE:
+        raise SystemExit("RK4Kernel or CompiledRK4 disagrees with rk4 beyond tolerance " + str(TOLERANCE))
+
+
+if __name__ == "__main__":
+    main()
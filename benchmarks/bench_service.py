@@ -0,0 +1,71 @@
+"""
+bench_service.py
+Runs the simulation service on localhost and measures: the latency of a cold request against an
+in process simulate_point of the same parameters, 8 concurrent identical requests (coalesced onto one
+computation), repeated requests (cache hits), a burst of distinct requests queueing on the pool,
+beats arriving over /stream, and the /status metrics afterwards
+"""
+import asyncio
+import time
+from DogPVSimulation_6Comp_Python.parameter_sweep import simulate_point
+from DogPVSimulation_6Comp_Python.service import SimulationService, request, stream
+
+OPTIONS = {"steady_state": "anderson"}
+
+
+async def timed(coroutine):
+    start = time.perf_counter()
+    result = await coroutine
+    return result, time.perf_counter() - start
+
+
+async def run():
+    service = SimulationService(nWorkers=2)
+    host, port = (await service.start(port=0))[:2]
+    address = {"host": host, "port": port}
+    try:
+        start = time.perf_counter()
+        simulate_point({"HR": 90}, OPTIONS)
+        print("in process simulate_point: " + str(round((time.perf_counter() - start) * 1e3, 1)) + " ms")
+
+        response, cold = await timed(request("metrics", {"parameters": {"HR": 90}, "options": OPTIONS}, **address))
+        print("cold /metrics: " + str(round(cold * 1e3, 1)) + " ms, MAP " + str(round(response["metrics"]["MAP"], 2)))
+
+        payload = {"parameters": {"HR": 95}, "options": OPTIONS}
+        responses, wall = await timed(asyncio.gather(*(request("metrics", payload, **address) for _ in range(8))))
+        print("8 concurrent identical requests: " + str(round(wall * 1e3, 1)) + " ms, identical responses "
+              + str(all(r == responses[0] for r in responses)))
+
+        _, hit = await timed(asyncio.gather(*(request("metrics", payload, **address) for _ in range(100))))
+        print("100 cache hits: " + str(round(hit * 1e3 / 100, 2)) + " ms per request")
+
+        payloads = [{"parameters": {"SVR": 2 + 0.1 * k}, "options": OPTIONS} for k in range(8)]
+        burst = asyncio.ensure_future(timed(asyncio.gather(*(request("simulate", p, **address) for p in payloads))))
+        await asyncio.sleep(0.5)
+        status = await request("status", **address)
+        _, wall = await burst
+        print("8 distinct /simulate requests on 2 workers: " + str(round(wall, 2)) + " s, after 0.5 s "
+              + str(status["pending"]) + " pending, queue depth " + str(status["queue_depth"]))
+
+        start = time.perf_counter()
+        async for record in stream({"options": {"nBeats": 6, "chunk_beats": 2}}, **address):
+            print("  stream beat " + str(record["beat"]) + " at " + str(round(time.perf_counter() - start, 2))
+                  + " s, max volume change " + str(round(max(record["error"]), 3)) + " ml")
+
+        status = await request("status", **address)
+        print("status: counters " + str(status["counters"]) + ", queue wait p95 "
+              + str(round(status["queue_wait"].get("p95", 0) * 1e3, 1)) + " ms")
+        for endpoint, latency in status["latency"].items():
+            if latency["count"]:
+                print("  " + endpoint + ": " + str(latency["count"]) + " requests, p50 "
+                      + str(round(latency["p50"] * 1e3, 1)) + " ms, p95 " + str(round(latency["p95"] * 1e3, 1)) + " ms")
+    finally:
+        await service.close()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
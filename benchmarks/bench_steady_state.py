@@ -0,0 +1,48 @@
+"""
+bench_steady_state.py
+Beats integrated and wall time to reach steady state with simulate_heart_beat's fixed point loop
+versus Newton and Anderson shooting, for the RK4 grid and the adaptive RK45 solver
+"""
+import time
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.rk4_kernel import RK4Kernel
+from DogPVSimulation_6Comp_Python.rk45 import RK45Solver
+from DogPVSimulation_6Comp_Python.steady_state import periodic_steady_state
+
+CUTOFF = 0.1 # steady state cutoff used by simulate_heart_beat (ml)
+
+
+def fixed_point(stepper, volumes, time_vector, tes):
+    """simulate_heart_beat's loop: repeat beats until no compartment changes by more than CUTOFF"""
+    for nBeats in range(1, 101):
+        ends = stepper.end_of_beat(volumes, time_vector, tes)
+        if np.all(abs(ends - volumes) <= CUTOFF):
+            return ends, nBeats
+        volumes = ends
+    return volumes, 100
+
+
+def main():
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions()
+
+    for integrator, stepper in (("rk4", RK4Kernel(resistances, capacitances, ventricles)),
+                                ("rk45", RK45Solver(resistances, capacitances, ventricles))):
+        start = time.perf_counter()
+        _, fixed_beats = fixed_point(stepper, Volumes[0, :], time_vector, tes)
+        fixed_time = time.perf_counter() - start
+        print(integrator + " fixed point: " + str(fixed_beats) + " beats, " + str(round(fixed_time, 3)) + " s")
+
+        for method in ("newton", "anderson"):
+            start = time.perf_counter()
+            _, nIterations, nBeats = periodic_steady_state(resistances, capacitances, ventricles, time_vector, tes,
+                                                           Volumes[0, :], method=method, integrator=integrator,
+                                                           cutoff=CUTOFF)
+            wall = time.perf_counter() - start
+            print(integrator + " " + method + ": " + str(nIterations) + " iterations, " + str(nBeats) + " beats ("
+                  + str(fixed_beats - nBeats) + " saved), " + str(round(wall, 3)) + " s ("
+                  + str(round(fixed_time / wall, 1)) + "x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+bench_suite.py
+Benchmark and accuracy regression suite for the solver hot paths. For each parameter case it times
+    rk4_step        one RK4Kernel step (s), and the corresponding steps per second
+    beat            one full cycle with the selected integrator (s)
+    steady_state    simulate_heart_beat to steady state (s)
+    postprocess     calculate_flows + hemodynamics.analyze (s)
+    render          headless FigureTemplate update and PNG rendering of the three figures (s), null
+                    when matplotlib is not installed
+and checks MAP/SV/CO/EDP and decimated waveforms against golden_outputs.json with the tolerances
+below. Results are written as JSON (stdout or --json); the exit status is 1 if any case fails.
+
+    python bench_suite.py [--integrator rk4|rk4_jit|rk45|exponential] [--steady-state fixed_point|newton|anderson]
+                          [--json results.json] [--update-golden]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.simulate_heart_beat import simulate_heart_beat
+from DogPVSimulation_6Comp_Python.calculate_flows import calculate_flows
+from DogPVSimulation_6Comp_Python.hemodynamics import analyze
+from DogPVSimulation_6Comp_Python.integrators import make_stepper
+from DogPVSimulation_6Comp_Python.rk4_kernel import RK4Kernel
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_outputs.json")
+CASES = {
+    "baseline": {},
+    "high_svr": {"SVR": 4.0},
+    "low_ees": {"LV_EES": 3.5},
+    "high_hr": {"HR": 140},
+    "large_bv": {"BV": 400},
+}
+# absolute tolerances; the steady state loop stops within 0.1 ml per beat of the periodic orbit, so
+# solvers that converge along different paths legitimately differ by a few tenths of a ml (and, through
+# the small arterial capacitance, a few tenths of a mmHg of MAP)
+TOLERANCES = {"MAP": 0.5, "SV": 0.25, "CO": 0.02, "EDP": 0.25, "Volumes": 1.0, "Pressures": 1.0}
+GOLDEN_METRICS = ["MAP", "SV", "CO", "EDP"]
+WAVEFORM_DECIMATION = 100
+STEP_REPEATS = 2000
+
+
+def time_case(parameters, integrator, steady_state):
+    """Timings, metrics and decimated waveforms of one parameter case"""
+    timings = {}
+
+    # single RK4 step
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(**parameters)
+    kernel = RK4Kernel(resistances, capacitances, ventricles)
+    pressures = kernel.circuit.pressures(Volumes[0, :], 0)
+    new_volumes, new_pressures = np.zeros((6,)), np.zeros((6,))
+    step_size = time_vector[1] - time_vector[0]
+    start = time.perf_counter()
+    for _ in range(STEP_REPEATS):
+        kernel.step(Volumes[0, :], pressures, step_size, 0.5, new_volumes, new_pressures)
+    timings["rk4_step"] = (time.perf_counter() - start) / STEP_REPEATS
+    timings["rk4_steps_per_s"] = 1 / timings["rk4_step"]
+
+    # one full beat, after a warm-up beat that also triggers any JIT compilation
+    stepper = make_stepper(integrator, resistances, capacitances, ventricles)
+    Pressures = np.zeros(np.shape(Volumes))
+    Pressures[0, :] = pressures
+    stepper.run_beat(Volumes, Pressures, time_vector, tes)
+    start = time.perf_counter()
+    stepper.run_beat(Volumes, Pressures, time_vector, tes)
+    timings["beat"] = time.perf_counter() - start
+
+    # convergence to steady state
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(**parameters)
+    start = time.perf_counter()
+    Volumes, Pressures, Valves, Flows = simulate_heart_beat(resistances, capacitances, ventricles, time_vector, tes,
+                                                            Volumes, integrator=integrator, steady_state=steady_state)
+    timings["steady_state"] = time.perf_counter() - start
+
+    # post-processing
+    start = time.perf_counter()
+    Valves, Flows = calculate_flows(Pressures, resistances)
+    metrics, _ = analyze(Volumes, Pressures, time_vector, Valves)
+    timings["postprocess"] = time.perf_counter() - start
+
+    timings["render"] = time_render(ventricles, Volumes, Pressures, Valves, Flows, time_vector)
+
+    outputs = {name: float(metrics[name]) for name in GOLDEN_METRICS}
+    outputs["Volumes"] = Volumes[::WAVEFORM_DECIMATION].tolist()
+    outputs["Pressures"] = Pressures[::WAVEFORM_DECIMATION].tolist()
+    return timings, outputs
+
+
+def time_render(ventricles, Volumes, Pressures, Valves, Flows, time_vector):
+    try:
+        from DogPVSimulation_6Comp_Python.plotting_outputs import FigureTemplate
+    except ImportError:
+        return None
+    template = FigureTemplate()
+    start = time.perf_counter()
+    template.update(ventricles, Volumes, Pressures, Valves, Flows, time_vector)
+    for figure in template.figures:
+        figure.savefig(io.BytesIO(), format="png")
+    return time.perf_counter() - start
+
+
+def compare(outputs, golden):
+    """Absolute error of every checked quantity and whether it is within tolerance"""
+    errors = {}
+    for name in GOLDEN_METRICS:
+        errors[name] = abs(outputs[name] - golden[name])
+    for name in ("Volumes", "Pressures"):
+        errors[name] = float(np.max(np.abs(np.array(outputs[name]) - np.array(golden[name]))))
+    passed = all(errors[name] <= TOLERANCES[name] for name in errors)
+    return errors, passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--integrator", default="rk4")
+    parser.add_argument("--steady-state", default="fixed_point")
+    parser.add_argument("--json", help="write results to this file instead of stdout")
+    parser.add_argument("--update-golden", action="store_true", help="store this run's outputs as the golden outputs")
+    args = parser.parse_args()
+
+    golden = {}
+    if os.path.exists(GOLDEN_PATH) and not args.update_golden:
+        with open(GOLDEN_PATH) as f:
+            golden = json.load(f)
+
+    results = {"integrator": args.integrator, "steady_state": args.steady_state, "tolerances": TOLERANCES,
+               "cases": {}}
+    new_golden = {}
+    for name, parameters in CASES.items():
+        timings, outputs = time_case(parameters, args.integrator, args.steady_state)
+        new_golden[name] = outputs
+        case = {"parameters": parameters, "timings": timings,
+                "metrics": {metric: outputs[metric] for metric in GOLDEN_METRICS}}
+        if name in golden:
+            case["errors"], case["passed"] = compare(outputs, golden[name])
+        else:
+            case["errors"], case["passed"] = None, args.update_golden
+        results["cases"][name] = case
+    results["passed"] = all(case["passed"] for case in results["cases"].values())
+
+    if args.update_golden:
+        with open(GOLDEN_PATH, "w") as f:
+            json.dump(new_golden, f)
+
+    text = json.dumps(results, indent=1)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    sys.exit(0 if results["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
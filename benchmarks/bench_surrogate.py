@@ -0,0 +1,55 @@
+"""
+bench_surrogate.py
+Trains the surrogate emulator on a Latin hypercube design, validates it against held-out full runs
+(a second design with another seed) and compares the query time with simulate_heart_beat.
+Training and validation runs go to a temporary directory, or are kept in --results (resumed if present).
+
+    python bench_surrogate.py [--points 150] [--holdout 40] [--results DIR] [--save surrogate.npz]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from DogPVSimulation_6Comp_Python.parameter_sweep import latin_hypercube_design, run_sweep, load_results, simulate_point
+from DogPVSimulation_6Comp_Python.surrogate import train_surrogate, validation_report
+
+BOUNDS = {"HR": (60, 140), "BV": (150, 400), "LV_EES": (3, 10), "SVR": (1.5, 4.0)}
+SIMULATE_OPTIONS = {"steady_state": "anderson"}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=150)
+    parser.add_argument("--holdout", type=int, default=40)
+    parser.add_argument("--results", default=None, help="directory keeping the runs (default: a temporary one)")
+    parser.add_argument("--save", default=None)
+    args = parser.parse_args()
+    if args.results is None:
+        with tempfile.TemporaryDirectory() as directory:
+            benchmark(args, directory)
+    else:
+        benchmark(args, args.results)
+
+
+def benchmark(args, results):
+    start = time.perf_counter()
+    surrogate = train_surrogate(BOUNDS, args.points, os.path.join(results, "training"), **SIMULATE_OPTIONS)
+    print("training (runs + fit): " + str(round(time.perf_counter() - start, 1)) + " s")
+    if args.save:
+        surrogate.save(args.save)
+
+    names, design = latin_hypercube_design(BOUNDS, args.holdout, seed=1)
+    holdout_dir = os.path.join(results, "holdout")
+    run_sweep(names, design, holdout_dir, **SIMULATE_OPTIONS)
+    report = validation_report(surrogate, load_results(holdout_dir))
+
+    start = time.perf_counter()
+    simulate_point(dict(zip(names, design[0])), SIMULATE_OPTIONS)
+    report["simulation_time"] = time.perf_counter() - start
+    report["speedup"] = report["simulation_time"] / report["query_time"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+calculate_flows.py
+Calculates valve states and flows between compartments from the pressures of a simulated cycle.
+Pressures may carry leading batch dimensions, (..., nRows, 6), with resistances (..., 7). With
+infarct (..., 4) Pressures hold the infarct scar as column 7 and Flows gain column 6, left ventricle
+to infarct scar
+
+Valve   Column  Between
+MV      0       pulmonary veins and left ventricle
+AV      1       left ventricle and systemic arteries
+TV      2       systemic veins and right ventricle
+PV      3       right ventricle and pulmonary arteries
+
+Flow    Column  From / to
+        0       pulmonary arteries to pulmonary veins
+        1       pulmonary veins to left ventricle
+        2       left ventricle to systemic arteries
+        3       systemic arteries to systemic veins
+        4       systemic veins to right ventricle
+        5       right ventricle to pulmonary arteries
+
+Valves only conduct forward flow, except the MV when resistances[6] (R_mv) gives it a finite
+backflow resistance.
+"""
+import numpy as np
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+
+def calculate_flows(Pressures, resistances, infarct=None):
+
+    # flows and valves of the canine_circuit connections, broadcast over time
+    if infarct is not None:
+        infarct = np.asarray(infarct, dtype=float)[..., None, :]
+    circuit = canine_circuit(np.asarray(resistances)[..., None, :], infarct=infarct)
+
+    # determine if valves are open or closed: MV, AV, TV, PV
+    Valves = circuit.valve_states(Pressures).astype(float)
+
+    # calculate flows between compartments
+    Flows = circuit.flows(Pressures)
+
+    return Valves, Flows
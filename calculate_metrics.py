@@ -0,0 +1,25 @@
+"""
+calculate_metrics.py
+Calculates summary hemodynamic metrics of a simulated cardiac cycle, see hemodynamics.py for the
+definitions
+
+Metric      Units       Definition
+SBP         mmHg        max systemic arterial pressure
+DBP         mmHg        min systemic arterial pressure
+MAP         mmHg        mean arterial pressure, 1/3 SBP + 2/3 DBP
+SV          ml          stroke volume, max - min LV volume
+CO          L/min       cardiac output
+max_dpdt    mmHg/s      max LV dP/dt
+min_dpdt    mmHg/s      min LV dP/dt
+EDP, EDV    mmHg, ml    end diastolic LV pressure and volume, at mitral valve closure
+ESP, ESV    mmHg, ml    end systolic LV pressure and volume, at aortic valve closure
+EF          -           ejection fraction
+SW          mmHg*ml     stroke work, LV PV loop area
+tau         s           isovolumic relaxation time constant
+"""
+from DogPVSimulation_6Comp_Python.hemodynamics import analyze, METRICS
+
+def calculate_metrics(Volumes, Pressures, Valves, time_vector):
+
+    metrics, _ = analyze(Volumes, Pressures, time_vector, Valves)
+    return {name: float(metrics[name]) for name in METRICS}
@@ -1,6 +1,8 @@
 """
 calculate_pressures.py
-Calculates pressures in each compartment throughout the cardiac cycle
+Calculates pressures in each compartment throughout the cardiac cycle, from the pressure laws of
+circuit.canine_circuit. The circuit of the most recent parameter sets is kept, so stepping loops such
+as rk4 compile it once rather than on every call
 
 Column  Compartment
 0       pulmonary veins
@@ -11,27 +13,32 @@ Column  Compartment
 5       pulmonary arteries
 6       optional, left ventricle infarct
 """
-import math
+import functools
+import numpy as np
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
 
-def calculate_pressures(Volumes, Pressures, capacitances, ventricles, epsilon):
 
-    # Calculate circulation pressures
-    Pressures[0] = Volumes[0] / capacitances[0] # P_Cvp
-    Pressures[2] = Volumes[2] / capacitances[1] # P_Cas
-    Pressures[3] = Volumes[3] / capacitances[2] # P_Cvs
-    Pressures[5] = Volumes[5] / capacitances[3] # P_Cap
+def parameter_key(values):
+    """Hashable (shape, bytes) of a parameter array, None stays None"""
+    if values is None:
+        return None
+    values = np.asarray(values, dtype=float)
+    return values.shape, values.tobytes()
 
-    LV_params = ventricles[0, :] # A, B, Ees, V0
-    RV_params = ventricles[1, :] # A, B, Ees*3/7, V0
 
-    # Calculate RV Pressure
-    RV_ESP = RV_params[2] * (Volumes[4] - RV_params[3])
-    RV_EDP = RV_params[1] * (math.exp(RV_params[0] * (Volumes[4] - RV_params[3])) - 1)
-    Pressures[4] = epsilon * (RV_ESP - RV_EDP) + RV_EDP
+@functools.lru_cache(maxsize=16)
+def pressure_circuit(capacitances, ventricles, infarct):
+    """canine_circuit of the parameter_key of each pressure parameter"""
+    def parameters(key):
+        return None if key is None else np.frombuffer(key[1]).reshape(key[0])
+    return canine_circuit(capacitances=parameters(capacitances), ventricles=parameters(ventricles),
+                          infarct=parameters(infarct))
 
-    # Calculate LV Pressure - Surviving myocardium
-    LV_ESP = LV_params[2] * (Volumes[1] - LV_params[3])
-    LV_EDP = LV_params[1] * (math.exp(LV_params[0] * (Volumes[1] - LV_params[3])) - 1)
-    Pressures[1] = epsilon * (LV_ESP - LV_EDP) + LV_EDP
+
+def calculate_pressures(Volumes, Pressures, capacitances, ventricles, epsilon, infarct=None):
+
+    # vessel, chamber and infarct scar pressures of the canine_circuit compartments
+    circuit = pressure_circuit(parameter_key(capacitances), parameter_key(ventricles), parameter_key(infarct))
+    Pressures[...] = circuit.pressures(Volumes, epsilon)
 
     return Pressures
@@ -0,0 +1,220 @@
+"""
+circuit.py
+Netlist description of the circulation. A Circuit lists compartments and the connections between
+them and compiles them once into an incidence matrix and per-column coefficient arrays, which
+RK4Kernel.from_circuit steps and Circuit.flows / Circuit.valve_states post-process. Parameters may
+be arrays with leading batch dimensions.
+
+Compartment     Pressure
+Vessel          P = V / C
+Chamber         P = e(t) * (ESP - EDP) + EDP, ESP = Ees * (V - V0), EDP = B * (exp(A * (V - V0)) - 1)
+Scar            P = EDP, passive (non-contracting) tissue
+
+Connection      Flow from source to target, dP = P_source - P_target
+Resistor        dP / R
+Valve           dP / R when dP > 0, else dP / backflow (backflow = inf: no regurgitation)
+
+canine_circuit builds the model of set_initial_conditions, optionally with the LV infarct scar as
+column 6. The scar shares the LV cavity through a small resistance, so it fills and empties with the
+LV without contributing active pressure
+
+Column  Compartment
+0       pulmonary veins
+1       left ventricle - surviving myocardium
+2       systemic arteries
+3       systemic veins
+4       right ventricle
+5       pulmonary arteries
+6       optional, left ventricle infarct scar
+
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions()
+    kernel = RK4Kernel.from_circuit(canine_circuit(resistances, capacitances, ventricles, infarct=[0.2, 0.35, 5, 0.002]))
+"""
+import numpy as np
+
+COMPARTMENTS = ["pulmonary veins", "left ventricle", "systemic arteries", "systemic veins", "right ventricle",
+                "pulmonary arteries", "left ventricle infarct"]
+
+
+class Vessel:
+    """Compliant vessel with capacitance (ml/mmHg)"""
+
+    def __init__(self, name, capacitance):
+        self.name = name
+        self.capacitance = capacitance
+
+
+class Chamber:
+    """Time varying elastance chamber, parameters as in a ventricles row (A, B, Ees, V0)"""
+
+    def __init__(self, name, A, B, Ees, V0):
+        self.name = name
+        self.A = A
+        self.B = B
+        self.Ees = Ees
+        self.V0 = V0
+
+
+class Scar:
+    """Passive exponential compartment, EDP = B * (exp(A * (V - V0)) - 1)"""
+
+    def __init__(self, name, A, B, V0):
+        self.name = name
+        self.A = A
+        self.B = B
+        self.V0 = V0
+
+
+class Resistor:
+    """Bidirectional flow between the named compartments (mmHg*s/ml)"""
+
+    def __init__(self, source, target, resistance):
+        self.source = source
+        self.target = target
+        self.resistance = resistance
+
+
+class Valve:
+    """Forward flow from source to target through resistance, backward flow through backflow"""
+
+    def __init__(self, source, target, resistance, backflow=np.inf):
+        self.source = source
+        self.target = target
+        self.resistance = resistance
+        self.backflow = backflow
+
+
+def stack(values):
+    """(..., n) array from n scalars or broadcastable arrays"""
+    arrays = [np.asarray(value, dtype=float) for value in values]
+    if all(array.ndim == 0 for array in arrays):
+        return np.array(arrays) # scalar parameters, the common unbatched case
+    return np.stack(np.broadcast_arrays(*arrays), axis=-1)
+
+
+class Circuit:
+    """
+    Compiled netlist. Every compartment pressure is P = EDP + e * (E * (V - V0) / C - EDP) with
+    e = active * epsilon + passive, and every connection flow is
+    max(dP, floor) / resistance + min(dP, 0) / backflow, floor = 0 for valves and -inf for resistors.
+    Attributes
+        compartment_names, connection_names
+        source, target  (nConnections,) column each connection leaves and enters
+        incidence       (nConnections, nCompartments), +1 where a connection enters a column, -1 where it leaves
+        pressure_drop   (nCompartments, nConnections), P @ pressure_drop = dP of every connection
+        E, C, A, B, V0  (..., nCompartments) pressure coefficients
+        active, passive (nCompartments,) activation weights
+        resistance, backflow    (..., nConnections)
+        floor, is_valve (nConnections,)
+        has_backflow    whether any valve conducts backward flow
+    """
+
+    def __init__(self, compartments, connections):
+        self.compartment_names = [compartment.name for compartment in compartments]
+        if len(set(self.compartment_names)) != len(compartments):
+            raise ValueError("Compartment names must be unique")
+        column = {name: j for j, name in enumerate(self.compartment_names)}
+        for connection in connections:
+            for name in (connection.source, connection.target):
+                if name not in column:
+                    raise ValueError("Unknown compartment in connection: " + str(name))
+        self.connection_names = [connection.source + " to " + connection.target for connection in connections]
+
+        # topology
+        self.source = np.array([column[connection.source] for connection in connections], dtype=np.int64)
+        self.target = np.array([column[connection.target] for connection in connections], dtype=np.int64)
+        self.incidence = np.zeros((len(connections), len(compartments)))
+        self.incidence[np.arange(len(connections)), self.source] = -1
+        self.incidence[np.arange(len(connections)), self.target] = 1
+        self.pressure_drop = -self.incidence.T
+
+        # pressure coefficients
+        coefficients = [] # (E, C, A, B, V0) of every compartment
+        self.active = np.zeros((len(compartments),))
+        self.passive = np.zeros((len(compartments),))
+        for j, compartment in enumerate(compartments):
+            if isinstance(compartment, Vessel):
+                coefficients.append((1, compartment.capacitance, 0, 0, 0))
+                self.passive[j] = 1
+            elif isinstance(compartment, Chamber):
+                coefficients.append((compartment.Ees, 1, compartment.A, compartment.B, compartment.V0))
+                self.active[j] = 1
+            elif isinstance(compartment, Scar):
+                coefficients.append((0, 1, compartment.A, compartment.B, compartment.V0))
+            else:
+                raise ValueError("Unknown compartment type: " + type(compartment).__name__)
+        self.E, self.C, self.A, self.B, self.V0 = [stack(values) for values in zip(*coefficients)]
+
+        # flow coefficients
+        self.is_valve = np.array([isinstance(connection, Valve) for connection in connections])
+        self.floor = np.where(self.is_valve, 0.0, -np.inf)
+        self.resistance = stack([connection.resistance for connection in connections])
+        self.backflow = stack([connection.backflow if isinstance(connection, Valve) else np.inf
+                               for connection in connections])
+        self.has_backflow = bool(np.any(np.isfinite(self.backflow)))
+
+    @property
+    def nCompartments(self):
+        return len(self.compartment_names)
+
+    @property
+    def nConnections(self):
+        return len(self.connection_names)
+
+    def pressures(self, volumes, epsilon):
+        """Pressures (..., nCompartments) for volumes (..., nCompartments) and activation epsilon"""
+        x = volumes - self.V0
+        edp = self.B * (np.exp(self.A * x) - 1)
+        e = self.active * epsilon + self.passive
+        return e * (self.E * x / self.C - edp) + edp
+
+    def flows(self, pressures):
+        """Flows (..., nConnections) through every connection for pressures (..., nCompartments)"""
+        dp = pressures @ self.pressure_drop
+        flows = np.maximum(dp, self.floor) / self.resistance
+        if self.has_backflow:
+            flows = flows + np.minimum(dp, 0) / self.backflow
+        return flows
+
+    def valve_endpoints(self):
+        """(upstream, downstream) columns of every valve, in connection order"""
+        return self.source[self.is_valve], self.target[self.is_valve]
+
+    def valve_states(self, pressures):
+        """(..., nValves) forward open (True) / closed state of every valve, in connection order"""
+        return (pressures @ self.pressure_drop)[..., self.is_valve] > 0
+
+
+def canine_circuit(resistances=None, capacitances=None, ventricles=None, infarct=None):
+    """
+    Circuit of the 6 compartment model from the set_initial_conditions arrays: resistances (..., 7),
+    capacitances (..., 4), ventricles (..., 2, 4). resistances[6] is the mitral backflow resistance
+    R_mv; 0 (as set_initial_conditions leaves it) or inf means no regurgitation. infarct (..., 4) adds
+    the LV infarct scar as column 6 with parameters A, B, V0 and the resistance connecting it to the LV.
+    Arrays left as None give NaN coefficients, e.g. resistances alone are enough for flows and valve states
+    """
+    resistances = np.full((7,), np.nan) if resistances is None else np.asarray(resistances, dtype=float)
+    capacitances = np.full((4,), np.nan) if capacitances is None else np.asarray(capacitances, dtype=float)
+    ventricles = np.full((2, 4), np.nan) if ventricles is None else np.asarray(ventricles, dtype=float)
+    PV, LV, SA, SV, RV, PA, LVI = COMPARTMENTS
+
+    compartments = [Vessel(PV, capacitances[..., 0]),
+                    Chamber(LV, *np.moveaxis(ventricles[..., 0, :], -1, 0)),
+                    Vessel(SA, capacitances[..., 1]),
+                    Vessel(SV, capacitances[..., 2]),
+                    Chamber(RV, *np.moveaxis(ventricles[..., 1, :], -1, 0)),
+                    Vessel(PA, capacitances[..., 3])]
+    mitral_backflow = np.where(resistances[..., 6] > 0, resistances[..., 6], np.inf)
+    connections = [Resistor(PA, PV, resistances[..., 5]), # Rap
+                   Valve(PV, LV, resistances[..., 0], backflow=mitral_backflow), # Rvp, mitral valve
+                   Valve(LV, SA, resistances[..., 1]), # Rcs, aortic valve
+                   Resistor(SA, SV, resistances[..., 2]), # Ras
+                   Valve(SV, RV, resistances[..., 3]), # Rvs, tricuspid valve
+                   Valve(RV, PA, resistances[..., 4])] # Rcp, pulmonary valve
+
+    if infarct is not None:
+        A, B, V0, resistance = np.moveaxis(np.asarray(infarct, dtype=float), -1, 0)
+        compartments.append(Scar(LVI, A, B, V0))
+        connections.append(Resistor(LV, LVI, resistance))
+
+    return Circuit(compartments, connections)
@@ -0,0 +1,200 @@
+"""
+cli.py
+Command line interface of the model (the circmodel console script, python -m DogPVSimulation_6Comp_Python
+and MAIN_CircModel.py). Runs set_initial_conditions -> simulate_heart_beat -> calculate_metrics for
+parameters given as flags and/or in JSON or TOML config files, so batch runs need no source edits.
+
+Every --config file is one run; flags override the values of every file (or, without files, make
+up the single run). Config files hold up to two tables:
+
+    [parameters]            # set_initial_conditions keywords, see PARAMETERS
+    HR = 90
+    SVR = 3.0
+
+    [options]               # see DEFAULT_OPTIONS
+    integrator = "rk45"
+    steady_state = "anderson"
+
+or the same as JSON, {"parameters": {"HR": 90}, "options": {"integrator": "rk45"}}.
+
+Only the pipeline is imported at start up: matplotlib when --plot is given, Numba when rk4_jit is
+selected. --metrics-only prints one JSON line per run and nothing else, for schedulers calling the
+model many times; --cache keeps converged steady states across those calls. --timings adds the import,
+simulation and total times of the process. The exit status is 1 when a run did not reach steady state.
+
+The default options (rk4 stepped to steady state by the fixed point loop) reproduce the original
+model and take about 4 s per run. Schedulers should pass --integrator rk45 --steady-state anderson
+(or set them in the configs), which brings a run to well under a second with metrics within the
+regression tolerances of benchmarks/bench_suite.py.
+
+    circmodel --HR 100 --plot
+    circmodel --config high_svr.toml low_ees.json --metrics-only --integrator rk45 --steady-state anderson
+"""
+import argparse
+import json
+import os
+import time
+
+START = time.perf_counter() # after the standard library imports above, before any of the package
+
+from DogPVSimulation_6Comp_Python.constants import PARAMETERS, DEFAULT_OPTIONS
+
+# set_initial_conditions keyword: help, for every name in constants.PARAMETERS
+PARAMETER_HELP = {"HR": "heart rate (beats/min)", "BV": "stressed blood volume (ml)",
+                  "LV_EES": "LV end systolic elastance (mmHg/ml)", "LV_A": "LV exponential constant in EDPVR (1/ml)",
+                  "RV_A": "RV exponential constant in EDPVR (1/ml)", "B": "LV linear constant in EDPVR (mmHg)",
+                  "V0": "unloaded LV volume (ml)", "SVR": "systemic vascular resistance (mmHg*s/ml)"}
+
+
+def load_config(path):
+    """{"parameters": {...}, "options": {...}} of a .json or .toml config file, ValueError if invalid"""
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError: # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError("TOML configs need Python 3.11 or the tomli package: " + path)
+        with open(path, "rb") as f:
+            config = tomllib.load(f)
+    elif path.endswith(".json"):
+        with open(path) as f:
+            config = json.load(f)
+    else:
+        raise ValueError("Config files must be .json or .toml: " + path)
+
+    if not isinstance(config, dict):
+        raise ValueError("Config must be a table / object: " + path)
+    unknown = [name for name in config if name not in ("parameters", "options")]
+    if unknown:
+        raise ValueError("Unknown config sections in " + path + ": " + str(unknown))
+    return {"parameters": dict(config.get("parameters", {})), "options": dict(config.get("options", {}))}
+
+
+def check_run(parameters, options, name):
+    """ValueError unless parameters and options name known settings with valid values"""
+    from DogPVSimulation_6Comp_Python.steady_state import STEADY_STATES
+    unknown = [key for key in parameters if key not in PARAMETERS] + [key for key in options if key not in DEFAULT_OPTIONS]
+    if unknown:
+        raise ValueError("Unknown settings in " + name + ": " + str(unknown))
+    for key, value in parameters.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("Parameter " + key + " in " + name + " must be a number: " + repr(value))
+    if options["steady_state"] not in STEADY_STATES:
+        raise ValueError("Unknown steady state method in " + name + ": " + str(options["steady_state"]))
+    if isinstance(options["nRows"], bool) or not isinstance(options["nRows"], int) or options["nRows"] < 2:
+        raise ValueError("nRows in " + name + " must be an integer of at least 2: " + repr(options["nRows"]))
+
+
+def runs_from_args(args):
+    """[(name, parameters, options)] of the config files, with the flags applied to each"""
+    flags = {name: getattr(args, name) for name in PARAMETERS if getattr(args, name) is not None}
+    flag_options = {name: getattr(args, name) for name in DEFAULT_OPTIONS if getattr(args, name) is not None}
+    configs = [(os.path.splitext(os.path.basename(path))[0], load_config(path)) for path in args.config]
+    if not configs:
+        configs = [("circmodel", {"parameters": {}, "options": {}})]
+
+    runs = []
+    for name, config in configs:
+        parameters = dict(config["parameters"], **flags)
+        options = dict(DEFAULT_OPTIONS, **config["options"], **flag_options)
+        check_run(parameters, options, name)
+        runs.append((name, parameters, options))
+    return runs
+
+
+def print_summary(name, metrics, converged, several):
+    if several:
+        print("== " + name + " ==")
+    print("Mean arterial pressure: " + str(round(metrics["MAP"],2)) + " mmHg")
+    print("Stroke volume: " + str(round(metrics["SV"],2)) + " ml")
+    print("Cardiac output: " + str(round(metrics["CO"],2)) + " L/min")
+    print("Max dP/dt: " + str(round(metrics["max_dpdt"],2)) + " mmHg/s")
+    print("End-diastolic pressure: " + str(round(metrics["EDP"],2)) + " mmHg")
+    if not converged:
+        print("Steady state not reached")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="circmodel", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", nargs="+", default=[], metavar="FILE", help="JSON or TOML config, one run per file")
+    for name in PARAMETERS:
+        parser.add_argument("--" + name, type=float, help=PARAMETER_HELP[name])
+    parser.add_argument("--integrator", help="rk4 (default), rk4_jit, rk45 or exponential")
+    parser.add_argument("--steady-state", dest="steady_state", help="fixed_point (default), newton or anderson")
+    parser.add_argument("--nRows", type=int, help="rows per beat (default 5000)")
+    parser.add_argument("--metrics-only", action="store_true",
+                        help="print one JSON line of metrics per run, no plots; pair with --integrator rk45 "
+                             "--steady-state anderson for repeated calls")
+    parser.add_argument("--plot", action="store_true", help="plot the PV loops, pressures, volumes and flows")
+    parser.add_argument("--output-dir", help="save the waveforms of each run to <run name>.npz in this directory")
+    parser.add_argument("--cache", metavar="FILE", help="steady state cache (.npz) shared across invocations")
+    parser.add_argument("--timings", action="store_true", help="report import, simulation and total times")
+    parser.add_argument("--version", action="store_true", help="print the package version and exit")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.version:
+        from DogPVSimulation_6Comp_Python import __version__
+        print(__version__)
+        return 0
+    if args.metrics_only and args.plot:
+        parser.error("--metrics-only does not plot")
+    try:
+        runs = runs_from_args(args)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    # the pipeline only, plotting_outputs (matplotlib) is imported below when plotting
+    import numpy as np
+    from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+    from DogPVSimulation_6Comp_Python.simulate_heart_beat import simulate_heart_beat
+    from DogPVSimulation_6Comp_Python.calculate_metrics import calculate_metrics
+    from DogPVSimulation_6Comp_Python.integrators import INTEGRATORS
+    from DogPVSimulation_6Comp_Python.steady_state_cache import SteadyStateCache
+    timings = {"import": time.perf_counter() - START}
+    for name, _, options in runs:
+        if options["integrator"] not in INTEGRATORS:
+            parser.error("Unknown integrator in " + name + ": " + str(options["integrator"]))
+    cache = SteadyStateCache(args.cache) if args.cache else None
+
+    all_converged = True
+    start = time.perf_counter()
+    for name, parameters, options in runs:
+        Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(
+            **parameters, nRows=options["nRows"])
+        Volumes, Pressures, Valves, Flows, convergence = simulate_heart_beat(
+            resistances, capacitances, ventricles, time_vector, tes, Volumes, integrator=options["integrator"],
+            steady_state=options["steady_state"], cache=cache, return_convergence=True)
+        metrics = {key: float(value) for key, value in calculate_metrics(Volumes, Pressures, Valves, time_vector).items()}
+        all_converged = all_converged and convergence.converged
+
+        if args.metrics_only:
+            print(json.dumps({"run": name, "parameters": parameters, "options": options, "metrics": metrics,
+                              "converged": bool(convergence.converged)}), flush=True)
+        else:
+            print_summary(name, metrics, convergence.converged, len(runs) > 1)
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            np.savez(os.path.join(args.output_dir, name + ".npz"), time=time_vector, Volumes=Volumes,
+                     Pressures=Pressures, Valves=Valves, Flows=Flows)
+        if args.plot:
+            from DogPVSimulation_6Comp_Python.plotting_outputs import plotting_outputs
+            plotting_outputs(ventricles, Volumes, Pressures, Valves, Flows, time_vector)
+    if cache is not None:
+        cache.close()
+    timings["simulate"] = time.perf_counter() - start
+    timings["total"] = time.perf_counter() - START
+
+    if args.timings:
+        report = {key: round(value, 4) for key, value in timings.items()}
+        if args.metrics_only:
+            print(json.dumps({"timings": report}))
+        else:
+            print("Timings (s): " + ", ".join(key + " " + str(value) for key, value in report.items()))
+    return 0 if all_converged else 1
@@ -0,0 +1,15 @@
+"""
+constants.py
+Parameter names and run options shared by cli, parameter_sweep, protocol and service. Only plain
+Python values are defined here, so importing it (e.g. for circmodel --version) loads no NumPy.
+
+Name                Contents
+PARAMETERS          set_initial_conditions keywords that runs, sweeps and requests may set
+PARAMETER_RANGES    {parameter: (low, high)} of physiologically meaningful values
+DEFAULT_OPTIONS     integrator, steady state method and rows per beat of a run
+"""
+
+PARAMETERS = ["HR", "BV", "LV_EES", "LV_A", "RV_A", "B", "V0", "SVR"]
+PARAMETER_RANGES = {"HR": (10, 400), "BV": (1, 5000), "LV_EES": (0.01, 100), "LV_A": (0, 1), "RV_A": (0, 1),
+                    "B": (0, 10), "V0": (0, 100), "SVR": (0.01, 100)}
+DEFAULT_OPTIONS = {"integrator": "rk4", "steady_state": "fixed_point", "nRows": 5000}
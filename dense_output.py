@@ -0,0 +1,143 @@
+"""
+dense_output.py
+Separates the solver grid from the stored trajectory. A beat is integrated at whatever resolution
+the solver needs (nSteps for the fixed step solvers, tolerances for rk45) and only the samples the
+analysis needs are kept: N evenly spaced samples per beat, the valve events, or both, stored as
+float32 or float64. Between solver points the beat is evaluated from its piecewise cubic Hermite
+dense output (rk45.AdaptiveBeat.interpolate), pressures, valve states and flows from the
+interpolated volumes.
+
+dense_beat returns the dense output of one beat for any integrator; the fixed step solvers fill a
+temporary solver grid, which is dropped once the beat is sampled. simulate_sampled finds the periodic
+steady state and returns the sampled steady state beat, with the hemodynamics.analyze metrics computed
+at solver resolution so they do not depend on the output grid.
+
+    beat = simulate_sampled(resistances, capacitances, ventricles, time_vector[-1], tes, Volumes[0, :],
+                            OutputGrid(samples=500, dtype="float32"), integrator="rk45", rtol=1e-6)
+    store.append(beat.Volumes, beat.Pressures, beat.Valves, beat.Flows, resistances, capacitances,
+                 ventricles, beat.time, tes) # WaveformStore.create(path, nRows=500, dtype="float32")
+"""
+import numpy as np
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+from DogPVSimulation_6Comp_Python.rk4_kernel import activation
+from DogPVSimulation_6Comp_Python.integrators import make_stepper
+from DogPVSimulation_6Comp_Python.rk45 import AdaptiveBeat, VALVE_NAMES
+from DogPVSimulation_6Comp_Python.steady_state import periodic_steady_state
+from DogPVSimulation_6Comp_Python.hemodynamics import analyze
+
+
+class OutputGrid:
+    """
+    Output sampling of a beat
+        samples     evenly spaced samples over the cycle, both ends included, or None
+        at_events   sample at the valve events and the ends of the cycle (with samples, in addition)
+        dtype       dtype of the stored waveforms, float32 or float64
+    """
+
+    def __init__(self, samples=500, at_events=False, dtype="float32"):
+        if samples is None and not at_events:
+            raise ValueError("An output grid needs samples or at_events")
+        if np.dtype(dtype) not in (np.float32, np.float64):
+            raise ValueError("Waveform dtype must be float32 or float64")
+        self.samples = samples
+        self.at_events = at_events
+        self.dtype = np.dtype(dtype)
+
+    def times(self, beat, cycle_length):
+        """Sample times (s) within the cycle for an AdaptiveBeat"""
+        times = [] if self.samples is None else [np.linspace(0, cycle_length, self.samples)]
+        if self.at_events:
+            times.append([0.0, cycle_length] + [event[0] for event in beat.events])
+        return np.unique(np.concatenate(times))
+
+
+class SampledBeat:
+    """
+    One beat on its output grid
+        time            sample times (s)
+        Volumes, Pressures, Flows   (nSamples, 6) in the output dtype
+        Valves          (nSamples, 4) bool, MV, AV, TV, PV open
+        events          list of (time, valve name, opens) from the solver
+        metrics         hemodynamics.analyze metrics at solver resolution
+        nSteps          solver steps of the beat
+    """
+
+    def __init__(self, time, Volumes, Pressures, Valves, Flows, events, metrics, nSteps):
+        self.time = time
+        self.Volumes = Volumes
+        self.Pressures = Pressures
+        self.Valves = Valves
+        self.Flows = Flows
+        self.events = events
+        self.metrics = metrics
+        self.nSteps = nSteps
+
+    @property
+    def nbytes(self):
+        """Memory held by the sampled waveforms"""
+        return sum(array.nbytes for array in (self.time, self.Volumes, self.Pressures, self.Valves, self.Flows))
+
+
+def dense_beat(stepper, circuit, initial_volumes, time_vector, tes):
+    """
+    AdaptiveBeat (dense output) of one cycle from initial_volumes. Solvers with solve_beat (rk45,
+    exponential) integrate to time_vector[-1] at their own steps; the fixed step solvers step across
+    time_vector, with the valve events located by linear interpolation of the pressure gaps
+    """
+    if hasattr(stepper, "solve_beat"):
+        return stepper.solve_beat(initial_volumes, time_vector[-1], tes)
+
+    Volumes = np.zeros((len(time_vector), 6))
+    Pressures = np.zeros((len(time_vector), 6))
+    Volumes[0, :] = initial_volumes
+    Pressures[0, :] = circuit.pressures(Volumes[0, :], activation(time_vector[0], tes))
+    stepper.run_beat(Volumes, Pressures, time_vector, tes)
+    dVdt = circuit.flows(Pressures) @ circuit.incidence
+
+    gaps = (Pressures @ circuit.pressure_drop)[:, circuit.is_valve]
+    rows, valves = np.nonzero(np.diff((gaps > 0).astype(np.int8), axis=0))
+    fractions = gaps[rows, valves] / (gaps[rows, valves] - gaps[rows + 1, valves])
+    times = time_vector[rows] + fractions * (time_vector[rows + 1] - time_vector[rows])
+    events = sorted((float(t), VALVE_NAMES[k], bool(gaps[row + 1, k] > 0)) for t, k, row in zip(times, valves, rows))
+    nSteps = len(time_vector) - 1
+    return AdaptiveBeat(time_vector.copy(), Volumes, Pressures, dVdt, events, nSteps, 0, 4 * nSteps)
+
+
+def sample_beat(beat, circuit, cycle_length, tes, output):
+    """SampledBeat of an AdaptiveBeat on the output grid (metrics left empty)"""
+    time = output.times(beat, cycle_length)
+    Volumes = beat.interpolate(time)
+    Pressures = circuit.pressures(Volumes, activation(time, tes)[:, None])
+    Valves = circuit.valve_states(Pressures)
+    Flows = circuit.flows(Pressures)
+    return SampledBeat(time.astype(output.dtype), Volumes.astype(output.dtype), Pressures.astype(output.dtype),
+                       Valves, Flows.astype(output.dtype), beat.events, {}, beat.nSteps)
+
+
+def simulate_sampled(resistances, capacitances, ventricles, cycle_length, tes, initial_volumes, output=None,
+                     integrator="rk45", nSteps=5000, steady_state="anderson", cutoff=0.1, **solver_options):
+    """
+    Steady state beat on the output grid (OutputGrid(), 500 float32 samples, by default). nSteps sets
+    the solver grid of the fixed step solvers (rk4, rk4_jit) and the grid the metrics are computed on;
+    solver_options go to the solver (rtol / atol for rk45, nSteps for exponential). steady_state is
+    "newton" or "anderson" (steady_state.periodic_steady_state to cutoff ml), or None to sample the
+    beat from initial_volumes as given. Returns a SampledBeat
+    """
+    output = output or OutputGrid()
+    solver_grid = np.linspace(0, cycle_length, nSteps + 1)
+    circuit = canine_circuit(resistances, capacitances, ventricles)
+    stepper = make_stepper(integrator, resistances, capacitances, ventricles, **solver_options)
+    volumes = np.array(initial_volumes, dtype=float)
+    if steady_state is not None:
+        volumes, _, _ = periodic_steady_state(resistances, capacitances, ventricles, solver_grid, tes, volumes,
+                                              method=steady_state, integrator=integrator, cutoff=cutoff,
+                                              solver_options=solver_options)
+
+    beat = dense_beat(stepper, circuit, volumes, solver_grid, tes)
+    sampled = sample_beat(beat, circuit, cycle_length, tes, output)
+
+    # metrics at solver resolution, independent of the output grid
+    Volumes = beat.interpolate(solver_grid)
+    metrics, _ = analyze(Volumes, circuit.pressures(Volumes, activation(solver_grid, tes)[:, None]), solver_grid)
+    sampled.metrics = {name: float(value) for name, value in metrics.items()}
+    return sampled
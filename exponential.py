@@ -0,0 +1,254 @@
+"""
+exponential.py
+Exponential integrator for one cardiac cycle. The vessels (pulmonary veins, systemic arteries,
+systemic veins, pulmonary arteries) are linear, P = V / C, so for a fixed valve configuration their
+volumes obey dV/dt = A V + B p(t), where p are the ventricle pressures. Over each step p(t) is taken
+linear between the ventricle pressures at the start and end of the step and the vessels are advanced
+exactly with the matrix exponential of an augmented system (Van Loan), which also gives the integral
+of the vessel volumes over the step. The ventricles, the only nonlinear compartments, take an
+implicit trapezoidal step driven by those exact vessel volumes, solved by Newton on their volumes.
+Both parts are unconditionally stable, so a beat needs a few hundred steps instead of the 5000 of
+the RK4 grid.
+
+The propagators depend only on the vascular parameters (resistances, vessel capacitances), the
+valve configuration and the step size. They are computed once and kept in a module level LRU cache
+shared by every solver, so they are reused across beats, steady state iterations and runs with the
+same vasculature (e.g. sweeps over the ventricle parameters). Valve switches are located within the
+step by linear interpolation of the pressure gap and the step is split there; split steps use
+uncached propagators. A switch within min_step of the end of a step is taken at the end of the step,
+and one within min_step of its start re-steps the whole step with the valve switched; a step with
+more than MAX_SPLITS switches raises RuntimeError.
+
+ExponentialSolver follows the RK45Solver contract (run_beat fills time_vector from cubic Hermite
+dense output and returns an rk45.AdaptiveBeat, end_of_beat) and is selected with
+integrator="exponential".
+"""
+import math
+from collections import OrderedDict
+import numpy as np
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+from DogPVSimulation_6Comp_Python.rk4_kernel import RK4Kernel, activation
+from DogPVSimulation_6Comp_Python.rk45 import AdaptiveBeat, VALVE_NAMES
+
+N_STEPS = 200 # steps per beat
+MAX_PROPAGATORS = 4096
+MAX_NEWTON = 20
+NEWTON_TOLERANCE = 1e-10 # ml
+MAX_SPLITS = 8 # valve switches located within one step
+
+_propagators = OrderedDict() # (vasculature, valve configuration, step) -> propagator matrices
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def expm(M):
+    """Matrix exponential by scaling and squaring with a [6/6] Pade approximant"""
+    norm = np.max(np.sum(np.abs(M), axis=0))
+    squarings = max(0, int(math.ceil(math.log2(norm / 0.5)))) if norm > 0.5 else 0
+    X = M / 2 ** squarings
+    m = 6
+    coefficients = [math.factorial(2 * m - k) * math.factorial(m)
+                    / (math.factorial(2 * m) * math.factorial(k) * math.factorial(m - k)) for k in range(m + 1)]
+    identity = np.eye(len(M))
+    power = identity
+    even = coefficients[0] * identity
+    odd = np.zeros(M.shape)
+    for k in range(1, m + 1):
+        power = power @ X
+        if k % 2 == 0:
+            even = even + coefficients[k] * power
+        else:
+            odd = odd + coefficients[k] * power
+    result = np.linalg.solve(even - odd, even + odd)
+    for _ in range(squarings):
+        result = result @ result
+    return result
+
+
+def propagator_cache_stats():
+    """Hits, misses and size of the shared propagator cache"""
+    return {"hits": _cache_stats["hits"], "misses": _cache_stats["misses"], "size": len(_propagators)}
+
+
+def clear_propagator_cache():
+    _propagators.clear()
+    _cache_stats["hits"] = 0
+    _cache_stats["misses"] = 0
+
+
+class ExponentialSolver:
+    """Exponential / implicit single cycle solver for one set of circulation parameters"""
+
+    def __init__(self, resistances, capacitances, ventricles, nSteps=N_STEPS):
+        self.resistances = resistances
+        self.capacitances = capacitances
+        self.ventricles = ventricles
+        self.nSteps = nSteps
+        self.circuit = c = canine_circuit(resistances, capacitances, ventricles)
+
+        # linear compartments P = E * V / C (vessels) and the nonlinear rest (ventricles)
+        is_linear = (c.passive == 1) & (c.A == 0) & (c.B == 0) & (c.V0 == 0)
+        self.linear = np.flatnonzero(is_linear)
+        self.nonlinear = np.flatnonzero(~is_linear)
+        self.elastance = (c.E / c.C)[self.linear]
+        self.E, self.C, self.A, self.B, self.V0 = [coefficient[self.nonlinear] for coefficient in (c.E, c.C, c.A, c.B, c.V0)]
+        self.active = c.active[self.nonlinear]
+        self.identity = np.eye(len(self.nonlinear))
+        self.passive = c.passive[self.nonlinear]
+
+        # valves conduct 1 / resistance open and 1 / backflow closed, resistors always 1 / resistance
+        self.open_conductance = 1 / c.resistance
+        self.closed_conductance = np.where(c.is_valve, 1 / c.backflow, 1 / c.resistance)
+        self.valves = np.flatnonzero(c.is_valve)
+        self.vasculature = np.concatenate((c.resistance, c.backflow, self.elastance, self.linear)).tobytes()
+        self.nEvaluations = 0
+
+    def gaps(self, pressures):
+        """Pressure drop across each valve, positive when it conducts forward"""
+        return (pressures @ self.circuit.pressure_drop)[self.valves]
+
+    def nonlinear_pressures(self, volumes, epsilon):
+        """Ventricle pressures and dP/dV for their volumes"""
+        x = volumes - self.V0
+        growth = np.exp(self.A * x)
+        edp = self.B * (growth - 1)
+        e = self.active * epsilon + self.passive
+        return e * (self.E * x / self.C - edp) + edp, e * self.E / self.C + (1 - e) * self.B * self.A * growth
+
+    def propagator(self, valve_open, step_size, cache=True):
+        """
+        (Phi, Gamma0, Gamma1, Psi, Lambda0, Lambda1) for one step with the given valves open:
+        V_vessels(h) = Phi V + Gamma0 p0 + Gamma1 p1 and the ventricle volume change over the step is
+        Psi V + Lambda0 p0 + Lambda1 p1, for p linear from p0 to p1 over the step
+        """
+        key = (self.vasculature, np.packbits(valve_open).tobytes(), step_size)
+        if cache and key in _propagators:
+            _propagators.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return _propagators[key]
+
+        c = self.circuit
+        conductance = self.open_conductance.copy()
+        conductance[self.valves[~valve_open]] = self.closed_conductance[self.valves[~valve_open]]
+        L = c.incidence.T @ (conductance[:, None] * c.incidence) # dV/dt = -L P
+        lin, non = self.linear, self.nonlinear
+        nv, nw = len(lin), len(non)
+
+        # augmented state [V vessels, p(s), (p1 - p0) / h, integral of V vessels]
+        M = np.zeros((2 * nv + 2 * nw, 2 * nv + 2 * nw))
+        M[:nv, :nv] = -L[np.ix_(lin, lin)] * self.elastance
+        M[:nv, nv:nv + nw] = -L[np.ix_(lin, non)]
+        M[nv:nv + nw, nv + nw:nv + 2 * nw] = np.eye(nw) / step_size
+        M[nv + 2 * nw:, :nv] = np.eye(nv)
+        E = expm(M * step_size)
+        E1, E2, E3 = E[:nv, :nv], E[:nv, nv:nv + nw], E[:nv, nv + nw:nv + 2 * nw]
+        F1, F2, F3 = E[nv + 2 * nw:, :nv], E[nv + 2 * nw:, nv:nv + nw], E[nv + 2 * nw:, nv + nw:nv + 2 * nw]
+
+        coupling = -L[np.ix_(non, lin)] * self.elastance
+        trapezoid = -L[np.ix_(non, non)] * step_size / 2
+        result = (E1, E2 - E3, E3, coupling @ F1, coupling @ (F2 - F3) + trapezoid, coupling @ F3 + trapezoid)
+        if cache:
+            _cache_stats["misses"] += 1
+            _propagators[key] = result
+            while len(_propagators) > MAX_PROPAGATORS:
+                _propagators.popitem(last=False)
+        return result
+
+    def step(self, volumes, pressures, current_time, step_size, tes, valve_open, cache=True):
+        """Advances (volumes, pressures) by step_size with a fixed valve configuration"""
+        Phi, Gamma0, Gamma1, Psi, Lambda0, Lambda1 = self.propagator(valve_open, step_size, cache)
+        lin, non = self.linear, self.nonlinear
+        epsilon = activation(current_time + step_size, tes)
+        p0 = pressures[non]
+        explicit = volumes[non] + Psi @ volumes[lin] + Lambda0 @ p0
+
+        # Newton on the ventricle volumes, V1 = explicit + Lambda1 p(V1), from the p1 = p0 predictor
+        V1 = explicit + Lambda1 @ p0
+        for _ in range(MAX_NEWTON):
+            p1, dPdV = self.nonlinear_pressures(V1, epsilon)
+            self.nEvaluations = self.nEvaluations + 1
+            residual = V1 - explicit - Lambda1 @ p1
+            if np.max(np.abs(residual)) < NEWTON_TOLERANCE:
+                break
+            V1 = V1 - np.linalg.solve(self.identity - Lambda1 * dPdV, residual)
+
+        new_volumes = np.zeros(volumes.shape)
+        new_pressures = np.zeros(volumes.shape)
+        new_volumes[non] = V1
+        new_volumes[lin] = Phi @ volumes[lin] + Gamma0 @ p0 + Gamma1 @ p1
+        new_pressures[non] = p1
+        new_pressures[lin] = self.elastance * new_volumes[lin]
+        return new_volumes, new_pressures
+
+    def solve_beat(self, initial_volumes, cycle_length, tes):
+        """Integrates one cardiac cycle from initial_volumes at t = 0 in nSteps steps, splitting at valve switches"""
+        self.nEvaluations = 0
+        step_size = cycle_length / self.nSteps
+        min_step = 1e-9 * cycle_length
+        V = np.array(initial_volumes, dtype=float)
+        P = self.circuit.pressures(V, activation(0.0, tes))
+        valve_open = self.gaps(P) > 0
+
+        times, Volumes, Pressures = [0.0], [V], [P]
+        events = []
+        nSplits = 0
+        for n in range(self.nSteps):
+            t = n * step_size
+            end = cycle_length if n == self.nSteps - 1 else (n + 1) * step_size
+            for _ in range(MAX_SPLITS + 1):
+                remaining = step_size if t == n * step_size else end - t # full steps share one cached propagator
+                new_V, new_P = self.step(V, P, t, remaining, tes, valve_open, cache=t == n * step_size)
+                old_gaps, new_gaps = self.gaps(P), self.gaps(new_P)
+                switched = np.flatnonzero((new_gaps > 0) != valve_open)
+                if switched.size == 0:
+                    break
+
+                # first switch, estimated by linear interpolation of its pressure gap
+                fractions = np.clip(old_gaps[switched] / (old_gaps[switched] - new_gaps[switched]), 0, 1)
+                first = switched[np.argmin(fractions)]
+                split = np.min(fractions) * remaining
+                if split >= remaining - min_step:
+                    # every switch is at the end of the step: keep the step, the valves switch for the next one
+                    for valve in switched:
+                        valve_open[valve] = not valve_open[valve]
+                        events.append((end, VALVE_NAMES[valve], bool(valve_open[valve])))
+                    break
+                if split > min_step:
+                    V, P = self.step(V, P, t, split, tes, valve_open, cache=False)
+                    t = t + split
+                    nSplits = nSplits + 1
+                    times.append(t)
+                    Volumes.append(V)
+                    Pressures.append(P)
+                # the valve switches at t, the rest of the step is taken again with the new configuration
+                valve_open[first] = not valve_open[first]
+                events.append((t, VALVE_NAMES[first], bool(valve_open[first])))
+            else:
+                raise RuntimeError("More than " + str(MAX_SPLITS) + " valve switches in exponential step " + str(n)
+                                   + " at t = " + str(t) + " s")
+            V, P = new_V, new_P
+            times.append(end)
+            Volumes.append(V)
+            Pressures.append(P)
+
+        Pressures = np.array(Pressures)
+        dVdt = self.circuit.flows(Pressures) @ self.circuit.incidence
+        return AdaptiveBeat(np.array(times), np.array(Volumes), Pressures, dVdt, events, self.nSteps + nSplits,
+                            0, self.nEvaluations)
+
+    def run_beat(self, Volumes, Pressures, time_vector, tes):
+        """
+        Same contract as RK45Solver.run_beat: fills every row of Volumes and Pressures (nRows, 6) on
+        time_vector from the dense output of the beat started at row 0. Returns the AdaptiveBeat
+        """
+        beat = self.solve_beat(Volumes[0, :], time_vector[-1], tes)
+        Volumes[:, :] = beat.interpolate(time_vector)
+        epsilon = activation(np.asarray(time_vector, dtype=float), tes)[:, None]
+        grid_kernel = RK4Kernel(self.resistances, self.capacitances, self.ventricles, batch_shape=(len(time_vector),))
+        grid_kernel.pressures(Volumes, epsilon, Pressures)
+        return beat
+
+    def end_of_beat(self, initial_volumes, time_vector, tes):
+        """Volumes at the end of the cycle for every row of initial_volumes (..., 6), one solve per row"""
+        initial_volumes = np.asarray(initial_volumes, dtype=float)
+        ends = [self.solve_beat(V, time_vector[-1], tes).Volumes[-1] for V in initial_volumes.reshape(-1, 6)]
+        return np.reshape(ends, initial_volumes.shape)
@@ -0,0 +1,182 @@
+"""
+fitting.py
+Least squares fitting of model parameters to measured hemodynamics with Levenberg-Marquardt. With
+gradient="sensitivity" every model evaluation is one sensitivity.simulate_with_sensitivities run,
+which returns the outputs and their Jacobian together; gradient="finite_difference" is the baseline
+of one extra steady state solve per parameter for every Jacobian.
+
+Target          Model output
+SBP, DBP, MAP   systemic arterial pressures (mmHg)
+SV              stroke volume (ml)
+EDP, EDV        LV pressure and volume at mitral valve closure (mmHg, ml)
+ESP, ESV        LV pressure and volume at aortic valve closure (mmHg, ml)
+LV_volume       LV volume at len(target) evenly spaced times over the cycle (ml), e.g. a catheter PV loop
+LV_pressure     LV pressure at len(target) evenly spaced times over the cycle (mmHg)
+
+Parameters are named as in sensitivity.PARAMETERS and fitted in log space (they stay positive),
+except the unloaded volumes V0 which are fitted directly.
+"""
+import time
+import numpy as np
+from DogPVSimulation_6Comp_Python.sensitivity import simulate_with_sensitivities, get_parameters, set_parameters
+from DogPVSimulation_6Comp_Python.hemodynamics import analyze
+
+SCALAR_OUTPUTS = ["SBP", "DBP", "MAP", "SV", "EDP", "EDV", "ESP", "ESV"]
+WAVEFORM_OUTPUTS = ["LV_volume", "LV_pressure"]
+FD_STEP = 1e-4 # finite difference step in the fitted (log) parameters
+FD_CUTOFF = 1e-9 # steady state cutoff (ml) of the solves differenced with gradient="finite_difference", so the
+                 # solver error (about FD_CUTOFF / FD_STEP) stays well below the truncation error of the step
+
+
+def model_outputs(Volumes, Pressures, dVolumes, dPressures, time_vector, targets):
+    """
+    Values (nOutputs,) and Jacobian (nOutputs, nParameters) of the outputs named in targets, in
+    targets order (waveform targets contribute one output per sample)
+    """
+    metrics, events = analyze(Volumes, Pressures, time_vector)
+    sbp_row, dbp_row = np.argmax(Pressures[:, 2]), np.argmin(Pressures[:, 2])
+    max_row, min_row = np.argmax(Volumes[:, 1]), np.argmin(Volumes[:, 1])
+    ed_row, es_row = events["MV_closes"], events["AV_closes"]
+
+    values, jacobian = [], []
+    for name, target in targets.items():
+        if name in WAVEFORM_OUTPUTS:
+            rows = np.round(np.linspace(0, len(time_vector) - 1, len(target))).astype(int)
+            waveform, dWaveform = (Volumes, dVolumes) if name == "LV_volume" else (Pressures, dPressures)
+            values.extend(waveform[rows, 1])
+            jacobian.extend(dWaveform[rows, 1])
+            continue
+
+        if name == "SBP":
+            value, derivative = Pressures[sbp_row, 2], dPressures[sbp_row, 2]
+        elif name == "DBP":
+            value, derivative = Pressures[dbp_row, 2], dPressures[dbp_row, 2]
+        elif name == "MAP":
+            value = metrics["MAP"]
+            derivative = (1/3) * dPressures[sbp_row, 2] + (2/3) * dPressures[dbp_row, 2]
+        elif name == "SV":
+            value, derivative = metrics["SV"], dVolumes[max_row, 1] - dVolumes[min_row, 1]
+        elif name in ("EDP", "EDV", "ESP", "ESV"):
+            row = ed_row if name[1] == "D" else es_row
+            if row < 0:
+                raise ValueError("No valve event for " + name + " in the simulated beat")
+            waveform, dWaveform = (Pressures, dPressures) if name[2] == "P" else (Volumes, dVolumes)
+            value, derivative = waveform[row, 1], dWaveform[row, 1]
+        else:
+            raise ValueError("Unknown fitting target: " + str(name))
+        values.append(value)
+        jacobian.append(derivative)
+    return np.array(values, dtype=float), np.array(jacobian, dtype=float)
+
+
+class FitResult:
+    """
+    Outcome of fit_parameters
+        parameters      {name: fitted value}
+        resistances, capacitances, ventricles   model arrays with the fitted values
+        cost            final sum of squared weighted residuals / 2
+        residuals       final weighted residuals
+        converged       relative cost reduction or parameter step fell below tolerance
+        reason          "step" or "cost" (converged), "stalled" (no step reduced the cost even with
+                        damping above 1e10) or "max_iterations"
+        nIterations     Levenberg-Marquardt iterations
+        nSolves         steady state solves (model evaluations, finite difference ones included)
+        nJacobians      Jacobians used
+        nBeats          cycles integrated
+        fd_solves       solves the same iterations would need with finite difference Jacobians
+        wall_time       s
+    """
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def fit_parameters(targets, names, resistances, capacitances, ventricles, time_vector, tes, initial_volumes,
+                   sigma=None, gradient="sensitivity", max_iterations=50, tolerance=1e-8):
+    """
+    Fits the named parameters, starting from their values in the given arrays, to targets
+    {output name: measured value or samples}. sigma {output name: scale} weights the residuals
+    (model - measured) / sigma, 1 by default. Returns a FitResult
+    """
+    if gradient not in ("sensitivity", "finite_difference"):
+        raise ValueError("Unknown gradient method: " + str(gradient))
+    start = time.perf_counter()
+    sigma = sigma or {}
+    measured = np.concatenate([np.atleast_1d(np.asarray(value, dtype=float)) for value in targets.values()])
+    scale = np.concatenate([np.full(np.size(value), float(sigma.get(name, 1.0))) for name, value in targets.items()])
+    is_log = np.array([not name.endswith("_V0") for name in names])
+    counts = {"solves": 0, "beats": 0, "jacobians": 0}
+    state = {"volumes": np.asarray(initial_volumes, dtype=float)}
+
+    def parameters(x):
+        return np.where(is_log, np.exp(x), x)
+
+    def solve(x, with_jacobian):
+        """Weighted residuals and, with sensitivities, their Jacobian in x (else None)"""
+        arrays = set_parameters(resistances, capacitances, ventricles, names, parameters(x))
+        Volumes, Pressures, dVolumes, dPressures, nBeats = simulate_with_sensitivities(
+            *arrays, time_vector, tes, state["volumes"], names if with_jacobian else [], **solve_options)
+        counts["solves"] += 1
+        counts["beats"] += nBeats
+        state["volumes"] = Volumes[0].copy() # warm start the next solve
+        values, jacobian = model_outputs(Volumes, Pressures, dVolumes, dPressures, time_vector, targets)
+        residuals = (values - measured) / scale
+        if not with_jacobian:
+            return residuals, None
+        counts["jacobians"] += 1
+        return residuals, jacobian / scale[:, None] * np.where(is_log, parameters(x), 1)
+
+    def finite_difference(x, residuals):
+        """Forward difference Jacobian in x, one solve per parameter"""
+        counts["jacobians"] += 1
+        jacobian = np.zeros((len(residuals), len(names)))
+        for column in range(len(names)):
+            shifted = x.copy()
+            shifted[column] += FD_STEP
+            jacobian[:, column] = (solve(shifted, False)[0] - residuals) / FD_STEP
+        return jacobian
+
+    use_sensitivities = gradient == "sensitivity"
+    solve_options = {} if use_sensitivities else {"cutoff": FD_CUTOFF}
+    x = np.where(is_log, np.log(get_parameters(resistances, capacitances, ventricles, names)),
+                 get_parameters(resistances, capacitances, ventricles, names))
+    residuals, jacobian = solve(x, use_sensitivities)
+    if not use_sensitivities:
+        jacobian = finite_difference(x, residuals)
+    cost = residuals @ residuals / 2
+    damping = 1e-3
+    converged = False
+    reason = "max_iterations"
+    nIterations = 0
+    nEvaluations = 1
+    for nIterations in range(1, max_iterations + 1):
+        normal = jacobian.T @ jacobian
+        step = np.linalg.solve(normal + damping * np.diag(np.diag(normal) + 1e-12), -jacobian.T @ residuals)
+        if np.max(abs(step)) < tolerance:
+            converged, reason = True, "step" # steps no longer move the (log) parameters
+            break
+        trial_residuals, trial_jacobian = solve(x + step, use_sensitivities)
+        nEvaluations = nEvaluations + 1
+        trial_cost = trial_residuals @ trial_residuals / 2
+        if trial_cost < cost:
+            reduction = (cost - trial_cost) / cost
+            x, residuals, cost = x + step, trial_residuals, trial_cost
+            jacobian = trial_jacobian if use_sensitivities else finite_difference(x, residuals)
+            damping = damping / 10
+            if reduction < tolerance or cost < 1e-20:
+                converged, reason = True, "cost"
+                break
+        else:
+            damping = damping * 10
+            if damping > 1e10:
+                reason = "stalled" # no step reduces the cost, e.g. a Jacobian too noisy to descend along
+                break
+
+    fitted = parameters(x)
+    fitted_arrays = set_parameters(resistances, capacitances, ventricles, names, fitted)
+    return FitResult(parameters=dict(zip(names, fitted)), resistances=fitted_arrays[0],
+                     capacitances=fitted_arrays[1], ventricles=fitted_arrays[2], cost=cost, residuals=residuals,
+                     converged=converged, reason=reason, nIterations=nIterations, nSolves=counts["solves"],
+                     nJacobians=counts["jacobians"], nBeats=counts["beats"],
+                     fd_solves=nEvaluations + counts["jacobians"] * len(names),
+                     wall_time=time.perf_counter() - start)
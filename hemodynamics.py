@@ -0,0 +1,136 @@
+"""
+hemodynamics.py
+Valve events and hemodynamic indices of simulated beats in one vectorized pass. Every input may carry
+leading batch dimensions: Volumes and Pressures (..., nRows, 6), time_vector (nRows,) or (..., nRows),
+and every index is returned as an array of the batch shape.
+
+Index       Units       Definition
+SBP         mmHg        max systemic arterial pressure
+DBP         mmHg        min systemic arterial pressure
+MAP         mmHg        mean arterial pressure, 1/3 SBP + 2/3 DBP
+SV          ml          stroke volume, max - min LV volume
+CO          L/min       cardiac output
+max_dpdt    mmHg/s      max LV dP/dt
+min_dpdt    mmHg/s      min LV dP/dt (-dP/dt max)
+EDP         mmHg        LV pressure at mitral valve closure (end diastole)
+EDV         ml          LV volume at mitral valve closure
+ESP         mmHg        LV pressure at aortic valve closure (end systole)
+ESV         ml          LV volume at aortic valve closure
+EF          -           ejection fraction, (EDV - ESV) / EDV
+SW          mmHg*ml     stroke work, area enclosed by the LV PV loop
+tau         s           time constant of isovolumic relaxation, ln P = a - t / tau fitted from
+                        aortic valve closure to mitral valve opening
+
+Valve event rows follow the np.diff(Valves) convention of plotting_outputs: row r means the valve
+changes state between rows r and r + 1. Missing events are -1 and the indices that depend on them NaN.
+"""
+import numpy as np
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+
+METRICS = ["SBP", "DBP", "MAP", "SV", "CO", "max_dpdt", "min_dpdt", "EDP", "EDV", "ESP", "ESV", "EF", "SW", "tau"]
+VALVE_NAMES = ["MV", "AV", "TV", "PV"]
+VALVE_UPSTREAM, VALVE_DOWNSTREAM = canine_circuit().valve_endpoints() # MV, AV, TV, PV columns
+MV, AV = 0, 1
+
+
+def valve_states(Pressures):
+    """(..., nRows, 4) open (True) / closed state of the MV, AV, TV and PV"""
+    return Pressures[..., VALVE_UPSTREAM] > Pressures[..., VALVE_DOWNSTREAM]
+
+
+def first_rows(mask):
+    """First row along axis -2 where mask is set, per column; -1 where it never is"""
+    return np.where(np.any(mask, axis=-2), np.argmax(mask, axis=-2), -1)
+
+
+def at_rows(values, rows):
+    """values (..., nRows) at rows (...), NaN where rows is -1"""
+    taken = np.take_along_axis(values, np.maximum(rows, 0)[..., None], axis=-1)[..., 0]
+    return np.where(rows >= 0, taken, np.nan)
+
+
+def valve_events(Valves):
+    """{valve name: [(row, opens), ...]} of every state change in a single (nRows, 4) beat"""
+    valve_change = np.diff(np.asarray(Valves, dtype=np.int8), axis=0)
+    return {name: [(int(row), bool(valve_change[row, column] > 0)) for row in np.nonzero(valve_change[:, column])[0]]
+            for column, name in enumerate(VALVE_NAMES)}
+
+
+def analyze(Volumes, Pressures, time_vector, Valves=None):
+    """
+    Returns (metrics, events): metrics maps each name in METRICS to an array of the batch shape,
+    events maps "<valve>_opens" / "<valve>_closes" to the first event row of each beat.
+    Valves are derived from Pressures when not given
+    """
+    V_lv = Volumes[..., 1]
+    P_lv = Pressures[..., 1]
+    P_sa = Pressures[..., 2]
+    time_vector = np.broadcast_to(time_vector, np.shape(V_lv))
+
+    # valve events
+    if Valves is None:
+        Valves = valve_states(Pressures)
+    valve_change = np.diff(np.asarray(Valves, dtype=np.int8), axis=-2)
+    opens = first_rows(valve_change == 1)
+    closes = first_rows(valve_change == -1)
+    events = {}
+    for column, name in enumerate(VALVE_NAMES):
+        events[name + "_opens"] = opens[..., column]
+        events[name + "_closes"] = closes[..., column]
+
+    # pressures and flows
+    metrics = {}
+    metrics["SBP"] = np.max(P_sa, axis=-1)
+    metrics["DBP"] = np.min(P_sa, axis=-1)
+    metrics["MAP"] = (1/3) * metrics["SBP"] + (2/3) * metrics["DBP"]
+    metrics["SV"] = np.max(V_lv, axis=-1) - np.min(V_lv, axis=-1)
+    metrics["CO"] = metrics["SV"] * (1 / time_vector[..., -1] * 60) * (1/1000)
+    dpdt = np.diff(P_lv, axis=-1) / np.diff(time_vector, axis=-1)
+    metrics["max_dpdt"] = np.max(dpdt, axis=-1)
+    metrics["min_dpdt"] = np.min(dpdt, axis=-1)
+
+    # end diastolic and end systolic points
+    metrics["EDP"] = at_rows(P_lv, closes[..., MV])
+    metrics["EDV"] = at_rows(V_lv, closes[..., MV])
+    metrics["ESP"] = at_rows(P_lv, closes[..., AV])
+    metrics["ESV"] = at_rows(V_lv, closes[..., AV])
+    metrics["EF"] = (metrics["EDV"] - metrics["ESV"]) / metrics["EDV"]
+
+    # stroke work, -closed integral of P dV around the loop (trapezoids, last row back to the first)
+    dV = np.roll(V_lv, -1, axis=-1) - V_lv
+    P_mean = (np.roll(P_lv, -1, axis=-1) + P_lv) / 2
+    metrics["SW"] = -np.sum(P_mean * dV, axis=-1)
+
+    # isovolumic relaxation, least squares slope of ln P over rows between AV closure and MV opening
+    rows = np.arange(np.shape(P_lv)[-1])
+    av_closes = closes[..., AV][..., None]
+    mv_opens = opens[..., MV][..., None]
+    window = (rows > av_closes) & (rows <= mv_opens) & (av_closes >= 0) & (P_lv > 0)
+    n = np.sum(window, axis=-1)
+    t = np.where(window, time_vector, 0)
+    lnP = np.where(window, np.log(np.where(window, P_lv, 1)), 0)
+    St, Sl = np.sum(t, axis=-1), np.sum(lnP, axis=-1)
+    Stt, Stl = np.sum(t * t, axis=-1), np.sum(t * lnP, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * Stl - St * Sl) / (n * Stt - St * St)
+        metrics["tau"] = np.where(n >= 2, -1 / slope, np.nan)
+
+    return metrics, events
+
+
+def fit_espvr(ESV, ESP):
+    """End systolic pressure-volume relationship ESP = Ees * (ESV - V0) over beats (last axis); returns Ees, V0"""
+    ESV, ESP = np.asarray(ESV, dtype=float), np.asarray(ESP, dtype=float)
+    V_mean, P_mean = np.mean(ESV, axis=-1), np.mean(ESP, axis=-1)
+    Ees = (np.sum((ESV - V_mean[..., None]) * (ESP - P_mean[..., None]), axis=-1)
+           / np.sum((ESV - V_mean[..., None]) ** 2, axis=-1))
+    return Ees, V_mean - P_mean / Ees
+
+
+def fit_edpvr(EDV, EDP):
+    """End diastolic pressure-volume relationship EDP = alpha * exp(beta * EDV) over beats (last axis); returns alpha, beta"""
+    EDV, lnP = np.asarray(EDV, dtype=float), np.log(np.asarray(EDP, dtype=float))
+    V_mean, l_mean = np.mean(EDV, axis=-1), np.mean(lnP, axis=-1)
+    beta = (np.sum((EDV - V_mean[..., None]) * (lnP - l_mean[..., None]), axis=-1)
+            / np.sum((EDV - V_mean[..., None]) ** 2, axis=-1))
+    return np.exp(l_mean - beta * V_mean), beta
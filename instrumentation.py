@@ -0,0 +1,167 @@
+"""
+instrumentation.py
+Timers, counters and progress events for simulate_heart_beat and the steady state solvers, in place
+of printed progress. Records go to a sink; the default NullSink discards them and an Instrumentation
+without a real sink skips all timing, so instrumentation costs nothing when it is not wanted.
+
+Sink            Output
+NullSink        nothing (default)
+LoggingSink     one log line per record through the logging module
+JsonLinesSink   one JSON object per record, appended to a file and flushed as written
+
+Phase               Timed section of simulate_heart_beat
+shooting            periodic_steady_state (steady_state="newton" / "anderson")
+integration         the cycle solver's run_beat and the pressures at the start of each beat
+steady_state_check  per compartment error of each beat against the cutoff
+postprocess         calculate_flows
+
+Pressures are evaluated inside every solver step, so their cost is part of integration and has no
+phase of its own.
+
+Counter     Meaning
+beats       cycles integrated (shooting beats included)
+rk_steps    solver steps taken (accepted steps for rk45)
+"""
+import json
+import logging
+import time
+import numpy as np
+
+
+class NullSink:
+    """Discards every record"""
+
+    def write(self, record):
+        pass
+
+
+class LoggingSink:
+    """Writes every record as one line to logger (the package logger by default) at level"""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger("DogPVSimulation_6Comp_Python")
+        self.level = level
+
+    def write(self, record):
+        fields = " ".join(key + "=" + str(value) for key, value in record.items() if key != "event")
+        self.logger.log(self.level, record["event"] + " " + fields)
+
+
+class JsonLinesSink:
+    """Appends every record to a JSON lines file, one line per record, flushed as written"""
+
+    def __init__(self, path):
+        self.file = open(path, "a")
+
+    def write(self, record):
+        self.file.write(json.dumps(record, default=to_json) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def to_json(value):
+    """json.dumps fallback for numpy arrays and scalars"""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError("Not JSON serializable: " + type(value).__name__)
+
+
+class _Timer:
+    def __init__(self, instrumentation, phase):
+        self.instrumentation = instrumentation
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        timings = self.instrumentation.timings
+        timings[self.phase] = timings.get(self.phase, 0.0) + time.perf_counter() - self.start
+
+
+class _NullTimer:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Instrumentation:
+    """
+    Accumulates phase timings (s) and counters over every run it is passed to, and forwards events to
+    sink. Disabled (no timing, counting or events) when sink is None or a NullSink
+    """
+
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else NullSink()
+        self.enabled = not isinstance(self.sink, NullSink)
+        self.timings = {}
+        self.counters = {}
+
+    def timer(self, phase):
+        """Context manager adding the time spent inside it to phase"""
+        return _Timer(self, phase) if self.enabled else _NULL_TIMER
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def event(self, name, **fields):
+        if self.enabled:
+            fields["event"] = name
+            self.sink.write(fields)
+
+    def snapshot(self):
+        return dict(self.timings), dict(self.counters)
+
+    def since(self, snapshot):
+        """Timings and counters accumulated since snapshot()"""
+        timings, counters = snapshot
+        return ({phase: total - timings.get(phase, 0.0) for phase, total in self.timings.items()},
+                {name: total - counters.get(name, 0) for name, total in self.counters.items()})
+
+
+DISABLED = Instrumentation()
+
+
+class ConvergenceResult:
+    """
+    How simulate_heart_beat, or one member of simulate_ensemble, reached (or failed to reach) steady state
+        converged       every compartment changed by no more than cutoff over the final beat
+        nBeats          beats of the fixed point loop
+        nShootingBeats  beats integrated by periodic_steady_state before the loop (0 for fixed_point)
+        error_trace     (nBeats, 6) absolute change of each compartment volume over each loop beat (ml)
+        cutoff          steady state cutoff (ml)
+        nSteps          solver steps over all beats
+        timings         {phase: s} of this run, empty when instrumentation is disabled
+    """
+
+    def __init__(self, converged, nBeats, nShootingBeats, error_trace, cutoff, nSteps, timings):
+        self.converged = converged
+        self.nBeats = nBeats
+        self.nShootingBeats = nShootingBeats
+        self.error_trace = error_trace
+        self.cutoff = cutoff
+        self.nSteps = nSteps
+        self.timings = timings
+
+    @property
+    def final_error(self):
+        return self.error_trace[-1]
+
+    def to_dict(self):
+        return {"converged": self.converged, "nBeats": self.nBeats, "nShootingBeats": self.nShootingBeats,
+                "error_trace": self.error_trace.tolist(), "cutoff": self.cutoff, "nSteps": self.nSteps,
+                "timings": self.timings}
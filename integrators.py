@@ -0,0 +1,52 @@
+"""
+integrators.py
+Selects the cycle solver used by simulate_heart_beat and the steady state solvers
+
+Name        Solver
+rk4         RK4Kernel, vectorized fixed step RK4 on the time_vector grid
+rk4_jit     CompiledRK4, the same RK4 compiled with Numba (RK4Kernel and a RuntimeWarning when Numba
+            is not installed)
+rk45        RK45Solver, adaptive Dormand-Prince 5(4) with valve event location
+exponential ExponentialSolver, exact matrix exponential of the vessels with implicit ventricles,
+            N_STEPS steps per beat and cached per valve configuration propagators
+
+All solvers provide run_beat(Volumes, Pressures, time_vector, tes) and
+end_of_beat(initial_volumes, time_vector, tes). The 7 compartment circuit with the LV infarct scar
+is stepped by RK4Kernel.from_circuit for rk4 and CompiledRK4.from_circuit for rk4_jit; rk45 and
+exponential are written for the 6 compartment loop. rk4_compiled is only imported when rk4_jit is
+first selected, since importing Numba takes longer than a short simulation
+"""
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+from DogPVSimulation_6Comp_Python.rk4_kernel import RK4Kernel
+from DogPVSimulation_6Comp_Python.rk45 import RK45Solver
+from DogPVSimulation_6Comp_Python.exponential import ExponentialSolver
+
+INTEGRATORS = ["rk4", "rk4_jit", "rk45", "exponential"]
+
+def make_stepper(integrator, resistances, capacitances, ventricles, batch_shape=(), infarct=None, **options):
+    """
+    Cycle solver for one parameter set; batch_shape is the shape of initial volumes passed to end_of_beat.
+    infarct (A, B, V0, resistance) adds the LV infarct scar as column 6, see circuit.canine_circuit.
+    options go to the solver constructor: rtol / atol for rk45, nSteps for exponential (the fixed step
+    RK4 solvers step on the time_vector grid and take none)
+    """
+    if integrator in ("rk4", "rk4_jit") and options:
+        raise ValueError("Solver options are not supported by " + integrator + ": " + str(sorted(options)))
+    if infarct is not None:
+        if integrator not in ("rk4", "rk4_jit"):
+            raise ValueError("The infarct circuit is only supported by rk4 and rk4_jit, not " + str(integrator))
+        circuit = canine_circuit(resistances, capacitances, ventricles, infarct=infarct)
+        if integrator == "rk4_jit":
+            from DogPVSimulation_6Comp_Python.rk4_compiled import CompiledRK4
+            return CompiledRK4.from_circuit(circuit, batch_shape=batch_shape)
+        return RK4Kernel.from_circuit(circuit, batch_shape=batch_shape)
+    if integrator == "rk4":
+        return RK4Kernel(resistances, capacitances, ventricles, batch_shape=batch_shape)
+    if integrator == "rk4_jit":
+        from DogPVSimulation_6Comp_Python.rk4_compiled import CompiledRK4
+        return CompiledRK4(resistances, capacitances, ventricles, batch_shape=batch_shape)
+    if integrator == "rk45":
+        return RK45Solver(resistances, capacitances, ventricles, **options)
+    if integrator == "exponential":
+        return ExponentialSolver(resistances, capacitances, ventricles, **options)
+    raise ValueError("Unknown integrator: " + str(integrator))
@@ -0,0 +1,158 @@
+"""
+parameter_sweep.py
+Runs sensitivity studies over the set_initial_conditions parameters (HR, BV, LV_EES, LV_A, RV_A, B,
+V0, SVR) on a process pool and stores the calculate_metrics summary of every point.
+
+A design is an (nPoints, nParameters) array with one column per parameter name, built with
+grid_design or latin_hypercube_design. run_sweep splits it into chunks, fans the chunks out over a
+ProcessPoolExecutor and writes each finished chunk to the results directory as its own columnar
+file (chunk_<first point>.npz, one array per parameter and metric). Chunk files are only ever added,
+each written atomically, so after a crash run_sweep can be called again with the same design and
+skips every point that already has results. load_results concatenates the chunks.
+
+With cache_path, points start from a steady_state_cache.SteadyStateCache instead of BV / 6: every
+chunk reads a snapshot of the cache file, adds the states it converges to its own copy (so later
+points of the chunk start from them too), and returns the new states, which the parent merges into
+the cache file after each chunk.
+"""
+import glob
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.simulate_heart_beat import simulate_heart_beat
+from DogPVSimulation_6Comp_Python.calculate_metrics import calculate_metrics, METRICS
+from DogPVSimulation_6Comp_Python.steady_state_cache import SteadyStateCache
+from DogPVSimulation_6Comp_Python.constants import PARAMETERS
+
+
+def grid_design(values):
+    """Full factorial design from {parameter name: list of values}; returns names, design"""
+    names = list(values)
+    design = np.array(list(itertools.product(*(values[name] for name in names))), dtype=float)
+    return names, design
+
+
+def latin_hypercube_design(bounds, nPoints, seed=0):
+    """Latin hypercube design of nPoints from {parameter name: (low, high)}; returns names, design"""
+    rng = np.random.default_rng(seed)
+    names = list(bounds)
+    design = np.zeros((nPoints, len(names)))
+    for column, name in enumerate(names):
+        low, high = bounds[name]
+        strata = (rng.permutation(nPoints) + rng.random(nPoints)) / nPoints
+        design[:, column] = low + strata * (high - low)
+    return names, design
+
+
+def simulate_point(parameters, simulate_options, cache=None):
+    """
+    Metrics for one {parameter name: value} point, plus whether it reached steady state. cache, a
+    SteadyStateCache, seeds the initial volumes and receives the converged state
+    """
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(**parameters)
+    Volumes, Pressures, Valves, Flows, convergence = simulate_heart_beat(resistances, capacitances, ventricles,
+                                                                         time_vector, tes, Volumes, cache=cache,
+                                                                         return_convergence=True, **simulate_options)
+    metrics = calculate_metrics(Volumes, Pressures, Valves, time_vector)
+    metrics["converged"] = float(convergence.converged)
+    return metrics
+
+
+def run_chunk(names, points, design, simulate_options, cache_path=None):
+    """
+    Worker: simulates design rows and returns them as columns, plus the [(key, volumes)] steady
+    states converged by this chunk when cache_path is given (else an empty list)
+    """
+    columns = {"point": np.asarray(points)}
+    for column, name in enumerate(names):
+        columns[name] = design[:, column]
+    cache = None
+    if cache_path is not None:
+        cache = SteadyStateCache(cache_path, save_every=np.inf) # read only snapshot, the parent writes the file
+        known = set(cache.entries)
+    rows = [simulate_point(dict(zip(names, values)), simulate_options, cache) for values in design]
+    for metric in METRICS + ["converged"]:
+        columns[metric] = np.array([row[metric] for row in rows], dtype=float)
+    new_states = [] if cache is None else [entry for name, entry in cache.entries.items() if name not in known]
+    return columns, new_states
+
+
+def write_chunk(results_dir, columns):
+    path = os.path.join(results_dir, "chunk_" + str(int(columns["point"][0])).zfill(9) + ".npz")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **columns)
+    os.replace(tmp_path, path)
+
+
+def completed_points(results_dir):
+    """Design rows that already have results"""
+    done = []
+    for path in glob.glob(os.path.join(results_dir, "chunk_*.npz")):
+        with np.load(path) as saved:
+            done.append(saved["point"])
+    return set(np.concatenate(done).tolist()) if done else set()
+
+
+def run_sweep(names, design, results_dir, nWorkers=None, chunk_size=None, cache_path=None, **simulate_options):
+    """
+    Simulates every row of design not already in results_dir. simulate_options are passed on to
+    simulate_heart_beat (e.g. integrator="rk45", steady_state="newton"). cache_path, a
+    SteadyStateCache file, warm starts the points and is updated after every chunk.
+    Returns the number of points simulated by this call
+    """
+    unknown = [name for name in names if name not in PARAMETERS]
+    if unknown:
+        raise ValueError("Unknown sweep parameters: " + str(unknown))
+    design = np.asarray(design, dtype=float)
+
+    # the design and the metric columns are stored with the results so a resumed sweep cannot mix
+    # designs, or chunks written before calculate_metrics.METRICS changed
+    os.makedirs(results_dir, exist_ok=True)
+    design_path = os.path.join(results_dir, "design.npz")
+    if os.path.exists(design_path):
+        with np.load(design_path) as saved:
+            if list(saved["names"]) != list(names) or not np.array_equal(saved["design"], design):
+                raise ValueError(results_dir + " holds results of a different design")
+            saved_metrics = list(saved["metrics"]) if "metrics" in saved else None
+        if saved_metrics != METRICS:
+            raise ValueError(results_dir + " holds results with metrics " + str(saved_metrics) + ", not "
+                             + str(METRICS) + "; start a new results directory")
+    else:
+        np.savez(design_path, names=np.array(names), design=design, metrics=np.array(METRICS))
+
+    done = completed_points(results_dir)
+    todo = np.array([point for point in range(len(design)) if point not in done], dtype=int)
+    if todo.size == 0:
+        return 0
+
+    nWorkers = nWorkers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, min(64, todo.size // (4 * nWorkers)))
+    chunks = [todo[start:start + chunk_size] for start in range(0, todo.size, chunk_size)]
+
+    cache = None if cache_path is None else SteadyStateCache(cache_path)
+    with ProcessPoolExecutor(max_workers=nWorkers) as pool:
+        futures = [pool.submit(run_chunk, names, chunk, design[chunk], simulate_options, cache_path) for chunk in chunks]
+        for future in as_completed(futures):
+            columns, new_states = future.result()
+            write_chunk(results_dir, columns)
+            if cache is not None:
+                for key, volumes in new_states:
+                    cache.store(key, volumes)
+                cache.save() # chunks submitted later read the merged states
+    return todo.size
+
+
+def load_results(results_dir):
+    """All finished points as {column name: array}, ordered by design row"""
+    chunks = [dict(np.load(path)) for path in sorted(glob.glob(os.path.join(results_dir, "chunk_*.npz")))]
+    if not chunks:
+        return {}
+    if any(set(chunk) != set(chunks[0]) for chunk in chunks):
+        raise ValueError(results_dir + " holds chunks with different columns")
+    columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+    order = np.argsort(columns["point"])
+    return {name: values[order] for name, values in columns.items()}
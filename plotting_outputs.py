@@ -1,209 +1,206 @@
 """
 plotting_outputs.py
 Plots pressure volume loops, valve opening/closing, and flows over time
-"""
 
+FigureTemplate builds the three figures (PV loops, pressures and volumes vs time, flows vs time) once
+and redraws them for each run by replacing line data, so a cohort is rendered without rebuilding any
+axes. Valve events are drawn as one LineCollection per axis, and with max_points the waveforms are
+reduced by min/max decimation, which keeps every peak and trough of the full resolution trace.
+
+plotting_outputs shows one run interactively at full resolution. render_cohort renders the beats of a
+waveform_store.WaveformStore to image files on a process pool, headless (Agg, no pyplot).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+from DogPVSimulation_6Comp_Python.waveform_store import WaveformStore
+
+FIGURE_NAMES = ["pv_loops", "pressures_volumes", "flows"]
+# valve event markers: (valve column, opens, linestyle, color) for the left and right heart axes
+LEFT_EVENTS = [(1, True, "--", "black"), (1, False, "-", "black"), (0, True, "--", "gray"), (0, False, "-", "gray")]
+RIGHT_EVENTS = [(3, True, "--", "black"), (3, False, "-", "black"), (2, True, "--", "gray"), (2, False, "-", "gray")]
+VALVE_NAMES = ["MV", "AV", "TV", "PV"]
+LEFT_LABELS = ["Pulmonary Veins", "LV", "Systemic Arteries"]
+RIGHT_LABELS = ["Systemic Veins", "RV", "Pulmonary Arteries"]
+
+
+def decimate_minmax(values, nBins):
+    """
+    Rows of values (nRows, k) to plot at nBins horizontal resolution: the first and last row, and the
+    rows of the min and max of every column within each of nBins consecutive row ranges
+    """
+    nRows = np.shape(values)[0]
+    if nBins is None or 4 * nBins >= nRows:
+        return np.arange(nRows)
+    bin_size = -(-nRows // nBins)
+    padded = np.pad(values, ((0, nBins * bin_size - nRows), (0, 0)), mode="edge").reshape(nBins, bin_size, -1)
+    offsets = np.arange(nBins)[:, None] * bin_size
+    rows = np.concatenate(([0, nRows - 1], (offsets + np.argmin(padded, axis=1)).ravel(),
+                           (offsets + np.argmax(padded, axis=1)).ravel()))
+    return np.unique(np.minimum(rows, nRows - 1))
+
+
+def event_segments(Valves, time_vector, events):
+    """Vertical marker segments (x in data, y in axes coordinates) and their styles for events"""
+    valve_change = np.diff(np.asarray(Valves, dtype=np.int8), axis=0) # MV, AV, TV, PV
+    segments, linestyles, colors = [], [], []
+    for column, opens, linestyle, color in events:
+        for row in np.nonzero(valve_change[:, column] == (1 if opens else -1))[0]:
+            segments.append([(time_vector[row], 0), (time_vector[row], 1)])
+            linestyles.append(linestyle)
+            colors.append(color)
+    return segments, linestyles, colors
+
+
+class FigureTemplate:
+    """
+    The three output figures with empty artists. update() draws a run into them and save() writes
+    them to files. figure creates each figure from a figsize (matplotlib.figure.Figure for headless
+    rendering, plt.figure for interactive windows); max_points limits the points per waveform to
+    about the pixel width of its axes (None plots every row)
+    """
+
+    def __init__(self, figure=Figure, dpi=None, max_points="pixels"):
+        self.max_points = max_points
+        self.v = np.arange(0, 101) # for plotting ESPVR and EDPVR
+
+        #----Pressure Volume Loops----
+        fig1 = figure(figsize=(12, 5), dpi=dpi)
+        axs1 = fig1.subplots(1, 2)
+        self.pv_axes = axs1
+        self.pv_lines = []
+        for ax, name in zip(axs1, ["LV", "RV"]):
+            espvr, = ax.plot(self.v, self.v, '--k', label='ESPVR')
+            edpvr, = ax.plot(self.v, self.v, '--k', label='EDPVR')
+            loop, = ax.plot([], [], '-', linewidth=2, label=name + ' PV Loop')
+            ax.set_xlabel(name + ' Volume (ml)')
+            ax.set_ylabel(name + ' Pressure (mmHg)')
+            self.pv_lines.append((espvr, edpvr, loop))
+        fig1.tight_layout()
+
+        #----Pressure and Volume vs Time----
+        fig2 = figure(figsize=(12, 8), dpi=dpi)
+        axs2 = fig2.subplots(2, 2)
+
+        #----Flows vs Time----
+        fig3 = figure(figsize=(12, 8), dpi=dpi)
+        axs3 = fig3.subplots(1, 2)
+
+        # (axis, waveform, compartment columns, valve events, ylabel) of every time axis
+        self.time_axes = []
+        for ax, waveform, side, ylabel in [(axs2[0, 0], "Pressures", 0, 'Pressure (mmHg)'),
+                                           (axs2[0, 1], "Pressures", 1, 'Pressure (mmHg)'),
+                                           (axs2[1, 0], "Volumes", 0, 'Volume (ml)'),
+                                           (axs2[1, 1], "Volumes", 1, 'Volume (ml)'),
+                                           (axs3[0], "Flows", 0, 'Flow (ml/s)'),
+                                           (axs3[1], "Flows", 1, 'Flow (ml/s)')]:
+            columns = [0, 1, 2] if side == 0 else [3, 4, 5]
+            events = LEFT_EVENTS if side == 0 else RIGHT_EVENTS
+            labels = LEFT_LABELS if side == 0 else RIGHT_LABELS
+
+            # one collection for every valve event marker on the axis, legend entries as proxies
+            markers = LineCollection([], transform=ax.get_xaxis_transform())
+            ax.add_collection(markers, autolim=False)
+            handles = [Line2D([], [], linestyle=linestyle, color=color,
+                              label=VALVE_NAMES[column] + (' opens' if opens else ' closes'))
+                       for column, opens, linestyle, color in events]
+            lines = [ax.plot([], [], '-', linewidth=2, label=label)[0] for label in labels]
+
+            ax.set_xlabel('Time (s)')
+            ax.set_ylabel(ylabel)
+            ax.legend(handles=handles + lines)
+            self.time_axes.append((ax, waveform, columns, events, markers, lines))
+
+        self.figures = [fig1, fig2, fig3]
+
+    def bins(self, ax):
+        if self.max_points == "pixels":
+            return max(1, int(ax.bbox.width))
+        return self.max_points
+
+    def update(self, ventricles, Volumes, Pressures, Valves, Flows, time_vector):
+        """Draws one run into the figures"""
+        waveforms = {"Volumes": Volumes, "Pressures": Pressures, "Flows": Flows}
+
+        for ax, (espvr, edpvr, loop), ventricle, column in zip(self.pv_axes, self.pv_lines, ventricles, [1, 4]):
+            A, B, Ees, V0 = ventricle
+
+            # ESPVR: End-systolic pressure-volume relationship (linear)
+            espvr.set_ydata(Ees * (self.v - V0))
+
+            # EDPVR: End-diastolic pressure-volume relationship (exponential)
+            edpvr.set_ydata(B * np.exp(A * (self.v - V0)) - B)
+
+            rows = decimate_minmax(np.column_stack((Volumes[:, column], Pressures[:, column])), self.bins(ax))
+            loop.set_data(Volumes[rows, column], Pressures[rows, column])
+            ax.set_xlim([0, 1.1 * np.max(Volumes[:, column])])
+            ax.set_ylim([0, 1.1 * np.max(Pressures[:, column])])
+
+        for ax, waveform, columns, events, markers, lines in self.time_axes:
+            values = waveforms[waveform][:, columns]
+            rows = decimate_minmax(values, self.bins(ax))
+            for column, line in enumerate(lines):
+                line.set_data(time_vector[rows], values[rows, column])
+            segments, linestyles, colors = event_segments(Valves, time_vector, events)
+            markers.set_segments(segments)
+            markers.set_linestyle(linestyles)
+            markers.set_color(colors)
+            ax.relim()
+            ax.autoscale_view()
+
+    def save(self, prefix, format="png"):
+        """Writes the figures to <prefix>_<figure name>.<format>; returns the paths"""
+        paths = []
+        for fig, name in zip(self.figures, FIGURE_NAMES):
+            path = prefix + "_" + name + "." + format
+            fig.savefig(path)
+            paths.append(path)
+        return paths
 
-def plotting_outputs(ventricles, Volumes, Pressures, Valves, Flows, time_vector):
 
-    #----Pressure Volume Loops----
-    v = np.arange(0, 101) # for plotting ESPVR and EDPVR
-
-    fig1, axs1 = plt.subplots(1, 2, figsize=(12, 5))
-
-    # Subplot 1: Left ventricle
-    A_lv = ventricles[0, 0]
-    B_lv = ventricles[0, 1]
-    Ees_lv = ventricles[0, 2]
-    V0_lv = ventricles[0, 3]
-
-    # ESPVR: End-systolic pressure-volume relationship (linear)
-    espvr_lv = Ees_lv * (v - V0_lv)
-
-    # EDPVR: End-diastolic pressure-volume relationship (exponential)
-    edpvr_lv = B_lv * np.exp(A_lv * (v - V0_lv)) - B_lv
-
-    axs1[0].plot(v, espvr_lv, '--k', label='ESPVR')
-    axs1[0].plot(v, edpvr_lv, '--k', label='EDPVR')
-    axs1[0].plot(Volumes[:, 1], Pressures[:, 1], '-', linewidth=2, label='LV PV Loop')
-
-    axs1[0].set_xlabel('LV Volume (ml)')
-    axs1[0].set_ylabel('LV Pressure (mmHg)')
-    axs1[0].set_xlim([0, 1.1 * np.max(Volumes[:, 1])])
-    axs1[0].set_ylim([0, 1.1 * np.max(Pressures[:, 1])])
-
-    # Subplot 2: Right ventricle
-    A_rv = ventricles[1, 0]
-    B_rv = ventricles[1, 1]
-    Ees_rv = ventricles[1, 2]
-    V0_rv = ventricles[1, 3]
-
-    # ESPVR: End-systolic pressure-volume relationship (linear)
-    espvr_rv = Ees_rv * (v - V0_rv)
-
-    # EDPVR: End-diastolic pressure-volume relationship (exponential)
-    edpvr_rv = B_rv * np.exp(A_rv * (v - V0_rv)) - B_rv
-
-    axs1[1].plot(v, espvr_rv, '--k', label='ESPVR')
-    axs1[1].plot(v, edpvr_rv, '--k', label='EDPVR')
-    axs1[1].plot(Volumes[:, 4], Pressures[:, 4], '-', linewidth=2, label='RV PV Loop')
-
-    axs1[1].set_xlabel('RV Volume (ml)')
-    axs1[1].set_ylabel('RV Pressure (mmHg)')
-    axs1[1].set_xlim([0, 1.1 * np.max(Volumes[:, 4])])
-    axs1[1].set_ylim([0, 1.1 * np.max(Pressures[:, 4])])
-
-    plt.tight_layout()
-
-    #----Pressure and Volume vs Time----
-    valve_change = np.diff(Valves, axis=0)  # MV, AV, TV, PV
-    row_MV_opens = np.nonzero(valve_change[:, 0] == 1)
-    row_MV_closes = np.nonzero(valve_change[:, 0] == -1)
-    row_AV_opens = np.nonzero(valve_change[:, 1] == 1)
-    row_AV_closes = np.nonzero(valve_change[:, 1] == -1)
-    row_TV_opens = np.nonzero(valve_change[:, 2] == 1)
-    row_TV_closes = np.nonzero(valve_change[:, 2] == -1)
-    row_PV_opens = np.nonzero(valve_change[:, 3] == 1)
-    row_PV_closes = np.nonzero(valve_change[:, 3] == -1)
-
-    # Left side pressures
-    fig2, axs2 = plt.subplots(2, 2, figsize=(12, 8))
-
-    ax = axs2[0, 0] # top left corner
-
-    # Plot vertical lines at valve event times
-    for row in row_AV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='black', label='AV opens' if row == row_AV_opens[0] else "")
-    for row in row_AV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='black', label='AV closes' if row == row_AV_closes[0] else "")
-    for row in row_MV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='gray', label='MV opens' if row == row_MV_opens[0] else "")
-    for row in row_MV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='gray', label='MV closes' if row == row_MV_closes[0] else "")
-
-    # Plot pressure curves: PV, LV, SA
-    ax.plot(time_vector, Pressures[:, 0], '-', linewidth=2, label='Pulmonary Veins')
-    ax.plot(time_vector, Pressures[:, 1], '-', linewidth=2, label='LV')
-    ax.plot(time_vector, Pressures[:, 2], '-', linewidth=2, label='Systemic Arteries')
-
-    ax.set_xlabel('Time (s)')
-    ax.set_ylabel('Pressure (mmHg)')
-    ax.legend()
-
-    # Right side pressures
-    ax = axs2[0, 1]  # top right corner
-
-    # Plot vertical lines at valve event times
-    for row in row_PV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='black', label='PV opens' if row == row_PV_opens[0] else "")
-    for row in row_PV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='black', label='PV closes' if row == row_PV_closes[0] else "")
-    for row in row_TV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='gray', label='TV opens' if row == row_TV_opens[0] else "")
-    for row in row_TV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='gray', label='TV closes' if row == row_TV_closes[0] else "")
-
-    # Plot pressure curves: SV, RV, SPA
-    ax.plot(time_vector, Pressures[:, 3], '-', linewidth=2, label='Systemic Veins')
-    ax.plot(time_vector, Pressures[:, 4], '-', linewidth=2, label='RV')
-    ax.plot(time_vector, Pressures[:, 5], '-', linewidth=2, label='Pulmonary Arteries')
-
-    ax.set_xlabel('Time (s)')
-    ax.set_ylabel('Pressure (mmHg)')
-    ax.legend()
-
-    # Left side volumes
-    ax = axs2[1, 0]  # bottom left corner
-
-    # Plot vertical lines at valve event times
-    for row in row_AV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='black', label='AV opens' if row == row_AV_opens[0] else "")
-    for row in row_AV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='black', label='AV closes' if row == row_AV_closes[0] else "")
-    for row in row_MV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='gray', label='MV opens' if row == row_MV_opens[0] else "")
-    for row in row_MV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='gray', label='MV closes' if row == row_MV_closes[0] else "")
-
-    # Plot volume curves: PV, LV, SA
-    ax.plot(time_vector, Volumes[:, 0], '-', linewidth=2, label='Pulmonary Veins')
-    ax.plot(time_vector, Volumes[:, 1], '-', linewidth=2, label='LV')
-    ax.plot(time_vector, Volumes[:, 2], '-', linewidth=2, label='Systemic Arteries')
-
-    ax.set_xlabel('Time (s)')
-    ax.set_ylabel('Volume (ml)')
-    ax.legend()
-
-    # Right side volumes
-    ax = axs2[1, 1]  # bottom right corner
-
-    # Plot vertical lines at valve event times
-    for row in row_PV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='black', label='PV opens' if row == row_PV_opens[0] else "")
-    for row in row_PV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='black', label='PV closes' if row == row_PV_closes[0] else "")
-    for row in row_TV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='gray', label='TV opens' if row == row_TV_opens[0] else "")
-    for row in row_TV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='gray', label='TV closes' if row == row_TV_closes[0] else "")
-
-    # Plot volume curves: SV, RV, SPA
-    ax.plot(time_vector, Volumes[:, 3], '-', linewidth=2, label='Systemic Veins')
-    ax.plot(time_vector, Volumes[:, 4], '-', linewidth=2, label='RV')
-    ax.plot(time_vector, Volumes[:, 5], '-', linewidth=2, label='Pulmonary Arteries')
-
-    ax.set_xlabel('Time (s)')
-    ax.set_ylabel('Volume (ml)')
-    ax.legend()
-
-    #----Flows vs Time----
-
-    # Left side flows
-    fig3, axs3 = plt.subplots(1, 2, figsize=(12, 8))
-
-    ax = axs3[0]  # left
-
-    # Plot vertical lines at valve event times
-    for row in row_AV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='black', label='AV opens' if row == row_AV_opens[0] else "")
-    for row in row_AV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='black', label='AV closes' if row == row_AV_closes[0] else "")
-    for row in row_MV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='gray', label='MV opens' if row == row_MV_opens[0] else "")
-    for row in row_MV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='gray', label='MV closes' if row == row_MV_closes[0] else "")
-
-    # Plot flow curves: PV, LV, SA
-    ax.plot(time_vector, Flows[:, 0], '-', linewidth=2, label='Pulmonary Veins')
-    ax.plot(time_vector, Flows[:, 1], '-', linewidth=2, label='LV')
-    ax.plot(time_vector, Flows[:, 2], '-', linewidth=2, label='Systemic Arteries')
-
-    ax.set_xlabel('Time (s)')
-    ax.set_ylabel('Flow (ml/s)')
-    ax.legend()
-
-    # Right side flows
-    ax = axs3[1]  # right
-
-    # Plot vertical lines at valve event times
-    for row in row_PV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='black', label='PV opens' if row == row_PV_opens[0] else "")
-    for row in row_PV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='black', label='PV closes' if row == row_PV_closes[0] else "")
-    for row in row_TV_opens:
-        ax.axvline(time_vector[row], linestyle='--', color='gray', label='TV opens' if row == row_TV_opens[0] else "")
-    for row in row_TV_closes:
-        ax.axvline(time_vector[row], linestyle='-', color='gray', label='TV closes' if row == row_TV_closes[0] else "")
-
-    # Plot flow curves: SV, RV, SPA
-    ax.plot(time_vector, Flows[:, 3], '-', linewidth=2, label='Systemic Veins')
-    ax.plot(time_vector, Flows[:, 4], '-', linewidth=2, label='RV')
-    ax.plot(time_vector, Flows[:, 5], '-', linewidth=2, label='Pulmonary Arteries')
-
-    ax.set_xlabel('Time (s)')
-    ax.set_ylabel('Flow (ml/s)')
-    ax.legend()
-
-    plt.show()
\ No newline at end of file
+def plotting_outputs(ventricles, Volumes, Pressures, Valves, Flows, time_vector):
+    import matplotlib.pyplot as plt
+    template = FigureTemplate(figure=plt.figure, max_points=None)
+    template.update(ventricles, Volumes, Pressures, Valves, Flows, time_vector)
+    plt.show()
+
+
+def render_chunk(store_path, output_dir, beats, dpi, format):
+    """Worker: renders beats of the store with one reused template; returns the written paths"""
+    store = WaveformStore(store_path)
+    template = FigureTemplate(dpi=dpi)
+    paths = []
+    for beat in beats:
+        template.update(store.ventricles(beat), store.Volumes[beat], store.Pressures[beat], store.Valves(beat),
+                        store.Flows[beat], store.time_vector(beat))
+        paths.extend(template.save(os.path.join(output_dir, "beat_" + str(beat).zfill(9)), format))
+    return paths
+
+
+def render_cohort(store_path, output_dir, beats=None, nWorkers=None, chunk_size=None, dpi=100, format="png"):
+    """
+    Renders the PV loop, pressure/volume and flow figures of every beat (or the given beats) of the
+    waveform store at store_path to output_dir as beat_<beat>_<figure name>.<format>, on a process
+    pool. Returns the written paths
+    """
+    if beats is None:
+        beats = range(len(WaveformStore(store_path)))
+    beats = np.asarray(beats, dtype=int)
+    if beats.size == 0:
+        return []
+    os.makedirs(output_dir, exist_ok=True)
+
+    nWorkers = nWorkers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, min(64, beats.size // (4 * nWorkers)))
+    chunks = [beats[start:start + chunk_size] for start in range(0, beats.size, chunk_size)]
+
+    paths = []
+    with ProcessPoolExecutor(max_workers=nWorkers) as pool:
+        futures = [pool.submit(render_chunk, store_path, output_dir, chunk, dpi, format) for chunk in chunks]
+        for future in as_completed(futures):
+            paths.extend(future.result())
+    return sorted(paths)
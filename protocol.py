@@ -0,0 +1,162 @@
+"""
+protocol.py
+Multi-beat transient protocols: scheduled parameter changes (steps, ramps, vena cava occlusion, HR
+or SVR changes, blood volume infusion or withdrawal) applied beat by beat through the schedule of
+stream_beats. The state is carried forward from beat to beat, so after the baseline steady state is
+found once no configuration of the protocol is re-converged.
+
+A Change names either a set_initial_conditions parameter or an entry of the parameter arrays
+(sensitivity.PARAMETERS, e.g. Rvs or Cas). Parameters are held constant within a beat and evaluated at
+its start, by beat number or, with unit="s", by the time since the start of the protocol.
+
+Parameter       Applied as
+HR              new time_vector and tes (same nRows)
+BV              stressed blood volume; the difference is added to (or withdrawn from) the systemic veins
+other           new resistances, capacitances or ventricles from set_initial_conditions / set_parameters
+
+    records = list(run_protocol([occlusion(start=5, nBeats=12)], nBeats=20))
+    Ees, V0 = fit_espvr([r.metrics["ESV"] for r in records[5:]], [r.metrics["ESP"] for r in records[5:]])
+"""
+import inspect
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.constants import PARAMETERS
+from DogPVSimulation_6Comp_Python.sensitivity import PARAMETERS as ARRAY_PARAMETERS, get_parameters, set_parameters
+from DogPVSimulation_6Comp_Python.steady_state import periodic_steady_state
+from DogPVSimulation_6Comp_Python.stream_beats import stream_beats
+
+VENOUS_COLUMN = 3 # systemic veins, where blood volume changes are applied
+OCCLUSION_FACTOR = 20 # Rvs multiplier of a vena cava occlusion
+
+
+class Change:
+    """
+    Scheduled parameter change
+        parameter   set_initial_conditions name (HR, BV, SVR, ...) or sensitivity.PARAMETERS name (Rvs, ...)
+        value       value reached by the change, a multiple of the baseline value when relative
+        start       beat number, or time (s) with unit="s", at which the change begins
+        duration    beats (or s) over which the value is ramped linearly from the value it had at start;
+                    0 for a step
+    """
+
+    def __init__(self, parameter, value, start, duration=0, unit="beat", relative=False):
+        if parameter not in PARAMETERS and parameter not in ARRAY_PARAMETERS:
+            raise ValueError("Unknown protocol parameter: " + str(parameter))
+        if unit not in ("beat", "s"):
+            raise ValueError("Unknown protocol unit: " + str(unit))
+        self.parameter = parameter
+        self.value = value
+        self.start = start
+        self.duration = duration
+        self.unit = unit
+        self.relative = relative
+
+
+def step(parameter, value, start, unit="beat", relative=False):
+    """Change of parameter to value at start"""
+    return Change(parameter, value, start, 0, unit, relative)
+
+
+def ramp(parameter, value, start, duration, unit="beat", relative=False):
+    """Linear change of parameter to value over duration from start"""
+    return Change(parameter, value, start, duration, unit, relative)
+
+
+def occlusion(start, nBeats, factor=OCCLUSION_FACTOR, unit="beat"):
+    """
+    Vena cava occlusion: venous return resistance Rvs raised factor times at start and released after
+    nBeats (or s), reducing preload beat by beat as used for ESPVR / EDPVR estimation
+    """
+    return [step("Rvs", factor, start, unit, relative=True), step("Rvs", 1, start + nBeats, unit, relative=True)]
+
+
+class Protocol:
+    """
+    Changes applied to a baseline
+        changes     list of Change, applied in order (a later change of the same parameter wins)
+        baseline    set_initial_conditions keyword arguments of the starting configuration
+        nRows       rows per beat
+    """
+
+    def __init__(self, changes, baseline=None, nRows=5000):
+        self.changes = list(changes)
+        self.baseline = dict(baseline or {})
+        self.nRows = nRows
+        unknown = [name for name in self.baseline if name not in PARAMETERS]
+        if unknown:
+            raise ValueError("Unknown baseline parameters: " + str(unknown))
+
+    def initial_conditions(self):
+        """set_initial_conditions output of the baseline"""
+        return set_initial_conditions(**self.baseline, nRows=self.nRows)
+
+    def baseline_values(self):
+        """Baseline value of every parameter that a change refers to, plus all set_initial_conditions ones"""
+        signature = inspect.signature(set_initial_conditions).parameters
+        values = {name: self.baseline.get(name, signature[name].default) for name in PARAMETERS}
+        _, _, _, ventricles, resistances, capacitances = self.initial_conditions()
+        array_names = [change.parameter for change in self.changes if change.parameter in ARRAY_PARAMETERS]
+        values.update(zip(array_names, get_parameters(resistances, capacitances, ventricles, array_names)))
+        return values
+
+    def configuration(self, values):
+        """(resistances, capacitances, ventricles, time_vector, tes) for the current parameter values"""
+        _, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(
+            **{name: values[name] for name in PARAMETERS}, nRows=self.nRows)
+        array_names = [name for name in values if name in ARRAY_PARAMETERS]
+        resistances, capacitances, ventricles = set_parameters(resistances, capacitances, ventricles, array_names,
+                                                               [values[name] for name in array_names])
+        return resistances, capacitances, ventricles, time_vector, tes
+
+    def schedule(self):
+        """
+        stream_beats schedule callback for one run of the protocol: returns the new configuration (and
+        the blood volume change) for beats at which a parameter changes, else None. Must be called with
+        consecutive beats from 0
+        """
+        baseline = self.baseline_values()
+        current = dict(baseline)
+        before = {} # value of the parameter when each change began
+        state = {"time": 0.0} # start time of the beat
+
+        def callback(beat):
+            values = dict(current)
+            for index, change in enumerate(self.changes):
+                position = beat if change.unit == "beat" else state["time"]
+                if position < change.start:
+                    continue
+                if index not in before:
+                    before[index] = values[change.parameter]
+                target = change.value * baseline[change.parameter] if change.relative else change.value
+                fraction = 1.0 if change.duration <= 0 else min(1.0, (position - change.start) / change.duration)
+                values[change.parameter] = before[index] + fraction * (target - before[index])
+
+            changed = values != current
+            volume_change = values["BV"] - current["BV"]
+            current.update(values)
+            state["time"] = state["time"] + 60 / current["HR"]
+            if not changed:
+                return None
+            infusion = np.zeros((6,))
+            infusion[VENOUS_COLUMN] = volume_change
+            return self.configuration(current) + (infusion,)
+
+        return callback
+
+    def run(self, nBeats, initial_volumes=None, steady_state="anderson", integrator="rk4", decimation=10):
+        """
+        Yields a stream_beats.BeatRecord per beat. Without initial_volumes the baseline is first brought
+        to its periodic steady state with steady_state.periodic_steady_state (method steady_state)
+        """
+        Volumes, time_vector, tes, ventricles, resistances, capacitances = self.initial_conditions()
+        if initial_volumes is None:
+            initial_volumes, _, _ = periodic_steady_state(resistances, capacitances, ventricles, time_vector, tes,
+                                                          Volumes[0, :], method=steady_state, integrator=integrator)
+        return stream_beats(resistances, capacitances, ventricles, time_vector, tes, initial_volumes, nBeats=nBeats,
+                            schedule=self.schedule(), decimation=decimation, integrator=integrator)
+
+
+def run_protocol(changes, nBeats, baseline=None, nRows=5000, initial_volumes=None, steady_state="anderson",
+                 integrator="rk4", decimation=10):
+    """Yields a BeatRecord per beat of the changes applied to the baseline, see Protocol.run"""
+    return Protocol(changes, baseline, nRows).run(nBeats, initial_volumes, steady_state, integrator, decimation)
@@ -22,7 +22,7 @@ def rk4(current_volumes, current_pressures, resistances, capacitances, ventricle
     def dv1(P_pa, P_pv, P_lv, R_pa, R_pv, R_mv):
         """Pulmonary veins"""
         Q_in = (P_pa - P_pv) / R_pa
-        Q_out = (P_pv - P_lv) / R_pv * (P_pv > P_lv) - (P_pv - P_lv) / R_mv * (P_lv > P_pv)
+        Q_out = (P_pv - P_lv) / R_pv * (P_pv > P_lv) + (P_pv - P_lv) / R_mv * (P_lv > P_pv)
         delta_vol = Q_in - Q_out
         return delta_vol
 
@@ -61,13 +61,11 @@ def rk4(current_volumes, current_pressures, resistances, capacitances, ventricle
         delta_vol = Q_in - Q_out
         return delta_vol
 
-
     # initialize
     half_step = step_size / 2
     sixth_step = step_size / 6
-    new_vols = np.zeros((6,))
     new_pres = np.zeros((6,))
-    resistances[6] = math.inf
+    R_mv = resistances[6] if resistances[6] > 0 else math.inf # mitral backflow, 0 or inf: none
 
     # find current contraction timepoint
     if current_time < 2 * tes:
@@ -76,8 +74,8 @@ def rk4(current_volumes, current_pressures, resistances, capacitances, ventricle
         epsilon = 0
 
     # k1
-    k1 = np.array([dv1(current_pressures[5], current_pressures[0], current_pressures[1], resistances[5], resistances[0], resistances[6] ),
-          dv2(current_pressures[0], current_pressures[1], current_pressures[2], resistances[0], resistances[1], resistances[6] ),
+    k1 = np.array([dv1(current_pressures[5], current_pressures[0], current_pressures[1], resistances[5], resistances[0], R_mv),
+          dv2(current_pressures[0], current_pressures[1], current_pressures[2], resistances[0], resistances[1], R_mv),
           dv3(current_pressures[1], current_pressures[2], current_pressures[3], resistances[1], resistances[2] ),
           dv4(current_pressures[2], current_pressures[3], current_pressures[4], resistances[2], resistances[3] ),
           dv5(current_pressures[3], current_pressures[4], current_pressures[5], resistances[3], resistances[4] ),
@@ -85,8 +83,8 @@ def rk4(current_volumes, current_pressures, resistances, capacitances, ventricle
 
     # k2
     P_k2 = current_pressures + half_step * k1
-    k2 = np.array([dv1(P_k2[5], P_k2[0], P_k2[1], resistances[5], resistances[0], resistances[6]),
-          dv2(P_k2[0], P_k2[1], P_k2[2], resistances[0], resistances[1], resistances[6]),
+    k2 = np.array([dv1(P_k2[5], P_k2[0], P_k2[1], resistances[5], resistances[0], R_mv),
+          dv2(P_k2[0], P_k2[1], P_k2[2], resistances[0], resistances[1], R_mv),
           dv3(P_k2[1], P_k2[2], P_k2[3], resistances[1], resistances[2]),
           dv4(P_k2[2], P_k2[3], P_k2[4], resistances[2], resistances[3]),
           dv5(P_k2[3], P_k2[4], P_k2[5], resistances[3], resistances[4]),
@@ -94,8 +92,8 @@ def rk4(current_volumes, current_pressures, resistances, capacitances, ventricle
 
     # k3
     P_k3 = current_pressures + half_step * k2
-    k3 = np.array([dv1(P_k3[5], P_k3[0], P_k3[1], resistances[5], resistances[0], resistances[6]),
-          dv2(P_k3[0], P_k3[1], P_k3[2], resistances[0], resistances[1], resistances[6]),
+    k3 = np.array([dv1(P_k3[5], P_k3[0], P_k3[1], resistances[5], resistances[0], R_mv),
+          dv2(P_k3[0], P_k3[1], P_k3[2], resistances[0], resistances[1], R_mv),
           dv3(P_k3[1], P_k3[2], P_k3[3], resistances[1], resistances[2]),
           dv4(P_k3[2], P_k3[3], P_k3[4], resistances[2], resistances[3]),
           dv5(P_k3[3], P_k3[4], P_k3[5], resistances[3], resistances[4]),
@@ -103,8 +101,8 @@ def rk4(current_volumes, current_pressures, resistances, capacitances, ventricle
 
     # k4
     P_k4 = current_pressures + step_size * k3
-    k4 = np.array([dv1(P_k4[5], P_k4[0], P_k4[1], resistances[5], resistances[0], resistances[6]),
-          dv2(P_k4[0], P_k4[1], P_k4[2], resistances[0], resistances[1], resistances[6]),
+    k4 = np.array([dv1(P_k4[5], P_k4[0], P_k4[1], resistances[5], resistances[0], R_mv),
+          dv2(P_k4[0], P_k4[1], P_k4[2], resistances[0], resistances[1], R_mv),
           dv3(P_k4[1], P_k4[2], P_k4[3], resistances[1], resistances[2]),
           dv4(P_k4[2], P_k4[3], P_k4[4], resistances[2], resistances[3]),
           dv5(P_k4[3], P_k4[4], P_k4[5], resistances[3], resistances[4]),
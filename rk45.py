@@ -0,0 +1,245 @@
+"""
+rk45.py
+Adaptive embedded Runge-Kutta solver (Dormand-Prince 5(4)) for one cardiac cycle. Step sizes follow
+a local error estimate, so large steps are taken during isovolumic and filling phases. End systole
+(t = 2 tes, where the activation function stops) is always a step boundary, and the times at which
+the valves open or close are located by root finding on the interpolant so that no step crosses a
+valve switch.
+
+Valve   Index   Open when
+MV      0       P[0] > P[1]
+AV      1       P[1] > P[2]
+TV      2       P[3] > P[4]
+PV      3       P[4] > P[5]
+"""
+import numpy as np
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+from DogPVSimulation_6Comp_Python.rk4_kernel import RK4Kernel, activation
+
+# Dormand-Prince 5(4) tableau
+NODES = np.array([0, 1/5, 3/10, 4/5, 8/9, 1, 1])
+STAGES = np.array([
+    [0, 0, 0, 0, 0, 0],
+    [1/5, 0, 0, 0, 0, 0],
+    [3/40, 9/40, 0, 0, 0, 0],
+    [44/45, -56/15, 32/9, 0, 0, 0],
+    [19372/6561, -25360/2187, 64448/6561, -212/729, 0, 0],
+    [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656, 0],
+    [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]])
+WEIGHTS = STAGES[6] # 5th order solution, last stage is the derivative at the new point
+ERROR_WEIGHTS = np.array([71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40])
+
+VALVE_UPSTREAM, VALVE_DOWNSTREAM = canine_circuit().valve_endpoints() # MV, AV, TV, PV columns
+VALVE_NAMES = ["MV", "AV", "TV", "PV"]
+
+RTOL = 1e-6
+ATOL = 1e-6 # ml
+MAX_STEPS = 100000
+
+
+def valve_gaps(pressures):
+    """Pressure drop across each valve, positive when the valve is open"""
+    return pressures[..., VALVE_UPSTREAM] - pressures[..., VALVE_DOWNSTREAM]
+
+
+def hermite(theta, step, V0, f0, V1, f1):
+    """Cubic Hermite interpolant between two accepted points, theta in [0, 1]"""
+    theta2 = theta * theta
+    theta3 = theta2 * theta
+    h00 = 2 * theta3 - 3 * theta2 + 1
+    h10 = theta3 - 2 * theta2 + theta
+    h01 = -2 * theta3 + 3 * theta2
+    h11 = theta3 - theta2
+    return h00 * V0 + h10 * step * f0 + h01 * V1 + h11 * step * f1
+
+
+class AdaptiveBeat:
+    """
+    Accepted steps of one adaptive cycle.
+        times       (nSteps + 1,) accepted time points (s)
+        Volumes     (nSteps + 1, 6)
+        Pressures   (nSteps + 1, 6)
+        dVdt        (nSteps + 1, 6) volume derivatives, used for dense output
+        events      list of (time, valve name, opens) in order of occurrence
+        nSteps, nRejected, nEvaluations     solver work
+    """
+
+    def __init__(self, times, Volumes, Pressures, dVdt, events, nSteps, nRejected, nEvaluations):
+        self.times = times
+        self.Volumes = Volumes
+        self.Pressures = Pressures
+        self.dVdt = dVdt
+        self.events = events
+        self.nSteps = nSteps
+        self.nRejected = nRejected
+        self.nEvaluations = nEvaluations
+
+    def interpolate(self, time_vector):
+        """Volumes at arbitrary times within the cycle from the piecewise cubic Hermite dense output"""
+        times = self.times
+        rows = np.clip(np.searchsorted(times, time_vector, side="right") - 1, 0, len(times) - 2)
+        step = times[rows + 1] - times[rows]
+        theta = ((time_vector - times[rows]) / step)[:, None]
+        return hermite(theta, step[:, None], self.Volumes[rows], self.dVdt[rows],
+                       self.Volumes[rows + 1], self.dVdt[rows + 1])
+
+
+class RK45Solver:
+    """Adaptive single cycle solver for one set of circulation parameters"""
+
+    def __init__(self, resistances, capacitances, ventricles, rtol=RTOL, atol=ATOL):
+        self.resistances = resistances
+        self.capacitances = capacitances
+        self.ventricles = ventricles
+        self.kernel = RK4Kernel(resistances, capacitances, ventricles)
+        self.rtol = rtol
+        self.atol = atol
+        self.pressures = np.zeros((6,))
+        self.nEvaluations = 0
+
+    def derivative(self, current_time, volumes, tes, out):
+        """dV/dt at (current_time, volumes); leaves the matching pressures in self.pressures"""
+        self.nEvaluations = self.nEvaluations + 1
+        self.kernel.pressures(volumes, activation(current_time, tes), self.pressures)
+        return self.kernel.derivative(self.pressures, out)
+
+    def gap(self, current_time, volumes, tes, valve):
+        """Pressure drop across one valve at (current_time, volumes)"""
+        self.nEvaluations = self.nEvaluations + 1
+        self.kernel.pressures(volumes, activation(current_time, tes), self.pressures)
+        return self.pressures[VALVE_UPSTREAM[valve]] - self.pressures[VALVE_DOWNSTREAM[valve]]
+
+    def locate_event(self, t, step, V0, f0, V1, f1, tes, valve, g0, g1):
+        """Time in (t, t + step] at which the valve gap changes sign, by Illinois regula falsi"""
+        if (g0 > 0) == (g1 > 0):
+            return t + step
+        a, b = 0.0, 1.0
+        side = 0
+        for _ in range(60):
+            theta = (a * g1 - b * g0) / (g1 - g0)
+            g = self.gap(t + theta * step, hermite(theta, step, V0, f0, V1, f1), tes, valve)
+            if (g > 0) == (g1 > 0):
+                b, g1 = theta, g
+                if side == 1:
+                    g0 = g0 / 2
+                side = 1
+            else:
+                a, g0 = theta, g
+                if side == -1:
+                    g1 = g1 / 2
+                side = -1
+            if (b - a) * step < 1e-12:
+                break
+        return t + b * step
+
+    def solve_beat(self, initial_volumes, cycle_length, tes, first_step=None):
+        """Integrates one cardiac cycle from initial_volumes at t = 0 to t = cycle_length"""
+        self.nEvaluations = 0
+        K = np.zeros((7, 6))
+        stage_volumes = np.zeros((6,))
+        min_step = 1e-12 * cycle_length
+        breakpoints = [b for b in (2 * tes, cycle_length) if b < cycle_length] + [cycle_length]
+
+        t = 0.0
+        V = np.array(initial_volumes, dtype=float)
+        self.derivative(t, V, tes, K[0])
+        P = self.pressures.copy()
+        valve_open = valve_gaps(P) > 0
+        step = first_step if first_step is not None else 1e-3 * cycle_length
+
+        times, Volumes, Pressures, dVdt = [t], [V.copy()], [P], [K[0].copy()]
+        events = []
+        nSteps = 0
+        nRejected = 0
+        target = None # located valve event to land on
+        target_valve = None
+        resume_step = step
+
+        while t < cycle_length:
+            if nSteps + nRejected > MAX_STEPS:
+                raise RuntimeError("RK45 exceeded " + str(MAX_STEPS) + " steps in one cycle")
+            stop = min(b for b in breakpoints if b > t)
+            if target is not None:
+                stop = min(stop, target)
+            step = min(step, stop - t)
+            if stop - (t + step) < min_step:
+                step = stop - t
+
+            # Dormand-Prince stages, K[6] is the derivative at the new point. Too large a trial step
+            # can overflow the EDPVR exponential; the error test below rejects it
+            with np.errstate(over="ignore", invalid="ignore"):
+                for s in range(1, 7):
+                    np.dot(STAGES[s, :s], K[:s], out=stage_volumes)
+                    stage_volumes *= step
+                    stage_volumes += V
+                    self.derivative(t + NODES[s] * step, stage_volumes, tes, K[s])
+            new_V = stage_volumes.copy()
+            new_P = self.pressures.copy()
+
+            # local error control
+            with np.errstate(over="ignore", invalid="ignore"):
+                err = step * np.dot(ERROR_WEIGHTS, K)
+                scale = self.atol + self.rtol * np.maximum(np.abs(V), np.abs(new_V))
+                err_norm = np.sqrt(np.mean((err / scale) ** 2))
+            if not err_norm <= 1: # also rejects overflow from too large a step
+                nRejected = nRejected + 1
+                step = step * (max(0.2, 0.9 * err_norm ** (-1/5)) if np.isfinite(err_norm) else 0.2)
+                continue
+
+            # valve switches within the step
+            new_gaps = valve_gaps(new_P)
+            switched = set(np.nonzero((new_gaps > 0) != valve_open)[0])
+            landed = target is not None and abs(t + step - target) < min_step
+            if switched and not landed:
+                old_gaps = valve_gaps(Pressures[-1])
+                roots = {k: self.locate_event(t, step, V, K[0], new_V, K[6], tes, k, old_gaps[k], new_gaps[k])
+                         for k in switched}
+                first = min(roots, key=roots.get)
+                if roots[first] - t > min_step and t + step - roots[first] > min_step:
+                    # step again, ending on the switch
+                    nRejected = nRejected + 1
+                    target, target_valve, resume_step = roots[first], first, step
+                    step = roots[first] - t
+                    continue
+            if landed:
+                switched.add(target_valve)
+            for k in sorted(switched):
+                valve_open[k] = not valve_open[k]
+                events.append((t + step, VALVE_NAMES[k], bool(valve_open[k])))
+
+            # accept
+            t = stop if stop - (t + step) < min_step else t + step
+            V = new_V
+            K[0] = K[6]
+            nSteps = nSteps + 1
+            times.append(t)
+            Volumes.append(new_V)
+            Pressures.append(new_P)
+            dVdt.append(K[6].copy())
+            step = step * min(5.0, 0.9 * max(err_norm, 1e-10) ** (-1/5))
+            if landed:
+                # carry on with the step size that was cut short by the event
+                step = max(step, resume_step)
+                target = None
+
+        return AdaptiveBeat(np.array(times), np.array(Volumes), np.array(Pressures), np.array(dVdt),
+                            events, nSteps, nRejected, self.nEvaluations)
+
+    def run_beat(self, Volumes, Pressures, time_vector, tes):
+        """
+        Same contract as RK4Kernel.run_beat: integrates adaptively from row 0 of Volumes and fills
+        every row of Volumes and Pressures (nRows, 6) on time_vector from the dense output.
+        Returns the AdaptiveBeat for step counts and valve events
+        """
+        beat = self.solve_beat(Volumes[0, :], time_vector[-1], tes)
+        Volumes[:, :] = beat.interpolate(time_vector)
+        epsilon = activation(np.asarray(time_vector, dtype=float), tes)[:, None]
+        grid_kernel = RK4Kernel(self.resistances, self.capacitances, self.ventricles, batch_shape=(len(time_vector),))
+        grid_kernel.pressures(Volumes, epsilon, Pressures)
+        return beat
+
+    def end_of_beat(self, initial_volumes, time_vector, tes):
+        """Volumes at the end of the cycle for every row of initial_volumes (..., 6), one solve per row"""
+        initial_volumes = np.asarray(initial_volumes, dtype=float)
+        ends = [self.solve_beat(V, time_vector[-1], tes).Volumes[-1] for V in initial_volumes.reshape(-1, 6)]
+        return np.reshape(ends, initial_volumes.shape)
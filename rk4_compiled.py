@@ -0,0 +1,166 @@
+"""
+rk4_compiled.py
+Numba compiled RK4 cycle. The whole beat loop, including the activation function, the valve gated
+flows and the pressure calculation, runs inside one nopython function over preallocated Volumes and
+Pressures arrays, with the same stage evaluation as rk4 and RK4Kernel.
+
+Numba is optional. When it is not installed CompiledRK4 warns (RuntimeWarning) and steps with the
+NumPy RK4Kernel instead. Compiled functions are cached on disk (cache=True), so only the first process
+pays the JIT cost; compile_stats() reports the cache hits and misses of this process.
+
+The compiled loop is generic over the netlist: the connection endpoints (source and target columns),
+resistances, valve backflow resistances and pressure coefficients of a circuit.Circuit are passed in as
+arrays, so the 6 compartment loop, mitral regurgitation and the 7 compartment infarct circuit all run
+compiled (CompiledRK4.from_circuit).
+"""
+import math
+import warnings
+import numpy as np
+from DogPVSimulation_6Comp_Python.rk4_kernel import RK4Kernel
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+
+
+def _activation(current_time, tes):
+    if current_time < 2 * tes:
+        return 0.5 * (1 - math.cos(math.pi * current_time / tes))
+    return 0.0
+
+
+def _pressures(volumes, epsilon, E, C, A, B, V0, active, passive, out):
+    for j in range(len(out)):
+        x = volumes[j] - V0[j]
+        edp = B[j] * (math.exp(A[j] * x) - 1)
+        e = active[j] * epsilon + passive[j]
+        out[j] = e * (E[j] * x / C[j] - edp) + edp
+
+
+def _derivative(pressures, source, target, R, backflow, is_valve, out):
+    for j in range(len(out)):
+        out[j] = 0.0
+    for k in range(len(R)):
+        dp = pressures[source[k]] - pressures[target[k]]
+        if is_valve[k] and dp < 0:
+            q = dp / backflow[k] # backflow = inf: closed valve
+        else:
+            q = dp / R[k]
+        out[source[k]] -= q
+        out[target[k]] += q
+
+
+def _step(volumes, pressures, step_size, epsilon, source, target, R, backflow, is_valve, E, C, A, B, V0,
+          active, passive, k, stage, out_volumes, out_pressures):
+    half_step = step_size / 2
+    sixth_step = step_size / 6
+    n = len(volumes)
+    _derivative(pressures, source, target, R, backflow, is_valve, k[0])
+    for j in range(n):
+        stage[j] = pressures[j] + half_step * k[0, j]
+    _derivative(stage, source, target, R, backflow, is_valve, k[1])
+    for j in range(n):
+        stage[j] = pressures[j] + half_step * k[1, j]
+    _derivative(stage, source, target, R, backflow, is_valve, k[2])
+    for j in range(n):
+        stage[j] = pressures[j] + step_size * k[2, j]
+    _derivative(stage, source, target, R, backflow, is_valve, k[3])
+    for j in range(n):
+        out_volumes[j] = volumes[j] + sixth_step * (k[0, j] + 2 * k[1, j] + 2 * k[2, j] + k[3, j])
+    _pressures(out_volumes, epsilon, E, C, A, B, V0, active, passive, out_pressures)
+
+
+def _run_beat(Volumes, Pressures, time_vector, tes, source, target, R, backflow, is_valve, E, C, A, B, V0,
+              active, passive):
+    step_size = time_vector[1] - time_vector[0]
+    n = Volumes.shape[1]
+    k = np.zeros((4, n))
+    stage = np.zeros(n)
+    for i in range(1, len(time_vector)):
+        _step(Volumes[i - 1], Pressures[i - 1], step_size, _activation(time_vector[i], tes), source, target, R,
+              backflow, is_valve, E, C, A, B, V0, active, passive, k, stage, Volumes[i], Pressures[i])
+
+
+def _end_of_beat(initial_volumes, time_vector, tes, source, target, R, backflow, is_valve, E, C, A, B, V0,
+                 active, passive):
+    step_size = time_vector[1] - time_vector[0]
+    n = len(initial_volumes)
+    k = np.zeros((4, n))
+    stage = np.zeros(n)
+    volumes = np.zeros((2, n))
+    pressures = np.zeros((2, n))
+    volumes[0] = initial_volumes
+    _pressures(volumes[0], 0.0, E, C, A, B, V0, active, passive, pressures[0])
+    for i in range(1, len(time_vector)):
+        old = (i - 1) % 2
+        new = i % 2
+        _step(volumes[old], pressures[old], step_size, _activation(time_vector[i], tes), source, target, R,
+              backflow, is_valve, E, C, A, B, V0, active, passive, k, stage, volumes[new], pressures[new])
+    return volumes[(len(time_vector) - 1) % 2].copy()
+
+
+if NUMBA_AVAILABLE:
+    _activation = numba.njit(cache=True)(_activation)
+    _pressures = numba.njit(cache=True)(_pressures)
+    _derivative = numba.njit(cache=True)(_derivative)
+    _step = numba.njit(cache=True)(_step)
+    _run_beat = numba.njit(cache=True)(_run_beat)
+    _end_of_beat = numba.njit(cache=True)(_end_of_beat)
+
+
+def compile_stats():
+    """Per compiled entry point: on-disk cache hits and misses (JIT compilations) in this process"""
+    if not NUMBA_AVAILABLE:
+        return {}
+    return {name: {"cache_hits": sum(function.stats.cache_hits.values()),
+                   "cache_misses": sum(function.stats.cache_misses.values())}
+            for name, function in (("run_beat", _run_beat), ("end_of_beat", _end_of_beat))}
+
+
+class CompiledRK4:
+    """
+    Same interface as RK4Kernel (run_beat, end_of_beat) backed by the compiled beat loop, or by
+    RK4Kernel itself, with a RuntimeWarning, when Numba is not installed
+    """
+
+    def __init__(self, resistances, capacitances, ventricles, batch_shape=()):
+        self.compile(canine_circuit(resistances, capacitances, ventricles), batch_shape)
+
+    @classmethod
+    def from_circuit(cls, circuit, batch_shape=()):
+        """Compiled stepper for any circuit.Circuit with unbatched parameters"""
+        kernel = cls.__new__(cls)
+        kernel.compile(circuit, batch_shape)
+        return kernel
+
+    def compile(self, circuit, batch_shape):
+        self.batch_shape = tuple(batch_shape)
+        self.nCompartments = circuit.nCompartments
+        if not NUMBA_AVAILABLE:
+            warnings.warn("Numba is not installed, rk4_jit steps with the uncompiled RK4Kernel", RuntimeWarning)
+            self.fallback = RK4Kernel.from_circuit(circuit, batch_shape=batch_shape)
+            return
+        self.fallback = None
+        self.coefficients = (circuit.source, circuit.target, circuit.resistance, circuit.backflow, circuit.is_valve,
+                             circuit.E, circuit.C, circuit.A, circuit.B, circuit.V0, circuit.active, circuit.passive)
+
+    def run_beat(self, Volumes, Pressures, time_vector, tes):
+        """Fills rows 1: of Volumes and Pressures (nRows, nCompartments) by stepping from row 0 across time_vector"""
+        if self.fallback is not None:
+            return self.fallback.run_beat(Volumes, Pressures, time_vector, tes)
+        _run_beat(Volumes, Pressures, np.asarray(time_vector, dtype=float), float(tes), *self.coefficients)
+        return Volumes, Pressures
+
+    def end_of_beat(self, initial_volumes, time_vector, tes):
+        """Volumes at the end of the cycle for every row of initial_volumes (..., nCompartments)"""
+        if self.fallback is not None:
+            return self.fallback.end_of_beat(initial_volumes, time_vector, tes)
+        initial_volumes = np.asarray(initial_volumes, dtype=float)
+        time_vector = np.asarray(time_vector, dtype=float)
+        ends = [_end_of_beat(np.ascontiguousarray(V), time_vector, float(tes), *self.coefficients)
+                for V in initial_volumes.reshape(-1, self.nCompartments)]
+        return np.reshape(ends, initial_volumes.shape)
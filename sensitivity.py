@@ -0,0 +1,204 @@
+"""
+sensitivity.py
+Forward sensitivities of the simulated beat with respect to the model parameters. SensitivityKernel
+differentiates every RK4 step of RK4Kernel (including its stage evaluation at pressures + h/2 * k)
+and integrates dV/dtheta and dV/dV0 alongside the state, so one beat gives the waveforms and their
+exact derivatives.
+
+simulate_with_sensitivities finds the periodic steady state and returns the steady state beat and
+its sensitivities in one run. The dV/dV0 columns are the monodromy matrix of the beat, used both for
+Newton iterations to a tight periodic state and for the implicit derivative of the periodic initial
+volumes, dV0/dtheta = -(dV(T)/dV0 - I)^-1 dV(T)/dtheta, with total volume held fixed.
+
+Parameters are entries of the set_initial_conditions arrays, named as in waveform_store.PARAMETER_COLUMNS
+
+Name                                Array entry
+Rvp, Rcs, Ras, Rvs, Rcp, Rap        resistances[0:6]
+Cvp, Cas, Cvs, Cap                  capacitances[0:4]
+LV_A, LV_B, LV_Ees, LV_V0           ventricles[0, :]
+RV_A, RV_B, RV_Ees, RV_V0           ventricles[1, :]
+"""
+import numpy as np
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+from DogPVSimulation_6Comp_Python.rk4_kernel import activation
+from DogPVSimulation_6Comp_Python.steady_state import periodic_steady_state
+
+# parameter name: (coefficient of the compiled circuit, compartment column or connection)
+PARAMETERS = {"Rvp": ("R", 1), "Rcs": ("R", 2), "Ras": ("R", 3), "Rvs": ("R", 4), "Rcp": ("R", 5), "Rap": ("R", 0),
+              "Cvp": ("C", 0), "Cas": ("C", 2), "Cvs": ("C", 3), "Cap": ("C", 5),
+              "LV_A": ("A", 1), "LV_B": ("B", 1), "LV_Ees": ("E", 1), "LV_V0": ("V0", 1),
+              "RV_A": ("A", 4), "RV_B": ("B", 4), "RV_Ees": ("E", 4), "RV_V0": ("V0", 4)}
+PRESSURE_COEFFICIENTS = ["E", "C", "A", "B", "V0"]
+
+
+def get_parameters(resistances, capacitances, ventricles, names):
+    """Values of the named parameters"""
+    arrays = {"R": resistances, "C": capacitances, "V": ventricles}
+    return np.array([arrays[kind][index] for kind, index in (array_entry(name) for name in names)], dtype=float)
+
+
+def set_parameters(resistances, capacitances, ventricles, names, values):
+    """Copies of the arrays with the named parameters set to values"""
+    arrays = {"R": np.array(resistances, dtype=float), "C": np.array(capacitances, dtype=float),
+              "V": np.array(ventricles, dtype=float)}
+    for name, value in zip(names, values):
+        kind, index = array_entry(name)
+        arrays[kind][index] = value
+    return arrays["R"], arrays["C"], arrays["V"]
+
+
+def array_entry(name):
+    """("R" | "C" | "V", index) of a parameter in resistances, capacitances or ventricles"""
+    if name not in PARAMETERS:
+        raise ValueError("Unknown parameter: " + str(name))
+    coefficient, index = PARAMETERS[name]
+    if coefficient == "R":
+        return "R", [5, 0, 1, 2, 3, 4][index]
+    if coefficient == "C":
+        return "C", [0, 2, 3, 5].index(index)
+    return "V", ((0 if index == 1 else 1), ["A", "B", "E", "V0"].index(coefficient))
+
+
+class SensitivityKernel:
+    """
+    RK4 stepper for the state and its sensitivities S = dV/d[theta, V0] of shape (6, nParameters + 6):
+    the first columns are the named parameters, the last 6 the initial volumes
+    """
+
+    def __init__(self, resistances, capacitances, ventricles, names):
+        self.names = list(names)
+        self.circuit = canine_circuit(resistances, capacitances, ventricles)
+        self.nParameters = len(self.names)
+        self.nColumns = self.nParameters + 6
+        self.pressure_columns = []
+        self.flow_columns = []
+        for column, name in enumerate(self.names):
+            if name not in PARAMETERS:
+                raise ValueError("Unknown parameter: " + str(name))
+            coefficient, index = PARAMETERS[name]
+            if coefficient == "R":
+                self.flow_columns.append((column, index))
+            else:
+                self.pressure_columns.append((column, PRESSURE_COEFFICIENTS.index(coefficient), index))
+        self.flow_columns = np.array(self.flow_columns, dtype=int).reshape(-1, 2)
+        self.pressure_columns = np.array(self.pressure_columns, dtype=int).reshape(-1, 3)
+
+    def pressures(self, volumes, epsilon):
+        """Pressures, dP/dV (diagonal) and the partial derivatives dP/dtheta (6, nColumns)"""
+        c = self.circuit
+        x = volumes - c.V0
+        growth = np.exp(c.A * x)
+        edp = c.B * (growth - 1)
+        e = c.active * epsilon + c.passive
+        pressures = e * (c.E * x / c.C - edp) + edp
+        dPdV = e * c.E / c.C + (1 - e) * c.B * c.A * growth
+
+        partials = np.array([e * x / c.C, -e * c.E * x / c.C ** 2, (1 - e) * c.B * x * growth, (1 - e) * (growth - 1),
+                             -dPdV]) # E, C, A, B, V0
+        dPdtheta = np.zeros((6, self.nColumns))
+        columns, coefficients, compartments = self.pressure_columns.T
+        dPdtheta[compartments, columns] = partials[coefficients, compartments]
+        return pressures, dPdV, dPdtheta
+
+    def derivative(self, pressures):
+        """dV/dt, its Jacobian dD/dP (6, 6) and the partial derivatives dD/dtheta (6, nColumns)"""
+        c = self.circuit
+        dp = pressures @ c.pressure_drop
+        q = np.maximum(dp, c.floor) / c.resistance
+        conductance = (dp > c.floor) / c.resistance
+        if c.has_backflow:
+            q_back = np.minimum(dp, 0) / c.backflow
+            conductance = conductance + (dp < 0) / c.backflow
+            dVdt = (q + q_back) @ c.incidence
+        else:
+            dVdt = q @ c.incidence
+        jacobian = ((c.pressure_drop * conductance) @ c.incidence).T
+
+        dDdtheta = np.zeros((6, self.nColumns))
+        columns, connections = self.flow_columns.T
+        dDdtheta[:, columns] = (c.incidence[connections] * (-q[connections] / c.resistance[connections])[:, None]).T
+        return dVdt, jacobian, dDdtheta
+
+    def step(self, volumes, pressures, S, SP, step_size, epsilon):
+        """
+        One RK4 step of the state and of S = dV/dtheta, SP = dP/dtheta, with the stages of RK4Kernel.
+        Returns the new volumes, pressures, S and SP
+        """
+        k, K = [], []
+        stage, stage_S = pressures, SP
+        for fraction in (1/2, 1/2, 1, None):
+            dVdt, jacobian, dDdtheta = self.derivative(stage)
+            k.append(dVdt)
+            K.append(jacobian @ stage_S + dDdtheta)
+            if fraction is not None:
+                stage = pressures + fraction * step_size * dVdt
+                stage_S = SP + fraction * step_size * K[-1]
+
+        new_volumes = volumes + step_size / 6 * (k[0] + 2 * k[1] + 2 * k[2] + k[3])
+        new_S = S + step_size / 6 * (K[0] + 2 * K[1] + 2 * K[2] + K[3])
+        new_pressures, dPdV, dPdtheta = self.pressures(new_volumes, epsilon)
+        new_SP = dPdV[:, None] * new_S + dPdtheta
+        return new_volumes, new_pressures, new_S, new_SP
+
+    def run_beat(self, Volumes, Pressures, time_vector, tes):
+        """
+        Fills Volumes and Pressures (nRows, 6) from row 0 across time_vector as RK4Kernel.run_beat does
+        (row 0 pressures included). Returns dVolumes and dPressures (nRows, 6, nColumns), starting
+        from dV/dV0 = I
+        """
+        nRows = len(time_vector)
+        step_size = time_vector[1] - time_vector[0]
+        dVolumes = np.zeros((nRows, 6, self.nColumns))
+        dPressures = np.zeros((nRows, 6, self.nColumns))
+        dVolumes[0, :, self.nParameters:] = np.eye(6)
+        Pressures[0], dPdV, dPdtheta = self.pressures(Volumes[0], activation(time_vector[0], tes))
+        dPressures[0] = dPdV[:, None] * dVolumes[0] + dPdtheta
+        for i in range(1, nRows):
+            Volumes[i], Pressures[i], dVolumes[i], dPressures[i] = self.step(
+                Volumes[i - 1], Pressures[i - 1], dVolumes[i - 1], dPressures[i - 1], step_size,
+                activation(time_vector[i], tes))
+        return dVolumes, dPressures
+
+
+def periodic_derivative(dVolumes, dPressures, nParameters):
+    """
+    Sensitivities of the periodic beat from those of a beat started at its periodic initial volumes:
+    dV0/dtheta solves (dV(T)/dV0 - I) dV0/dtheta = -dV(T)/dtheta with sum(dV0/dtheta) = 0.
+    Returns dVolumes and dPressures (nRows, 6, nParameters)
+    """
+    monodromy = dVolumes[-1, :, nParameters:]
+    system = np.vstack((monodromy - np.eye(6), np.ones((1, 6))))
+    rhs = np.vstack((-dVolumes[-1, :, :nParameters], np.zeros((1, nParameters))))
+    dV0 = np.linalg.lstsq(system, rhs, rcond=None)[0]
+    return (dVolumes[..., :nParameters] + dVolumes[..., nParameters:] @ dV0,
+            dPressures[..., :nParameters] + dPressures[..., nParameters:] @ dV0)
+
+
+def simulate_with_sensitivities(resistances, capacitances, ventricles, time_vector, tes, initial_volumes, names,
+                                cutoff=1e-6, max_iterations=20):
+    """
+    Steady state beat and its sensitivities to the named parameters. The periodic initial volumes are
+    found with Anderson shooting to simulate_heart_beat's 0.1 ml, then refined to cutoff (ml) by Newton
+    iterations with the exact monodromy matrix of each sensitivity beat.
+    Returns Volumes, Pressures (nRows, 6), dVolumes, dPressures (nRows, 6, nParameters) and the number
+    of beats integrated, sensitivity beats included
+    """
+    kernel = SensitivityKernel(resistances, capacitances, ventricles, names)
+    Volumes = np.zeros((len(time_vector), 6))
+    Pressures = np.zeros((len(time_vector), 6))
+    volumes, _, nBeats = periodic_steady_state(resistances, capacitances, ventricles, time_vector, tes,
+                                               initial_volumes, method="anderson")
+
+    for _ in range(max_iterations):
+        Volumes[0] = volumes
+        dVolumes, dPressures = kernel.run_beat(Volumes, Pressures, time_vector, tes)
+        nBeats = nBeats + 1
+        residual = Volumes[-1] - Volumes[0]
+        if np.all(abs(residual) <= cutoff):
+            break
+        monodromy = dVolumes[-1, :, kernel.nParameters:]
+        system = np.vstack((monodromy - np.eye(6), np.ones((1, 6))))
+        volumes = volumes + np.linalg.lstsq(system, np.append(-residual, 0), rcond=None)[0]
+
+    dVolumes, dPressures = periodic_derivative(dVolumes, dPressures, kernel.nParameters)
+    return Volumes, Pressures, dVolumes, dPressures, nBeats
@@ -0,0 +1,440 @@
+"""
+service.py
+Local simulation service. Tools that would each import and run the model in process (dashboards,
+fitting jobs, notebooks) share one server instead: requests go over HTTP on localhost, or a Unix
+socket, to an asyncio server that runs set_initial_conditions -> simulate_heart_beat on a process
+pool. Concurrent identical requests are coalesced onto one computation and finished responses are
+kept in an LRU cache keyed on the canonical request, so each distinct request is simulated once. The
+cache is bounded by entries and by the total size of the encoded responses.
+
+Endpoint            Response
+POST /simulate      steady state beat: decimated time, Volumes, Pressures, Flows, Valves, metrics, convergence
+POST /steady_state  steady state initial volumes, metrics and convergence
+POST /metrics       calculate_metrics of the steady state beat and convergence
+POST /stream        stream_beats records as JSON lines (chunked transfer), nBeats beats computed chunk_beats
+                    at a time, starting from the set_initial_conditions volumes (steady_state="fixed_point")
+                    or the periodic steady state; streams are neither cached nor coalesced
+GET  /status        pending jobs, queue depth, cache and coalescing counters, latency per endpoint
+
+Request bodies are JSON, {"parameters": {set_initial_conditions name: value}, "options": {...}}, both
+optional; parameters must be finite and within PARAMETER_RANGES; options are integrator, steady_state, nRows (2 to MAX_ROWS) and decimation (1 to nRows)
+(see DEFAULT_OPTIONS), plus nBeats and chunk_beats for /stream. Errors are returned as {"error": message} with status 400 (bad
+request), 404 (unknown endpoint) or 500.
+
+    python -m DogPVSimulation_6Comp_Python.service --port 8765
+    curl -d '{"parameters": {"HR": 100}}' http://127.0.0.1:8765/metrics
+
+    metrics = call("metrics", {"parameters": {"HR": 100}}, port=8765)["metrics"]
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.simulate_heart_beat import simulate_heart_beat
+from DogPVSimulation_6Comp_Python.calculate_metrics import calculate_metrics
+from DogPVSimulation_6Comp_Python.constants import PARAMETERS, PARAMETER_RANGES, DEFAULT_OPTIONS as RUN_OPTIONS
+from DogPVSimulation_6Comp_Python.integrators import INTEGRATORS
+from DogPVSimulation_6Comp_Python.steady_state import STEADY_STATES, periodic_steady_state
+from DogPVSimulation_6Comp_Python.stream_beats import stream_beats
+from DogPVSimulation_6Comp_Python.instrumentation import to_json
+
+HOST = "127.0.0.1"
+PORT = 8765
+ENDPOINTS = ["simulate", "steady_state", "metrics"]
+DEFAULT_OPTIONS = dict(RUN_OPTIONS, decimation=10) # the run defaults of the command line plus decimation
+STREAM_OPTIONS = {"nBeats": 10, "chunk_beats": 2}
+MAX_ROWS = 100000 # rows per beat, bounds the memory and the response size of one request
+MAX_CACHE_ENTRIES = 1024
+MAX_CACHE_BYTES = 256 << 20 # total size of the cached responses
+MAX_BODY = 1 << 20 # bytes
+LATENCY_WINDOW = 1000 # requests per endpoint kept for the latency percentiles
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+def parse_request(body, stream=False):
+    """(parameters, options) of a JSON request body with the default options filled in, ValueError if invalid"""
+    request = json.loads(body or b"{}")
+    if not isinstance(request, dict):
+        raise ValueError("Request body must be a JSON object")
+    unknown = [key for key in request if key not in ("parameters", "options")]
+    if unknown:
+        raise ValueError("Unknown request fields: " + str(unknown))
+
+    parameters = request.get("parameters") or {}
+    unknown = [name for name in parameters if name not in PARAMETERS]
+    if unknown:
+        raise ValueError("Unknown parameters: " + str(unknown))
+    try:
+        parameters = {name: float(parameters[name]) for name in sorted(parameters)}
+    except (TypeError, ValueError):
+        raise ValueError("Parameter values must be numbers: " + str(parameters))
+    for name, value in parameters.items():
+        low, high = PARAMETER_RANGES[name]
+        if not low <= value <= high: # also false for NaN, so nothing outside the ranges reaches a worker
+            raise ValueError("Parameter " + name + " must be between " + str(low) + " and " + str(high) + ": "
+                             + repr(value))
+
+    defaults = dict(DEFAULT_OPTIONS, **(STREAM_OPTIONS if stream else {}))
+    options = request.get("options") or {}
+    unknown = [name for name in options if name not in defaults]
+    if unknown:
+        raise ValueError("Unknown options: " + str(unknown))
+    options = dict(defaults, **options)
+    if options["integrator"] not in INTEGRATORS:
+        raise ValueError("Unknown integrator: " + str(options["integrator"]))
+    if options["steady_state"] not in STEADY_STATES:
+        raise ValueError("Unknown steady state method: " + str(options["steady_state"]))
+    for name in defaults:
+        if name in ("integrator", "steady_state"):
+            continue
+        if isinstance(options[name], bool) or not isinstance(options[name], int) or options[name] < 1:
+            raise ValueError("Option " + name + " must be a positive integer: " + repr(options[name]))
+    if not 2 <= options["nRows"] <= MAX_ROWS:
+        raise ValueError("Option nRows must be between 2 and " + str(MAX_ROWS) + ": " + str(options["nRows"]))
+    if options["decimation"] > options["nRows"]:
+        raise ValueError("Option decimation must not exceed nRows: " + str(options["decimation"]))
+    return parameters, options
+
+
+def encode(value):
+    return json.dumps(value, default=to_json).encode()
+
+
+def run_pipeline(endpoint, parameters, options):
+    """Worker: one request through set_initial_conditions -> simulate_heart_beat; returns (result, compute time)"""
+    start = time.perf_counter()
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(
+        **parameters, nRows=options["nRows"])
+    Volumes, Pressures, Valves, Flows, convergence = simulate_heart_beat(
+        resistances, capacitances, ventricles, time_vector, tes, Volumes, integrator=options["integrator"],
+        steady_state=options["steady_state"], return_convergence=True)
+    result = {"metrics": calculate_metrics(Volumes, Pressures, Valves, time_vector),
+              "convergence": convergence.to_dict()}
+    if endpoint == "steady_state":
+        result["initial_volumes"] = Volumes[0, :]
+    if endpoint == "simulate":
+        decimation = options["decimation"]
+        result.update(time=time_vector[::decimation], Volumes=Volumes[::decimation], Pressures=Pressures[::decimation],
+                      Flows=Flows[::decimation], Valves=Valves[::decimation])
+    return result, time.perf_counter() - start
+
+
+def run_stream_chunk(parameters, options, initial_volumes, first_beat, start_time, nBeats):
+    """
+    Worker: nBeats stream_beats records continuing from initial_volumes (from the start of the stream
+    when None), numbered from first_beat. Returns ((records, start time of the next beat), compute time)
+    """
+    start = time.perf_counter()
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(
+        **parameters, nRows=options["nRows"])
+    if initial_volumes is None:
+        initial_volumes = Volumes[0, :]
+        if options["steady_state"] != "fixed_point":
+            initial_volumes, _, _ = periodic_steady_state(resistances, capacitances, ventricles, time_vector, tes,
+                                                          initial_volumes, method=options["steady_state"],
+                                                          integrator=options["integrator"])
+    records = list(stream_beats(resistances, capacitances, ventricles, time_vector, tes, initial_volumes,
+                                nBeats=nBeats, decimation=options["decimation"], integrator=options["integrator"]))
+    for record in records:
+        record.beat = record.beat + first_beat
+        record.start_time = record.start_time + start_time
+    return (records, start_time + nBeats * time_vector[-1]), time.perf_counter() - start
+
+
+def start_worker():
+    """Worker: no-op run once per worker at start up, so the first requests do not pay the process start"""
+    return os.getpid()
+
+
+def percentiles(values):
+    """count, mean, p50, p95 and max (s) of a window of latencies"""
+    if not values:
+        return {"count": 0}
+    values = np.array(values)
+    return {"count": len(values), "mean": float(np.mean(values)), "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)), "max": float(np.max(values))}
+
+
+async def read_request(reader):
+    """(method, path, body) of one HTTP request, None if the connection closed first"""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise ValueError("Malformed request line: " + repr(line))
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise ValueError("Request body over " + str(MAX_BODY) + " bytes")
+    return method, path.split("?")[0], await reader.readexactly(length)
+
+
+def response_head(status, content_type="application/json", length=None):
+    head = "HTTP/1.1 " + str(status) + " " + REASONS[status] + "\r\nContent-Type: " + content_type + "\r\n"
+    head += "Transfer-Encoding: chunked\r\n" if length is None else "Content-Length: " + str(length) + "\r\n"
+    return (head + "Connection: close\r\n\r\n").encode()
+
+
+def http_chunk(data):
+    return format(len(data), "x").encode() + b"\r\n" + data + b"\r\n"
+
+
+class SimulationService:
+    """
+    State of the asyncio server
+        pool            ProcessPoolExecutor running the pipeline, nWorkers processes
+        cache           LRU {request key: encoded response} of up to max_cache_entries, holding up to
+                        max_cache_bytes of responses (larger responses are not cached)
+        cache_bytes     total size of the cached responses
+        in_flight       {request key: asyncio.Task} of computations not finished yet, awaited by every
+                        identical request that arrives meanwhile
+        pending         jobs submitted to the pool and not finished (queued or running)
+        counters        requests, cache_hits, coalesced, computed, streams, errors
+        latencies       {endpoint: recent request latencies (s), arrival to response sent}
+        queue_waits     recent time jobs spent queued for a worker (s)
+    """
+
+    def __init__(self, nWorkers=None, max_cache_entries=MAX_CACHE_ENTRIES, max_cache_bytes=MAX_CACHE_BYTES):
+        self.nWorkers = nWorkers or os.cpu_count() or 1
+        self.max_cache_entries = max_cache_entries
+        self.max_cache_bytes = max_cache_bytes
+        self.pool = None
+        self.server = None
+        self.cache = collections.OrderedDict()
+        self.cache_bytes = 0
+        self.in_flight = {}
+        self.pending = 0
+        self.counters = dict.fromkeys(["requests", "cache_hits", "coalesced", "computed", "streams", "errors"], 0)
+        self.latencies = {endpoint: collections.deque(maxlen=LATENCY_WINDOW) for endpoint in ENDPOINTS + ["stream"]}
+        self.queue_waits = collections.deque(maxlen=LATENCY_WINDOW)
+
+    async def start(self, host=HOST, port=PORT, path=None):
+        """Starts the workers and listens on host:port (port 0 picks a free one), or on the Unix socket path"""
+        self.pool = ProcessPoolExecutor(max_workers=self.nWorkers)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, start_worker) for _ in range(self.nWorkers)))
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path=path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.pool.shutdown()
+
+    async def serve_forever(self):
+        await self.server.serve_forever()
+
+    def status(self):
+        return {"workers": self.nWorkers, "pending": self.pending, "queue_depth": max(0, self.pending - self.nWorkers),
+                "in_flight": len(self.in_flight), "cache_entries": len(self.cache), "cache_bytes": self.cache_bytes,
+                "counters": dict(self.counters),
+                "queue_wait": percentiles(self.queue_waits),
+                "latency": {endpoint: percentiles(values) for endpoint, values in self.latencies.items()}}
+
+    async def submit(self, function, *args):
+        """Runs function(*args) -> (result, compute time) on the pool, recording the time it was queued"""
+        self.pending = self.pending + 1
+        start = time.perf_counter()
+        try:
+            result, compute_time = await asyncio.get_running_loop().run_in_executor(self.pool, function, *args)
+        finally:
+            self.pending = self.pending - 1
+        self.queue_waits.append(max(0.0, time.perf_counter() - start - compute_time))
+        return result
+
+    async def compute(self, endpoint, parameters, options):
+        """Encoded response to a request: from the cache, from an identical computation in flight, or computed"""
+        key = json.dumps([endpoint, parameters, options], sort_keys=True)
+        self.counters["requests"] += 1
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.counters["cache_hits"] += 1
+            return self.cache[key]
+        if key in self.in_flight:
+            self.counters["coalesced"] += 1
+        else:
+            self.in_flight[key] = asyncio.ensure_future(self.run(key, endpoint, parameters, options))
+        # shielded, so a requester going away does not cancel the computation of the others
+        return await asyncio.shield(self.in_flight[key])
+
+    async def run(self, key, endpoint, parameters, options):
+        try:
+            response = encode(await self.submit(run_pipeline, endpoint, parameters, options))
+        finally:
+            del self.in_flight[key]
+        self.counters["computed"] += 1
+        if len(response) <= self.max_cache_bytes:
+            self.cache[key] = response
+            self.cache_bytes = self.cache_bytes + len(response)
+        while len(self.cache) > self.max_cache_entries or self.cache_bytes > self.max_cache_bytes:
+            _, evicted = self.cache.popitem(last=False)
+            self.cache_bytes = self.cache_bytes - len(evicted)
+        return response
+
+    async def stream(self, writer, parameters, options):
+        """Writes the beats of a /stream request as JSON lines, one HTTP chunk per beat, as each chunk of beats finishes"""
+        self.counters["streams"] += 1
+        writer.write(response_head(200, "application/x-ndjson"))
+        volumes, start_time = None, 0.0
+        try:
+            for first_beat in range(0, options["nBeats"], options["chunk_beats"]):
+                nBeats = min(options["chunk_beats"], options["nBeats"] - first_beat)
+                records, start_time = await self.submit(run_stream_chunk, parameters, options, volumes, first_beat,
+                                                        start_time, nBeats)
+                for record in records:
+                    writer.write(http_chunk(encode(record.to_dict()) + b"\n"))
+                await writer.drain()
+                volumes = records[-1].end_volumes
+        except ConnectionError:
+            raise
+        except Exception as error:
+            # the status line is already sent, so a failure ends the stream with an error line (no "beat")
+            self.counters["errors"] += 1
+            writer.write(http_chunk(encode({"error": str(error)}) + b"\n"))
+        writer.write(b"0\r\n\r\n")
+
+    async def handle(self, reader, writer):
+        """One connection: a single request and its response"""
+        start = time.perf_counter()
+        endpoint = None
+        try:
+            request = await read_request(reader)
+            if request is None:
+                return
+            method, path, body = request
+            endpoint = path.strip("/")
+            if method == "GET" and endpoint == "status":
+                response = encode(self.status())
+            elif method == "POST" and endpoint in ENDPOINTS:
+                response = await self.compute(endpoint, *parse_request(body))
+            elif method == "POST" and endpoint == "stream":
+                await self.stream(writer, *parse_request(body, stream=True))
+                response = None
+            else:
+                raise LookupError("Unknown endpoint: " + method + " " + path)
+            if response is not None:
+                writer.write(response_head(200, length=len(response)) + response)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        except Exception as error:
+            self.counters["errors"] += 1
+            status = 400 if isinstance(error, ValueError) else 404 if isinstance(error, LookupError) else 500
+            response = encode({"error": str(error)})
+            writer.write(response_head(status, length=len(response)) + response)
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            if endpoint in self.latencies:
+                self.latencies[endpoint].append(time.perf_counter() - start)
+
+
+async def serve(host=HOST, port=PORT, path=None, nWorkers=None, max_cache_entries=MAX_CACHE_ENTRIES,
+                max_cache_bytes=MAX_CACHE_BYTES):
+    """Runs the service until cancelled"""
+    service = SimulationService(nWorkers, max_cache_entries, max_cache_bytes)
+    address = await service.start(host, port, path)
+    print("Simulation service on " + str(address) + " with " + str(service.nWorkers) + " workers", flush=True)
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+async def open_request(endpoint, payload, host, port, path):
+    """Sends one request; returns (status, reader, writer, chunked) once the response head is read"""
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    body = b"" if payload is None else json.dumps(payload).encode()
+    method = "GET" if endpoint == "status" else "POST"
+    writer.write((method + " /" + endpoint + " HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                  + "Content-Length: " + str(len(body)) + "\r\nConnection: close\r\n\r\n").encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, reader, writer, headers.get("transfer-encoding") == "chunked"
+
+
+async def request(endpoint, payload=None, host=HOST, port=PORT, path=None):
+    """Decoded JSON response of the service to one request (payload, a dict, as in the module docstring)"""
+    status, reader, writer, _ = await open_request(endpoint, payload, host, port, path)
+    try:
+        response = json.loads(await reader.read())
+    finally:
+        writer.close()
+    if status != 200:
+        raise ValueError("Service error " + str(status) + ": " + str(response.get("error")))
+    return response
+
+
+async def stream(payload=None, host=HOST, port=PORT, path=None):
+    """Yields the BeatRecord dicts of a /stream request as they arrive"""
+    status, reader, writer, chunked = await open_request("stream", payload, host, port, path)
+    try:
+        if status != 200 or not chunked:
+            raise ValueError("Service error " + str(status) + ": " + str(json.loads(await reader.read()).get("error")))
+        buffer = b""
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            if size == 0:
+                break
+            buffer = buffer + (await reader.readexactly(size + 2))[:-2]
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                record = json.loads(line)
+                if "beat" not in record:
+                    raise ValueError("Service error: " + str(record["error"]))
+                yield record
+    finally:
+        writer.close()
+
+
+def call(endpoint, payload=None, host=HOST, port=PORT, path=None):
+    """Blocking request, for scripts outside an event loop"""
+    return asyncio.run(request(endpoint, payload, host, port, path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of host:port")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--cache-entries", type=int, default=MAX_CACHE_ENTRIES)
+    parser.add_argument("--cache-bytes", type=int, default=MAX_CACHE_BYTES, help="total size of cached responses")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.cache_entries, args.cache_bytes))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -3,23 +3,27 @@ set_initial_conditions.py
 Outputs initial volumes, timing, resistances, capacitances
 """
 import numpy as np
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
 
-def set_initial_conditions():
+def set_initial_conditions(HR=80, BV=250, LV_EES=7, LV_A=0.1, RV_A=0.09, B=0.35, V0=5, SVR=2.5, nRows=5000,
+                           infarct=None):
 
     # Heart parameters and SVR
-    HR = 80 # heart rate (beats/min)
-    BV = 250 # stressed blood volume (ml)
-    LV_EES = 7 # LV end systolic elastance (mmHg/ml)
-    LV_A = 0.1 # LV exponential constant in EDPVR (1/ml)
-    RV_A = 0.09 # RV exponential constant in EDPVR (1/ml)
-    B = 0.35 # LV linear constant in EDPVR (mmHg)
-    V0 = 5 # unloaded LV volume (ml)
-    SVR = 2.5 # systemic vascular resistance (mmHg*s/ml)
-
-    # Initial volumes
-    nRows = 5000
-    Volumes = np.zeros((nRows, 6))
-    Volumes[0, :] = BV / 6
+    # HR        heart rate (beats/min)
+    # BV        stressed blood volume (ml)
+    # LV_EES    LV end systolic elastance (mmHg/ml)
+    # LV_A      LV exponential constant in EDPVR (1/ml)
+    # RV_A      RV exponential constant in EDPVR (1/ml)
+    # B         LV linear constant in EDPVR (mmHg)
+    # V0        unloaded LV volume (ml)
+    # SVR       systemic vascular resistance (mmHg*s/ml)
+    # infarct   optional LV infarct scar (A, B, V0, resistance to the LV), see circuit.canine_circuit;
+    #           pass the same infarct to simulate_heart_beat
+
+    # Initial volumes, one column per compartment of the circuit
+    nCompartments = canine_circuit(infarct=infarct).nCompartments
+    Volumes = np.zeros((nRows, nCompartments))
+    Volumes[0, :] = BV / nCompartments
 
     # Timing
     # Eq 3 from "Hemodynamic consequences of ventricular
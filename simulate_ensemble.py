@@ -0,0 +1,133 @@
+"""
+simulate_ensemble.py
+Simulates cardiac cycles of N circulations at once. All members are stepped in lockstep as an (N, 6)
+state through the vectorized RK4 kernel, each member tracks its own steady state convergence and is
+dropped from the kernel once converged, so a large cohort costs about as many Python-level steps
+as a single circulation
+
+Inputs (leading axis = member)
+    resistances     (N, 7)
+    capacitances    (N, 4)
+    ventricles      (N, 2, 4)
+    time_vector     (nRows,) shared by all members, or (N, nRows)
+    tes             scalar or (N,)
+    initial_volumes (N, 6)
+
+Only the current (N, 6) state is kept while stepping. The waveforms of each member's final beat are
+recorded every decimation rows, so the outputs take N * ceil(nRows / decimation) rows: about 1 GB per
+array for 10000 members of 5000 rows at decimation 1, 10 MB at decimation 100.
+"""
+import warnings
+import numpy as np
+from DogPVSimulation_6Comp_Python.instrumentation import DISABLED, ConvergenceResult
+from DogPVSimulation_6Comp_Python.rk4_kernel import RK4Kernel, activation
+from DogPVSimulation_6Comp_Python.calculate_flows import calculate_flows
+
+def simulate_ensemble(resistances, capacitances, ventricles, time_vector, tes, initial_volumes, decimation=1,
+                      instrumentation=None, return_convergence=False):
+    """
+    Returns Volumes, Pressures, Valves, Flows of the final beat of every member sampled every decimation
+    rows, (N, nSamples, 6 or 4), samples, the indices of the sampled time_vector rows (nSamples,), and
+    nIterations (N,), the number of beats each member took to reach steady state (101 if it never did).
+    instrumentation, an instrumentation.Instrumentation, receives phase timings, beat and step
+    counters (summed over members) and a progress event per beat. With return_convergence a list of
+    one ConvergenceResult per member is returned as a seventh value, timings being those of the whole
+    ensemble; a RuntimeWarning is issued when members do not reach steady state
+    """
+    if instrumentation is None:
+        instrumentation = DISABLED
+    start = instrumentation.snapshot()
+
+    # Determine constants for circulation model
+    resistances = np.asarray(resistances, dtype=float)
+    nMembers = np.shape(initial_volumes)[0]
+    nRows = np.shape(time_vector)[-1]
+    time_vector = np.broadcast_to(time_vector, (nMembers, nRows))
+    tes = np.broadcast_to(np.asarray(tes, dtype=float), (nMembers,))
+    step_size = time_vector[:, 1] - time_vector[:, 0]
+    cutoff = 0.1
+    nIterations = np.zeros((nMembers,), dtype=int)
+    error_traces = [[] for _ in range(nMembers)]
+
+    # sampled waveforms of the latest beat of every member
+    samples = np.arange(0, nRows, decimation)
+    sample_of_row = np.full((nRows,), -1)
+    sample_of_row[samples] = np.arange(len(samples))
+    Volumes = np.zeros((nMembers, len(samples), 6))
+    Pressures = np.zeros((nMembers, len(samples), 6))
+
+    # members still in transient state; the kernel holds only these
+    kernel = RK4Kernel(resistances, capacitances, ventricles, batch_shape=(nMembers,))
+    active = np.arange(nMembers)
+    beat_start = np.array(initial_volumes, dtype=float)
+
+    # ping-pong state buffers, current state in [0]
+    current_volumes = np.zeros((2, nMembers, 6))
+    current_pressures = np.zeros((2, nMembers, 6))
+
+    while active.size > 0:
+        nActive = active.size
+        nIterations[active] = nIterations[active] + 1
+        member_time = time_vector[active]
+        member_tes = tes[active]
+        member_step = step_size[active, None]
+        current_volumes[0] = beat_start
+        kernel.pressures(current_volumes[0], 0, current_pressures[0])
+        Volumes[active, 0, :] = current_volumes[0]
+        Pressures[active, 0, :] = current_pressures[0]
+
+        # iteratively solve for volume and pressure throughout cardiac cycle
+        with instrumentation.timer("integration"):
+            for i in range(1, nRows):
+                epsilon = activation(member_time[:, i], member_tes)[:, None]
+                old, new = (i - 1) % 2, i % 2
+                kernel.step(current_volumes[old], current_pressures[old], member_step, epsilon,
+                            current_volumes[new], current_pressures[new])
+                if sample_of_row[i] >= 0:
+                    Volumes[active, sample_of_row[i], :] = current_volumes[new]
+                    Pressures[active, sample_of_row[i], :] = current_pressures[new]
+        instrumentation.count("beats", nActive)
+        instrumentation.count("rk_steps", nActive * (nRows - 1))
+
+        # Calculate which members have reached steady state
+        with instrumentation.timer("steady_state_check"):
+            end_volumes = current_volumes[(nRows - 1) % 2]
+            absolute_err = abs(end_volumes - beat_start)
+            is_transient_state = np.any(absolute_err > cutoff, axis=1)
+            for member, error in zip(active, absolute_err):
+                error_traces[member].append(error)
+        nSteady = nMembers - np.count_nonzero(is_transient_state)
+        instrumentation.event("ensemble_iteration", iteration=int(np.max(nIterations[active])), nSteady=int(nSteady),
+                              nMembers=nMembers)
+
+        # if steady state can't be reached, display warning
+        gave_up = is_transient_state & (nIterations[active] > 99)
+        if np.any(gave_up):
+            instrumentation.event("not_converged", iterations=int(np.max(nIterations[active])),
+                                  members=active[gave_up].tolist())
+            warnings.warn("SS iterations > 100 for " + str(np.count_nonzero(gave_up)) + " members, check cutoff",
+                          RuntimeWarning)
+            nIterations[active[gave_up]] = 101
+
+        # drop the finished members from the kernel and the state buffers
+        keep = is_transient_state & ~gave_up
+        beat_start = end_volumes[keep].copy()
+        active = active[keep]
+        if active.size < nActive:
+            kernel.select(keep)
+            current_volumes = current_volumes[:, keep]
+            current_pressures = current_pressures[:, keep]
+
+    # determine if valves are open or closed and calculate flows between compartments
+    with instrumentation.timer("postprocess"):
+        Valves, Flows = calculate_flows(Pressures, resistances)
+
+    timings, counters = instrumentation.since(start)
+    converged = nIterations <= 100
+    instrumentation.event("run", nConverged=int(np.count_nonzero(converged)), nMembers=nMembers, timings=timings,
+                          counters=counters)
+    if return_convergence:
+        convergence = [ConvergenceResult(bool(converged[m]), len(error_traces[m]), 0, np.array(error_traces[m]), cutoff,
+                                         len(error_traces[m]) * (nRows - 1), timings) for m in range(nMembers)]
+        return Volumes, Pressures, Valves, Flows, samples, nIterations, convergence
+    return Volumes, Pressures, Valves, Flows, samples, nIterations
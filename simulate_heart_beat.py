@@ -2,20 +2,68 @@
 simulate_heart_beat.py
 Simulates a cardiac cycle, calculating changes in volumes and pressures within compartments
 """
+import warnings
 import numpy as np
-from DogPVSimulation_6Comp_Python.rk4 import rk4
-from DogPVSimulation_6Comp_Python.calculate_pressures import calculate_pressures
+from DogPVSimulation_6Comp_Python.instrumentation import DISABLED, ConvergenceResult
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+from DogPVSimulation_6Comp_Python.integrators import make_stepper
+from DogPVSimulation_6Comp_Python.steady_state import periodic_steady_state
+from DogPVSimulation_6Comp_Python.steady_state_cache import cache_key
+from DogPVSimulation_6Comp_Python.calculate_flows import calculate_flows
 
-def simulate_heart_beat(resistances, capacitances, ventricles, time_vector, tes, Volumes):
+def simulate_heart_beat(resistances, capacitances, ventricles, time_vector, tes, Volumes, integrator="rk4",
+                        steady_state="fixed_point", cache=None, instrumentation=None, return_convergence=False,
+                        infarct=None):
+    """
+    integrator selects the cycle solver (see integrators.py): "rk4" or "rk4_jit" step every row of
+    time_vector, "rk45" integrates adaptively with valve event location and "exponential" takes a few
+    hundred exponential / implicit steps per beat; both fill the rows of time_vector from their dense output.
+    steady_state selects how the periodic state is found: "fixed_point" repeats beats until they stop
+    changing, "newton" or "anderson" first solve V(T) = V0 with steady_state.periodic_steady_state.
+    cache, a steady_state_cache.SteadyStateCache, seeds the initial volumes from previously converged
+    runs and stores the converged state of this one.
+    instrumentation, an instrumentation.Instrumentation, receives phase timings, step and beat
+    counters and a progress event per beat. With return_convergence a ConvergenceResult is returned
+    as a fifth value; a RuntimeWarning is issued whenever steady state is not reached.
+    infarct (A, B, V0, resistance) simulates the LV infarct scar as column 6 of Volumes (nRows, 7), as
+    returned by set_initial_conditions(infarct=...); it needs the rk4 or rk4_jit integrator and no cache
+    """
+    if instrumentation is None:
+        instrumentation = DISABLED
+    start = instrumentation.snapshot()
+    if infarct is not None and cache is not None:
+        raise ValueError("The steady state cache holds 6 compartment states and cannot be used with an infarct")
 
     # Determine constants for circulation model
-    step_size = time_vector[1] - time_vector[0]
+    circuit = canine_circuit(resistances, capacitances, ventricles, infarct=infarct)
+    if np.shape(Volumes)[1] != circuit.nCompartments:
+        raise ValueError("Volumes must have " + str(circuit.nCompartments) + " columns, got " + str(np.shape(Volumes)[1]))
+    stepper = make_stepper(integrator, resistances, capacitances, ventricles, infarct=infarct)
     is_transient_state = 1
     cutoff = 0.1
     nIterations = 0
-    
+    nShootingBeats = 0
+    nSteps = 0
+    error_trace = []
+
     # Initialize pressure array
-    Pressures = np.zeros((np.shape(Volumes)[0],6))
+    Pressures = np.zeros((np.shape(Volumes)[0], circuit.nCompartments))
+
+    # Start from a cached steady state, exact or nearest parameters
+    exact = False
+    if cache is not None:
+        key = cache_key(resistances, capacitances, ventricles, time_vector, tes, Volumes)
+        cached_volumes, exact = cache.lookup(key)
+        if cached_volumes is not None:
+            Volumes[0, :] = cached_volumes
+
+    # Solve for the periodic initial volumes directly
+    if steady_state != "fixed_point" and not exact:
+        with instrumentation.timer("shooting"):
+            Volumes[0, :], _, nShootingBeats = periodic_steady_state(resistances, capacitances, ventricles, time_vector,
+                                                                     tes, Volumes[0, :], method=steady_state,
+                                                                     integrator=integrator, cutoff=cutoff,
+                                                                     instrumentation=instrumentation, infarct=infarct)
 
     # Set end volume to be same as initial
     Volumes[-1, :] = Volumes[0, :]
@@ -23,41 +71,42 @@ def simulate_heart_beat(resistances, capacitances, ventricles, time_vector, tes,
     while is_transient_state:
         nIterations = nIterations + 1
         Volumes[0, :] = Volumes[-1, :]
-        Pressures[0, :] = calculate_pressures(Volumes[0, :], Pressures[0, :], capacitances, ventricles, 0)
 
         # iteratively solve for volume and pressure throughout cardiac cycle
-        for i in range(1,len(time_vector)):
-            current_volumes = Volumes[i - 1, :]
-            current_time = time_vector[i]
-            current_pressures = Pressures[i - 1, :]
-            Volumes[i, :], Pressures[i, :] = rk4(current_volumes, current_pressures, resistances, capacitances, ventricles,
-                                                 step_size, current_time, tes)
+        with instrumentation.timer("integration"):
+            Pressures[0, :] = circuit.pressures(Volumes[0, :], 0)
+            beat = stepper.run_beat(Volumes, Pressures, time_vector, tes)
+        beat_steps = getattr(beat, "nSteps", len(time_vector) - 1)
+        nSteps = nSteps + beat_steps
+        instrumentation.count("beats")
+        instrumentation.count("rk_steps", beat_steps)
+
         # Calculate if steady state has occurred
-        absolute_err = abs(Volumes[-1, :] - Volumes[0, :])
-        out_of_range = absolute_err > cutoff
-        nOut_of_range = np.count_nonzero(out_of_range)
-        is_transient_state = nOut_of_range >= 1
-        print("SS iteration #" + str(nIterations) + "    Absolute error: " + str(absolute_err))
+        with instrumentation.timer("steady_state_check"):
+            absolute_err = abs(Volumes[-1, :] - Volumes[0, :])
+            out_of_range = absolute_err > cutoff
+            nOut_of_range = np.count_nonzero(out_of_range)
+            is_transient_state = nOut_of_range >= 1
+            error_trace.append(absolute_err)
+        instrumentation.event("ss_iteration", iteration=nIterations, absolute_error=absolute_err)
 
         # if steady state can't be reached, display warning
-        if nIterations > 99:
-            print("ERROR: SS iterations > 100, check cutoff")
+        if is_transient_state and nIterations > 99:
+            instrumentation.event("not_converged", iterations=nIterations, absolute_error=absolute_err)
+            warnings.warn("SS iterations > 100, check cutoff", RuntimeWarning)
             break
 
-    # determine if valves are open or closed
-    Valves = np.zeros((np.shape(Volumes)[0],4))
-    Valves[:, 0] = Pressures[:, 0] > Pressures[:, 1] # MV
-    Valves[:, 1] = Pressures[:, 1] > Pressures[:, 2] # AV
-    Valves[:, 2] = Pressures[:, 3] > Pressures[:, 4] # TV
-    Valves[:, 3] = Pressures[:, 4] > Pressures[:, 5] # PV
-
-    # calculate flows between compartments
-    Flows = np.zeros((np.shape(Volumes)[0], 6))
-    Flows[:, 0] = (Pressures[:, 5] - Pressures[:, 0]) / resistances[5] # from PA to PV
-    Flows[:, 1] = (Pressures[:, 0] - Pressures[:, 1]) / resistances[0] * (Pressures[:, 0] > Pressures[:, 1])  # from PV to LV
-    Flows[:, 2] = (Pressures[:, 1] - Pressures[:, 2]) / resistances[1] * (Pressures[:, 1] > Pressures[:, 2]) # from LV to SA
-    Flows[:, 3] = (Pressures[:, 2] - Pressures[:, 3]) / resistances[2]  # from SA to SV
-    Flows[:, 4] = (Pressures[:, 3] - Pressures[:, 4]) / resistances[3] * (Pressures[:, 3] > Pressures[:, 4])  # from SV to RV
-    Flows[:, 5] = (Pressures[:, 4] - Pressures[:, 5]) / resistances[4] * (Pressures[:, 4] > Pressures[:, 5])  # from RV to PA
+    if cache is not None and not is_transient_state:
+        cache.store(key, Volumes[-1, :])
+
+    # determine if valves are open or closed and calculate flows between compartments
+    with instrumentation.timer("postprocess"):
+        Valves, Flows = calculate_flows(Pressures, resistances, infarct)
 
+    timings, counters = instrumentation.since(start)
+    instrumentation.event("run", converged=not is_transient_state, timings=timings, counters=counters)
+    if return_convergence:
+        convergence = ConvergenceResult(not is_transient_state, nIterations, nShootingBeats, np.array(error_trace),
+                                        cutoff, nSteps, timings)
+        return Volumes, Pressures, Valves, Flows, convergence
     return Volumes, Pressures, Valves, Flows
\ No newline at end of file
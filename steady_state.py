@@ -0,0 +1,129 @@
+"""
+steady_state.py
+Periodic steady state solvers. Integrating one cardiac cycle is treated as a map V0 -> V(T) and the
+periodic condition V(T) = V0 is solved directly, instead of repeating full beats until they stop
+changing as simulate_heart_beat's fixed point loop does.
+
+Method      Beats per iteration
+newton      1, plus 7 integrated together as one batch whenever the Jacobian of the beat map is
+            (re)built by finite differences: the current guess and one perturbation per compartment
+anderson    1, Anderson-accelerated fixed point iteration mixing the last few beats
+
+The circulation conserves blood volume, so V(T) - V0 always sums to zero and the Jacobian of the
+residual is singular along the total volume direction. Newton steps are solved with the extra
+condition that they leave sum(V0) unchanged; Anderson mixing weights sum to one, which preserves
+it automatically.
+"""
+import numpy as np
+from DogPVSimulation_6Comp_Python.integrators import INTEGRATORS, make_stepper
+from DogPVSimulation_6Comp_Python.instrumentation import DISABLED
+
+STEADY_STATES = ["fixed_point", "newton", "anderson"] # steady_state methods of simulate_heart_beat
+PERTURBATION = 1e-3 # finite difference volume perturbation (ml)
+ANDERSON_DEPTH = 5 # number of previous beats mixed by Anderson acceleration
+
+
+def periodic_steady_state(resistances, capacitances, ventricles, time_vector, tes, initial_volumes,
+                          method="newton", integrator="rk4", cutoff=0.1, max_iterations=100,
+                          instrumentation=None, solver_options=None, infarct=None):
+    """
+    Solves V(T) = V0 starting from initial_volumes (6,), or (7,) with the infarct scar of infarct. Converged when every compartment changes by
+    no more than cutoff (ml) over a beat, the same test as simulate_heart_beat.
+    Returns the steady state initial volumes, the number of iterations, and the number of beats
+    integrated (a batched finite difference pass counts all 7 of its beats). instrumentation, an
+    instrumentation.Instrumentation, receives a progress event per iteration and the beats counter.
+    solver_options go to integrators.make_stepper (rtol / atol for rk45, nSteps for exponential)
+    """
+    if instrumentation is None:
+        instrumentation = DISABLED
+    if method not in ("newton", "anderson"):
+        raise ValueError("Unknown steady state method: " + str(method))
+    if integrator not in INTEGRATORS:
+        raise ValueError("Unknown integrator: " + str(integrator))
+
+    # one stepper per batch shape of initial volumes
+    steppers = {}
+
+    def beat_map(volumes):
+        batch_shape = np.shape(volumes)[:-1]
+        if batch_shape not in steppers:
+            steppers[batch_shape] = make_stepper(integrator, resistances, capacitances, ventricles, batch_shape,
+                                                   infarct=infarct, **(solver_options or {}))
+        instrumentation.count("beats", int(np.prod(batch_shape)))
+        return steppers[batch_shape].end_of_beat(volumes, time_vector, tes)
+
+    volumes = np.array(initial_volumes, dtype=float)
+    if method == "newton":
+        return newton_shooting(beat_map, volumes, cutoff, max_iterations, instrumentation)
+    return anderson_shooting(beat_map, volumes, cutoff, max_iterations, instrumentation)
+
+
+def newton_shooting(beat_map, volumes, cutoff, max_iterations, instrumentation=DISABLED):
+    """
+    Newton iteration on V(T) - V0. The Jacobian is built by forward differences, then kept current
+    with Broyden rank one updates from each new beat; it is rebuilt whenever a step fails to halve
+    the residual
+    """
+    nCompartments = len(volumes)
+    nBeats = 0
+    jacobian = None
+    previous_err = np.inf
+    for nIterations in range(1, max_iterations + 1):
+        if jacobian is None:
+            guesses = np.tile(volumes, (nCompartments + 1, 1))
+            guesses[1:] += PERTURBATION * np.eye(nCompartments)
+            ends = beat_map(guesses)
+            nBeats = nBeats + nCompartments + 1
+            jacobian = ((ends[1:] - ends[0]) / PERTURBATION).T - np.eye(nCompartments)
+            ends = ends[0]
+        else:
+            ends = beat_map(volumes)
+            nBeats = nBeats + 1
+            residual_change = (ends - volumes) - residual
+            jacobian = jacobian + np.outer(residual_change - jacobian @ newton_step, newton_step) / (newton_step @ newton_step)
+
+        residual = ends - volumes
+        absolute_err = abs(residual)
+        instrumentation.event("newton_iteration", iteration=nIterations, absolute_error=absolute_err)
+        if np.all(absolute_err <= cutoff):
+            return ends, nIterations, nBeats
+
+        # solve for the step with an extra row holding total volume fixed
+        newton_step = np.linalg.lstsq(np.vstack((jacobian, np.ones((1, nCompartments)))), np.append(-residual, 0), rcond=None)[0]
+        volumes = volumes + newton_step
+        if np.max(absolute_err) > previous_err / 2:
+            jacobian = None
+        previous_err = np.max(absolute_err)
+
+    instrumentation.event("newton_not_converged", iterations=max_iterations, absolute_error=absolute_err)
+    return volumes, max_iterations, nBeats
+
+
+def anderson_shooting(beat_map, volumes, cutoff, max_iterations, instrumentation=DISABLED):
+    """Anderson accelerated fixed point iteration V0 <- V(T)"""
+    previous_ends = []
+    previous_residuals = []
+    nBeats = 0
+    for nIterations in range(1, max_iterations + 1):
+        ends = beat_map(volumes)
+        nBeats = nBeats + 1
+
+        residual = ends - volumes
+        absolute_err = abs(residual)
+        instrumentation.event("anderson_iteration", iteration=nIterations, absolute_error=absolute_err)
+        if np.all(absolute_err <= cutoff):
+            return ends, nIterations, nBeats
+
+        previous_ends = (previous_ends + [ends])[-ANDERSON_DEPTH:]
+        previous_residuals = (previous_residuals + [residual])[-ANDERSON_DEPTH:]
+        if len(previous_residuals) == 1:
+            volumes = ends
+            continue
+
+        # mixing weights minimizing the combined residual, constrained to sum to one
+        residual_diffs = np.diff(previous_residuals, axis=0).T
+        gamma = np.linalg.lstsq(residual_diffs, residual, rcond=None)[0]
+        volumes = ends - np.diff(previous_ends, axis=0).T @ gamma
+
+    instrumentation.event("anderson_not_converged", iterations=max_iterations, absolute_error=absolute_err)
+    return volumes, max_iterations, nBeats
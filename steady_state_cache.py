@@ -0,0 +1,150 @@
+"""
+steady_state_cache.py
+Persistent cache of converged steady state volumes, keyed on the circulation parameters. Exact hits
+return the stored state, near misses return the state of the closest cached parameter set so that
+simulate_heart_beat starts next to the periodic orbit instead of from the uniform BV / 6 guess.
+
+Key vector
+    resistances[0:6], capacitances[0:4], ventricles (LV A, B, Ees, V0, RV A, B, Ees, V0),
+    cycle length (s), tes (s), BV (ml), nRows
+
+Distances between keys are measured on log(|key|), so every parameter counts by its relative change.
+Nearest neighbours are found by a vectorized brute force search over the normalized keys instead of
+the KD-tree first planned: with 22 dimensional keys a tree visits most leaves anyway, and a single
+NumPy pass is faster for the bounded cache sizes used here without adding SciPy as a dependency.
+The normalized keys are kept in one preallocated array that stores append to and evictions
+swap-delete from, so neither rebuilds it. Entries are evicted least recently used
+first once max_entries is reached.
+"""
+import os
+from collections import OrderedDict
+import numpy as np
+
+MAX_ENTRIES = 10000
+SAVE_EVERY = 100 # stores between writes of the cache file
+KEY_LENGTH = 6 + 4 + 8 + 4
+
+
+def cache_key(resistances, capacitances, ventricles, time_vector, tes, Volumes):
+    """Parameter vector identifying a steady state"""
+    BV = np.sum(Volumes[0, :])
+    return np.concatenate((np.asarray(resistances, dtype=float)[:6], np.asarray(capacitances, dtype=float)[:4],
+                           np.ravel(ventricles).astype(float), [time_vector[-1], tes, BV, len(time_vector)]))
+
+
+class SteadyStateCache:
+    """
+    LRU cache of steady state initial volumes, saved to path (.npz) when given: every save_every
+    stores, on save() and on close() (or leaving a with block), so stores do not rewrite the file.
+    Counters: hits (exact key found), near_hits (seeded from the nearest key), misses (nothing cached)
+    """
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES, max_distance=np.inf, save_every=SAVE_EVERY):
+        self.path = path
+        self.save_every = save_every
+        self.unsaved = 0 # stores since the file was last written
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.entries = OrderedDict() # key bytes -> (key, volumes), least recently used first
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._points = np.zeros((16, KEY_LENGTH)) # normalized keys in rows 0:len(self), grown by doubling
+        self._names = [] # key bytes of each row
+        self._rows = {} # key bytes -> row
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key):
+        """
+        Returns (volumes, exact) for the cached state matching key, or for the nearest cached key
+        rescaled to the requested BV; (None, False) when the cache is empty or nothing is close enough
+        """
+        name = key.tobytes()
+        if name in self.entries:
+            self.entries.move_to_end(name)
+            self.hits = self.hits + 1
+            return self.entries[name][1].copy(), True
+
+        if len(self.entries) > 0:
+            distances = np.sum((self._points[:len(self._names)] - normalize(key)) ** 2, axis=1)
+            nearest = np.argmin(distances)
+            if np.sqrt(distances[nearest]) <= self.max_distance:
+                name = self._names[nearest]
+                self.entries.move_to_end(name)
+                self.near_hits = self.near_hits + 1
+                volumes = self.entries[name][1]
+                return volumes * (key[-2] / np.sum(volumes)), False # blood volume is conserved, match BV
+
+        self.misses = self.misses + 1
+        return None, False
+
+    def store(self, key, volumes):
+        """Adds or refreshes a steady state, evicting the least recently used entry when full"""
+        name = key.tobytes()
+        if name in self.entries:
+            self.entries.move_to_end(name)
+        else:
+            self._add_point(name, key)
+        self.entries[name] = (key.copy(), np.array(volumes, dtype=float))
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            self._remove_point(evicted)
+        self.unsaved = self.unsaved + 1
+        if self.path is not None and self.unsaved >= self.save_every:
+            self.save()
+
+    def _add_point(self, name, key):
+        row = len(self._names)
+        if row == len(self._points):
+            self._points = np.concatenate((self._points, np.zeros_like(self._points)))
+        self._points[row] = normalize(key)
+        self._names.append(name)
+        self._rows[name] = row
+
+    def _remove_point(self, name):
+        """Moves the last row into the row of name"""
+        row = self._rows.pop(name)
+        last_name = self._names.pop()
+        if last_name != name:
+            self._points[row] = self._points[len(self._names)]
+            self._names[row] = last_name
+            self._rows[last_name] = row
+
+    def save(self):
+        """Writes the cache to self.path, in LRU order, replacing the file atomically"""
+        self.unsaved = 0
+        keys = np.array([entry[0] for entry in self.entries.values()]).reshape(-1, KEY_LENGTH)
+        volumes = np.array([entry[1] for entry in self.entries.values()]).reshape(-1, 6)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, keys=keys, volumes=volumes)
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        """Saves any stores not yet written"""
+        if self.path is not None and self.unsaved > 0:
+            self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load(self):
+        with np.load(self.path) as data:
+            self.entries = OrderedDict((key.tobytes(), (key, volumes))
+                                       for key, volumes in zip(data["keys"], data["volumes"]))
+        self._names = list(self.entries)
+        self._rows = {name: row for row, name in enumerate(self._names)}
+        self._points = np.zeros((max(16, len(self._names)), KEY_LENGTH))
+        self._points[:len(self._names)] = [normalize(key) for key, _ in self.entries.values()]
+
+
+def normalize(key):
+    """Log scale key so distances reflect relative parameter changes"""
+    return np.log(np.abs(key) + 1e-12)
@@ -0,0 +1,129 @@
+"""
+stream_beats.py
+Beat by beat simulation for long multi-beat protocols. stream_beats is a generator that integrates
+one cycle at a time into a single reused (nRows, 6) buffer and yields a BeatRecord per beat, so
+memory use stays constant however many beats are run. Parameters may change between beats through
+a schedule callback (e.g. HR or SVR changing over time, see protocol.py); the state is carried across.
+
+BeatWriter appends records to a JSON lines file as they are produced and read_beats reads them back
+one at a time.
+"""
+import json
+import numpy as np
+from DogPVSimulation_6Comp_Python.integrators import make_stepper
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+from DogPVSimulation_6Comp_Python.calculate_metrics import calculate_metrics
+from DogPVSimulation_6Comp_Python.hemodynamics import valve_events
+
+
+class BeatRecord:
+    """
+    One simulated beat
+        beat            beat number, from 0
+        start_time      time of the start of the beat within the protocol (s)
+        time            decimated time within the beat (s)
+        Volumes, Pressures, Flows   decimated waveforms (nSamples, 6)
+        events          {valve name: [(row, opens), ...]}, rows of the full resolution beat at which
+                        the valve state changes (same convention as np.diff(Valves))
+        metrics         calculate_metrics of the full resolution beat
+        error           absolute change of each compartment volume over the beat (ml)
+        end_volumes     volumes at the end of the beat (6,), the initial volumes of the next one
+    """
+
+    def __init__(self, beat, start_time, time, Volumes, Pressures, Flows, events, metrics, error, end_volumes=None):
+        self.beat = beat
+        self.start_time = start_time
+        self.time = time
+        self.Volumes = Volumes
+        self.Pressures = Pressures
+        self.Flows = Flows
+        self.events = events
+        self.metrics = metrics
+        self.error = error
+        self.end_volumes = end_volumes
+
+    def to_dict(self):
+        return {"beat": self.beat, "start_time": self.start_time, "time": self.time.tolist(),
+                "Volumes": self.Volumes.tolist(), "Pressures": self.Pressures.tolist(), "Flows": self.Flows.tolist(),
+                "events": self.events, "metrics": {k: float(v) for k, v in self.metrics.items()},
+                "error": self.error.tolist(),
+                "end_volumes": None if self.end_volumes is None else self.end_volumes.tolist()}
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls(record["beat"], record["start_time"], np.array(record["time"]), np.array(record["Volumes"]),
+                   np.array(record["Pressures"]), np.array(record["Flows"]),
+                   {name: [tuple(event) for event in events] for name, events in record["events"].items()},
+                   record["metrics"], np.array(record["error"]),
+                   None if record.get("end_volumes") is None else np.array(record["end_volumes"]))
+
+
+def stream_beats(resistances, capacitances, ventricles, time_vector, tes, initial_volumes, nBeats=None,
+                 schedule=None, decimation=10, integrator="rk4"):
+    """
+    Yields a BeatRecord per beat starting from initial_volumes (6,), forever if nBeats is None.
+    schedule(beat) may return new (resistances, capacitances, ventricles, time_vector, tes) to use
+    from that beat on, or None to keep the current ones. A sixth element, volumes (6,), is added to
+    the state at the start of that beat (e.g. a blood volume infusion or withdrawal)
+    """
+    circuit = canine_circuit(resistances, capacitances, ventricles) # pressures and flows, compiled once per configuration
+    Volumes = np.zeros((len(time_vector), circuit.nCompartments))
+    Pressures = np.zeros((len(time_vector), circuit.nCompartments))
+    Volumes[-1, :] = initial_volumes
+    stepper = make_stepper(integrator, resistances, capacitances, ventricles)
+    start_time = 0.0
+    beat = 0
+
+    while nBeats is None or beat < nBeats:
+        changes = schedule(beat) if schedule is not None else None
+        if changes is not None:
+            resistances, capacitances, ventricles, time_vector, tes = changes[:5]
+            stepper = make_stepper(integrator, resistances, capacitances, ventricles)
+            circuit = canine_circuit(resistances, capacitances, ventricles)
+            if len(time_vector) != np.shape(Volumes)[0]:
+                end_volumes = Volumes[-1, :].copy()
+                Volumes = np.zeros((len(time_vector), circuit.nCompartments))
+                Pressures = np.zeros((len(time_vector), circuit.nCompartments))
+                Volumes[-1, :] = end_volumes
+
+        # one cycle from the end of the previous one
+        Volumes[0, :] = Volumes[-1, :]
+        if changes is not None and len(changes) > 5:
+            Volumes[0, :] += changes[5]
+        Pressures[0, :] = circuit.pressures(Volumes[0, :], 0)
+        stepper.run_beat(Volumes, Pressures, time_vector, tes)
+        Valves, Flows = circuit.valve_states(Pressures).astype(float), circuit.flows(Pressures)
+
+        yield BeatRecord(beat, start_time, time_vector[::decimation].copy(), Volumes[::decimation].copy(),
+                         Pressures[::decimation].copy(), Flows[::decimation].copy(), valve_events(Valves),
+                         calculate_metrics(Volumes, Pressures, Valves, time_vector),
+                         abs(Volumes[-1, :] - Volumes[0, :]), Volumes[-1, :].copy())
+        start_time = start_time + time_vector[-1]
+        beat = beat + 1
+
+
+class BeatWriter:
+    """Appends BeatRecords to a JSON lines file, one line per beat, flushed as written"""
+
+    def __init__(self, path):
+        self.file = open(path, "a")
+
+    def write(self, record):
+        self.file.write(json.dumps(record.to_dict()) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_beats(path):
+    """Yields the BeatRecords of a file written by BeatWriter, one at a time"""
+    with open(path) as f:
+        for line in f:
+            yield BeatRecord.from_dict(json.loads(line))
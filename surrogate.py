@@ -0,0 +1,240 @@
+"""
+surrogate.py
+Gaussian process emulator of steady state metrics over the set_initial_conditions parameters, for
+interactive queries that cannot wait for simulate_heart_beat.
+
+train_surrogate runs the real model over a Latin hypercube design with parameter_sweep (so training
+runs are parallel and resumable), then fits one Gaussian process per metric: constant mean, squared
+exponential kernel with one length scale per parameter (ARD) and a noise term, with the
+hyperparameters chosen by maximizing the log marginal likelihood. Parameters are scaled to the unit
+cube of the training bounds and metrics to zero mean and unit variance.
+
+Surrogate.predict answers batched queries with the posterior mean and standard deviation (the error
+estimate) of every metric. The steady state loop stops within a tolerance, so the training metrics
+are slightly noisy functions of the parameters; the standard deviations are widened by the
+leave-one-out residuals of the training set where the fitted noise term understates that.
+Surrogate.query additionally falls back to the full simulation for rows outside the training bounds,
+further than max_distance from the nearest training point, or with an estimated error above max_error. validation_report compares predictions with held-out full runs.
+
+    surrogate = train_surrogate({"HR": (60, 140), "SVR": (1.5, 4.0), "LV_EES": (3, 10)}, 200, "training")
+    surrogate.save("surrogate.npz")
+    values, errors, simulated = Surrogate.load("surrogate.npz").query(points, max_error={"MAP": 1.0})
+"""
+import os
+import time
+import numpy as np
+from DogPVSimulation_6Comp_Python.parameter_sweep import latin_hypercube_design, run_sweep, load_results, simulate_point
+
+OUTPUTS = ["MAP", "SV", "CO", "EDP"]
+MAX_ITERATIONS = 200 # Adam iterations of the hyperparameter fit
+LEARNING_RATE = 0.05
+MIN_NOISE = 1e-8 # lower bound of the noise variance (standardized units), keeps K well conditioned
+
+
+def squared_distances(a, b):
+    """(len(a), len(b)) squared Euclidean distances between the rows of a and b"""
+    distances = np.sum(a ** 2, axis=1)[:, None] + np.sum(b ** 2, axis=1)[None, :] - 2 * a @ b.T
+    return np.maximum(distances, 0)
+
+
+def log_marginal_likelihood(log_parameters, X, y):
+    """
+    Log marginal likelihood of standardized targets y at unit cube inputs X (n, d) and its gradient
+    with respect to log_parameters = [log length scales (d), log signal variance, log noise variance]
+    """
+    n, d = X.shape
+    length_scales = np.exp(log_parameters[:d])
+    signal, noise = np.exp(log_parameters[d]), np.exp(log_parameters[d + 1])
+    differences = (X[:, None, :] - X[None, :, :]) ** 2 / length_scales ** 2 # (n, n, d)
+    correlation = signal * np.exp(-0.5 * np.sum(differences, axis=2))
+    K = correlation + noise * np.eye(n)
+
+    L = np.linalg.cholesky(K)
+    K_inv = np.linalg.solve(L.T, np.linalg.solve(L, np.eye(n)))
+    alpha = K_inv @ y
+    value = -0.5 * y @ alpha - np.sum(np.log(np.diag(L))) - 0.5 * n * np.log(2 * np.pi)
+
+    # d value / d log theta = tr(W dK/dlog theta) / 2, W = alpha alpha^T - K^-1
+    W = np.outer(alpha, alpha) - K_inv
+    WK = W * correlation
+    gradient = np.zeros(d + 2)
+    gradient[:d] = 0.5 * np.einsum("ij,ijk->k", WK, differences)
+    gradient[d] = 0.5 * np.sum(WK)
+    gradient[d + 1] = 0.5 * noise * np.trace(W)
+    return value, gradient
+
+
+def fit_hyperparameters(X, y, max_iterations=MAX_ITERATIONS, learning_rate=LEARNING_RATE):
+    """Maximizes the log marginal likelihood with Adam in log space; returns the log parameters"""
+    d = X.shape[1]
+    log_parameters = np.concatenate((np.full(d, np.log(0.5)), [0.0, np.log(1e-4)]))
+    first, second = np.zeros(d + 2), np.zeros(d + 2)
+    best, best_value = log_parameters.copy(), -np.inf
+    for iteration in range(1, max_iterations + 1):
+        try:
+            value, gradient = log_marginal_likelihood(log_parameters, X, y)
+        except np.linalg.LinAlgError:
+            break
+        if value > best_value:
+            best, best_value = log_parameters.copy(), value
+        first = 0.9 * first + 0.1 * gradient
+        second = 0.999 * second + 0.001 * gradient ** 2
+        step = learning_rate * (first / (1 - 0.9 ** iteration)) / (np.sqrt(second / (1 - 0.999 ** iteration)) + 1e-8)
+        log_parameters = log_parameters + step
+        log_parameters[d + 1] = max(log_parameters[d + 1], np.log(MIN_NOISE))
+    return best
+
+
+class Surrogate:
+    """
+    Fitted emulator
+        names           parameter names, the columns of every design and query
+        low, high       (nParameters,) training bounds
+        outputs         metric names, the columns of every prediction
+        X               (n, nParameters) training points scaled to the unit cube
+        Y               (n, nOutputs) training metrics
+        log_parameters  (nOutputs, nParameters + 2) fitted hyperparameters, see log_marginal_likelihood
+    """
+
+    def __init__(self, names, low, high, outputs, X, Y, log_parameters):
+        self.names = list(names)
+        self.low = np.asarray(low, dtype=float)
+        self.high = np.asarray(high, dtype=float)
+        self.outputs = list(outputs)
+        self.X = np.asarray(X, dtype=float)
+        self.Y = np.asarray(Y, dtype=float)
+        self.log_parameters = np.asarray(log_parameters, dtype=float)
+
+        # posterior terms reused by every query
+        d = len(self.names)
+        self.mean = np.mean(self.Y, axis=0)
+        self.scale = np.std(self.Y, axis=0) + 1e-12
+        self.length_scales = np.exp(self.log_parameters[:, :d])
+        self.signal = np.exp(self.log_parameters[:, d])
+        self.alpha = np.zeros(self.Y.shape)
+        self.L_inv = np.zeros((len(self.outputs), len(self.X), len(self.X)))
+        self.calibration = np.ones(len(self.outputs))
+        for j in range(len(self.outputs)):
+            scaled = self.X / self.length_scales[j]
+            K = self.signal[j] * np.exp(-0.5 * squared_distances(scaled, scaled))
+            K = K + np.exp(self.log_parameters[j, d + 1]) * np.eye(len(self.X))
+            self.L_inv[j] = np.linalg.inv(np.linalg.cholesky(K))
+            K_inv = self.L_inv[j].T @ self.L_inv[j]
+            self.alpha[:, j] = K_inv @ ((self.Y[:, j] - self.mean[j]) / self.scale[j])
+
+            # leave-one-out residuals alpha_i / K^-1_ii have variance 1 / K^-1_ii; when they are larger
+            # than that the error estimates are widened by their RMS ratio
+            z = self.alpha[:, j] / np.sqrt(np.diag(K_inv))
+            self.calibration[j] = max(1.0, float(np.sqrt(np.mean(z ** 2))))
+
+    @classmethod
+    def fit(cls, names, low, high, points, Y, outputs=OUTPUTS):
+        """Fits the emulator to points (n, nParameters) in parameter units and metrics Y (n, nOutputs)"""
+        low, high = np.asarray(low, dtype=float), np.asarray(high, dtype=float)
+        X = (np.asarray(points, dtype=float) - low) / (high - low)
+        Y = np.asarray(Y, dtype=float)
+        standardized = (Y - np.mean(Y, axis=0)) / (np.std(Y, axis=0) + 1e-12)
+        log_parameters = np.array([fit_hyperparameters(X, standardized[:, j]) for j in range(Y.shape[1])])
+        return cls(names, low, high, outputs, X, Y, log_parameters)
+
+    def unit(self, points):
+        """Query points (N, nParameters) scaled to the unit cube of the training bounds"""
+        return (np.atleast_2d(np.asarray(points, dtype=float)) - self.low) / (self.high - self.low)
+
+    def predict(self, points):
+        """Posterior mean and standard deviation (N, nOutputs) of every output at points (N, nParameters)"""
+        Z = self.unit(points)
+        values = np.zeros((len(Z), len(self.outputs)))
+        errors = np.zeros((len(Z), len(self.outputs)))
+        for j in range(len(self.outputs)):
+            cross = self.signal[j] * np.exp(-0.5 * squared_distances(Z / self.length_scales[j],
+                                                                     self.X / self.length_scales[j]))
+            variance = self.signal[j] - np.sum((cross @ self.L_inv[j].T) ** 2, axis=1)
+            values[:, j] = self.mean[j] + self.scale[j] * (cross @ self.alpha[:, j])
+            errors[:, j] = self.calibration[j] * self.scale[j] * np.sqrt(np.maximum(variance, 0))
+        return values, errors
+
+    def distance(self, points):
+        """Distance of every query point to the nearest training point, in unit cube coordinates"""
+        return np.sqrt(np.min(squared_distances(self.unit(points), self.X), axis=1))
+
+    def query(self, points, max_error=None, max_distance=None, simulate_options=None):
+        """
+        Predictions at points (N, nParameters), replaced by full simulate_heart_beat runs (error 0) for
+        rows outside the training bounds, further than max_distance from the training points or with an
+        error estimate above max_error {output: standard deviation}. simulate_options are passed to
+        simulate_heart_beat. Returns values, errors (N, nOutputs) and the (N,) mask of simulated rows
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        values, errors = self.predict(points)
+        Z = self.unit(points)
+        simulate = np.any((Z < 0) | (Z > 1), axis=1)
+        if max_distance is not None:
+            simulate |= self.distance(points) > max_distance
+        for output, limit in (max_error or {}).items():
+            simulate |= errors[:, self.outputs.index(output)] > limit
+
+        for row in np.flatnonzero(simulate):
+            metrics = simulate_point(dict(zip(self.names, points[row])), simulate_options or {})
+            values[row] = [metrics[output] for output in self.outputs]
+            errors[row] = 0
+        return values, errors, simulate
+
+    def save(self, path):
+        """Writes the emulator to path (.npz), replacing the file atomically"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, names=np.array(self.names), low=self.low, high=self.high, outputs=np.array(self.outputs),
+                     X=self.X, Y=self.Y, log_parameters=self.log_parameters)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["names"].tolist(), data["low"], data["high"], data["outputs"].tolist(), data["X"],
+                       data["Y"], data["log_parameters"])
+
+
+def training_data(results, names, outputs=OUTPUTS):
+    """
+    Points (n, nParameters) and metrics (n, nOutputs) of the rows of parameter_sweep results that
+    converged and have finite metrics (a run that diverges numerically can end with inf or NaN metrics)
+    """
+    points = np.column_stack([results[name] for name in names])
+    Y = np.column_stack([results[output] for output in outputs])
+    keep = (results["converged"] > 0) & np.all(np.isfinite(Y), axis=1)
+    return points[keep], Y[keep]
+
+
+def train_surrogate(bounds, nPoints, results_dir, outputs=OUTPUTS, seed=0, nWorkers=None, **simulate_options):
+    """
+    Runs the model over an nPoints Latin hypercube design of bounds {parameter name: (low, high)} into
+    results_dir (resuming any earlier run) and fits a Surrogate to the converged points
+    """
+    names, design = latin_hypercube_design(bounds, nPoints, seed)
+    run_sweep(names, design, results_dir, nWorkers=nWorkers, **simulate_options)
+    points, Y = training_data(load_results(results_dir), names, outputs)
+    low, high = np.array([bounds[name] for name in names], dtype=float).T
+    return Surrogate.fit(names, low, high, points, Y, outputs)
+
+
+def validation_report(surrogate, results):
+    """
+    Accuracy of the surrogate against held-out parameter_sweep results. Returns
+    {output: {RMSE, max_error, R2, coverage, mean_std}} (coverage: fraction of points within two
+    standard deviations) plus nPoints and query_time (s per point for the batched prediction)
+    """
+    points, Y = training_data(results, surrogate.names, surrogate.outputs)
+    start = time.perf_counter()
+    values, errors = surrogate.predict(points)
+    query_time = (time.perf_counter() - start) / max(len(points), 1)
+
+    report = {"nPoints": len(points), "query_time": query_time}
+    for j, output in enumerate(surrogate.outputs):
+        residuals = values[:, j] - Y[:, j]
+        report[output] = {"RMSE": float(np.sqrt(np.mean(residuals ** 2))),
+                          "max_error": float(np.max(abs(residuals))),
+                          "R2": float(1 - np.sum(residuals ** 2) / np.sum((Y[:, j] - np.mean(Y[:, j])) ** 2)),
+                          "coverage": float(np.mean(abs(residuals) <= 2 * errors[:, j])),
+                          "mean_std": float(np.mean(errors[:, j]))}
+    return report
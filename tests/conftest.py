@@ -0,0 +1,9 @@
+"""
+conftest.py
+The repository root is the DogPVSimulation_6Comp_Python package (see pyproject.toml). Tests import it
+as installed (pip install -e .), or from a checkout named after the package through its parent directory
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -0,0 +1,69 @@
+"""
+test_cli.py
+Config parsing and validation of the command line interface: JSON and TOML configs, flags applied
+over every config, and the errors for unknown or invalid settings
+"""
+import json
+import pytest
+from DogPVSimulation_6Comp_Python.cli import build_parser, load_config, check_run, runs_from_args, main
+from DogPVSimulation_6Comp_Python.constants import DEFAULT_OPTIONS
+
+
+def write(directory, name, text):
+    path = directory / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_json_and_toml_configs_match(tmp_path):
+    json_path = write(tmp_path, "run.json", json.dumps({"parameters": {"HR": 90, "SVR": 3.0},
+                                                        "options": {"integrator": "rk45"}}))
+    toml_path = write(tmp_path, "run.toml", '[parameters]\nHR = 90\nSVR = 3.0\n\n[options]\nintegrator = "rk45"\n')
+    assert load_config(json_path) == load_config(toml_path) == {"parameters": {"HR": 90, "SVR": 3.0},
+                                                                "options": {"integrator": "rk45"}}
+
+
+@pytest.mark.parametrize("name, text", [("run.json", '{"parameters": {}, "solver": {}}'), ("run.json", "[1, 2]"),
+                                        ("run.yaml", "HR: 90"), ("run.toml", "[parameters\n")])
+def test_invalid_configs_rejected(tmp_path, name, text):
+    path = write(tmp_path, name, text)
+    with pytest.raises(ValueError):
+        load_config(path)
+
+
+@pytest.mark.parametrize("parameters, options", [({"HRV": 90}, {}), ({"HR": True}, {}), ({"HR": "90"}, {}),
+                                                 ({}, {"solver": "rk4"}), ({}, {"steady_state": "bisection"}),
+                                                 ({}, {"nRows": 1}), ({}, {"nRows": 2.5})])
+def test_check_run_rejects(parameters, options):
+    with pytest.raises(ValueError):
+        check_run(parameters, dict(DEFAULT_OPTIONS, **options), "run")
+
+
+def test_flags_override_every_config(tmp_path):
+    first = write(tmp_path, "first.json", json.dumps({"parameters": {"HR": 90, "BV": 300}}))
+    second = write(tmp_path, "second.toml", '[parameters]\nHR = 120\n\n[options]\nnRows = 1000\n')
+    args = build_parser().parse_args(["--config", first, second, "--HR", "100", "--integrator", "rk45"])
+    runs = runs_from_args(args)
+    assert [name for name, _, _ in runs] == ["first", "second"]
+    assert runs[0][1] == {"HR": 100.0, "BV": 300}
+    assert runs[1][1] == {"HR": 100.0}
+    assert runs[0][2] == dict(DEFAULT_OPTIONS, integrator="rk45")
+    assert runs[1][2] == dict(DEFAULT_OPTIONS, integrator="rk45", nRows=1000)
+
+
+def test_flags_alone_make_one_run():
+    runs = runs_from_args(build_parser().parse_args(["--SVR", "3"]))
+    assert runs == [("circmodel", {"SVR": 3.0}, DEFAULT_OPTIONS)]
+
+
+def test_invalid_config_is_a_usage_error(tmp_path, capsys):
+    path = write(tmp_path, "run.json", json.dumps({"parameters": {"HRV": 90}}))
+    with pytest.raises(SystemExit) as exit:
+        main(["--config", path])
+    assert exit.value.code == 2
+    assert "Unknown settings in run" in capsys.readouterr().err
+
+
+def test_version(capsys):
+    assert main(["--version"]) == 0
+    assert capsys.readouterr().out.strip()
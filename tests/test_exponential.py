@@ -0,0 +1,29 @@
+"""
+test_exponential.py
+Valve events of the exponential solver against the adaptive RK45 solver, and the split budget of a step
+"""
+import numpy as np
+import pytest
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.rk45 import RK45Solver
+from DogPVSimulation_6Comp_Python import exponential
+from DogPVSimulation_6Comp_Python.exponential import ExponentialSolver
+
+EVENT_TOLERANCE = 1e-4 # s
+
+
+def test_events_match_rk45():
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions()
+    reference = RK45Solver(resistances, capacitances, ventricles).solve_beat(Volumes[0, :], time_vector[-1], tes)
+    beat = ExponentialSolver(resistances, capacitances, ventricles).solve_beat(Volumes[0, :], time_vector[-1], tes)
+    assert [(name, opens) for _, name, opens in beat.events] == [(name, opens) for _, name, opens in reference.events]
+    np.testing.assert_allclose([time for time, _, _ in beat.events], [time for time, _, _ in reference.events],
+                               rtol=0, atol=EVENT_TOLERANCE)
+    assert all(time in beat.times for time, _, _ in beat.events) # every switch is at a step boundary
+
+
+def test_split_budget_raises(monkeypatch):
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions()
+    monkeypatch.setattr(exponential, "MAX_SPLITS", 0)
+    with pytest.raises(RuntimeError):
+        ExponentialSolver(resistances, capacitances, ventricles).solve_beat(Volumes[0, :], time_vector[-1], tes)
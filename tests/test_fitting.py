@@ -0,0 +1,55 @@
+"""
+test_fitting.py
+Levenberg-Marquardt fits of synthetic measurements: recovery of perturbed parameters, and the
+converged flag and reason of fits that stop without converging
+"""
+import numpy as np
+import pytest
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.sensitivity import simulate_with_sensitivities, get_parameters, set_parameters
+from DogPVSimulation_6Comp_Python.fitting import fit_parameters, model_outputs
+
+N_ROWS = 1000
+NAMES = ["Ras", "LV_Ees"]
+PERTURBATION = [1.2, 0.9] # starting guess / true value
+
+
+@pytest.fixture(scope="module")
+def problem():
+    """Synthetic MAP, SV and EDP of the true model, the true values and the perturbed starting arrays"""
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(nRows=N_ROWS)
+    V, P, dV, dP, _ = simulate_with_sensitivities(resistances, capacitances, ventricles, time_vector, tes,
+                                                  Volumes[0, :], [])
+    values, _ = model_outputs(V, P, dV, dP, time_vector, {"MAP": 0, "SV": 0, "EDP": 0})
+    targets = dict(zip(["MAP", "SV", "EDP"], values))
+    true = get_parameters(resistances, capacitances, ventricles, NAMES)
+    guess = set_parameters(resistances, capacitances, ventricles, NAMES, true * np.array(PERTURBATION))
+    return targets, true, guess, time_vector, tes, V[0]
+
+
+@pytest.mark.parametrize("gradient", ["sensitivity", "finite_difference"])
+def test_fit_recovers_parameters(problem, gradient):
+    targets, true, guess, time_vector, tes, initial_volumes = problem
+    result = fit_parameters(targets, NAMES, *guess, time_vector, tes, initial_volumes, gradient=gradient)
+    assert result.converged
+    assert result.reason in ("step", "cost")
+    fitted = np.array([result.parameters[name] for name in NAMES])
+    np.testing.assert_allclose(fitted, true, rtol=1e-6)
+
+
+def test_fit_reports_iteration_limit(problem):
+    targets, true, guess, time_vector, tes, initial_volumes = problem
+    result = fit_parameters(targets, NAMES, *guess, time_vector, tes, initial_volumes, max_iterations=1)
+    assert not result.converged
+    assert result.reason == "max_iterations"
+
+
+def test_fit_reports_stall(problem):
+    targets, true, guess, time_vector, tes, initial_volumes = problem
+    # inconsistent targets leave a residual cost, and with no tolerance the fit keeps trying steps from
+    # the minimum until the damping limit
+    targets = dict(targets, MAP=targets["MAP"] + 5)
+    result = fit_parameters(targets, NAMES, *guess, time_vector, tes, initial_volumes, tolerance=0)
+    assert not result.converged
+    assert result.reason == "stalled"
+    assert result.cost > 0
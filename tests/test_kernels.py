@@ -0,0 +1,101 @@
+"""
+test_kernels.py
+RK4Kernel and the compiled CompiledRK4 against the reference rk4 step, for one circulation, with
+mitral regurgitation, for the infarct circuit and for a batch stepped in lockstep
+"""
+import numpy as np
+import pytest
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.calculate_pressures import calculate_pressures
+from DogPVSimulation_6Comp_Python.rk4 import rk4
+from DogPVSimulation_6Comp_Python.rk4_kernel import RK4Kernel
+from DogPVSimulation_6Comp_Python.integrators import make_stepper
+from DogPVSimulation_6Comp_Python.circuit import canine_circuit
+
+N_ROWS = 1000
+TOLERANCE = 1e-9 # ml, mmHg over one beat
+INFARCT = [0.2, 0.35, 5, 0.002]
+INFARCT_ROWS = 20000
+R_MV = 2.0 # mitral backflow resistance (mmHg*s/ml)
+
+
+def reference_beat(Volumes, resistances, capacitances, ventricles, time_vector, tes):
+    """Volumes and Pressures of one beat stepped with rk4 from Volumes[0]"""
+    Volumes = Volumes.copy()
+    Pressures = np.zeros(np.shape(Volumes))
+    Pressures[0, :] = calculate_pressures(Volumes[0, :], Pressures[0, :], capacitances, ventricles, 0)
+    step_size = time_vector[1] - time_vector[0]
+    for i in range(1, len(time_vector)):
+        Volumes[i, :], Pressures[i, :] = rk4(Volumes[i - 1, :], Pressures[i - 1, :], resistances, capacitances,
+                                             ventricles, step_size, time_vector[i], tes)
+    return Volumes, Pressures
+
+
+def compiled():
+    """Skips the test when rk4_jit would fall back to RK4Kernel"""
+    from DogPVSimulation_6Comp_Python.rk4_compiled import CompiledRK4, NUMBA_AVAILABLE
+    if not NUMBA_AVAILABLE:
+        pytest.skip("Numba is not installed")
+    return CompiledRK4
+
+
+@pytest.mark.parametrize("integrator", ["rk4", "rk4_jit"])
+@pytest.mark.parametrize("parameters", [{}, {"HR": 140, "SVR": 4.0}, {"BV": 400, "LV_EES": 3.5}, {"R_mv": R_MV}])
+def test_kernel_matches_rk4(integrator, parameters):
+    parameters = dict(parameters)
+    R_mv = parameters.pop("R_mv", 0)
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(nRows=N_ROWS, **parameters)
+    resistances[6] = R_mv
+    V_ref, P_ref = reference_beat(Volumes, resistances, capacitances, ventricles, time_vector, tes)
+
+    if integrator == "rk4_jit":
+        compiled()
+    kernel = make_stepper(integrator, resistances, capacitances, ventricles)
+    Pressures = np.zeros(np.shape(Volumes))
+    Pressures[0, :] = P_ref[0, :]
+    kernel.run_beat(Volumes, Pressures, time_vector, tes)
+    np.testing.assert_allclose(Volumes, V_ref, rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(Pressures, P_ref, rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(kernel.end_of_beat(Volumes[0, :], time_vector, tes), V_ref[-1], rtol=0, atol=TOLERANCE)
+
+
+def test_regurgitation_conserves_volume():
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(nRows=N_ROWS)
+    resistances[6] = R_MV
+    V_ref, P_ref = reference_beat(Volumes, resistances, capacitances, ventricles, time_vector, tes)
+    assert np.any(P_ref[:, 1] > P_ref[:, 0]) # the mitral valve leaks during systole
+    np.testing.assert_allclose(np.sum(V_ref, axis=1), np.sum(V_ref[0]), rtol=1e-12)
+
+
+def test_compiled_infarct_matches_kernel():
+    CompiledRK4 = compiled()
+    # the small scar resistance is stiff: on coarser grids RK4 is close to its stability limit and
+    # round-off of the differently ordered flow sums grows instead of decaying
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(nRows=INFARCT_ROWS,
+                                                                                              infarct=INFARCT)
+    circuit = canine_circuit(resistances, capacitances, ventricles, infarct=INFARCT)
+    Pressures = np.zeros(np.shape(Volumes))
+    Pressures[0, :] = circuit.pressures(Volumes[0, :], 0)
+    V_ref, P_ref = RK4Kernel.from_circuit(circuit).run_beat(Volumes.copy(), Pressures.copy(), time_vector, tes)
+    assert np.all(np.isfinite(V_ref))
+
+    kernel = CompiledRK4.from_circuit(circuit)
+    kernel.run_beat(Volumes, Pressures, time_vector, tes)
+    np.testing.assert_allclose(Volumes, V_ref, rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(Pressures, P_ref, rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(kernel.end_of_beat(Volumes[0, :], time_vector, tes), V_ref[-1], rtol=0, atol=TOLERANCE)
+
+
+def test_batch_matches_single_circulations():
+    runs = [set_initial_conditions(nRows=N_ROWS, SVR=SVR) for SVR in (1.5, 2.5, 4.0)]
+    _, time_vector, tes, ventricles, _, capacitances = runs[0]
+    resistances = np.stack([run[4] for run in runs])
+    initial_volumes = np.stack([run[0][0, :] * (1 + 0.1 * j) for j, run in enumerate(runs)])
+
+    batch = RK4Kernel(resistances, capacitances, ventricles, batch_shape=(len(runs),))
+    ends = batch.end_of_beat(initial_volumes, time_vector, tes)
+    for j in range(len(runs)):
+        single = RK4Kernel(resistances[j], capacitances, ventricles)
+        np.testing.assert_allclose(ends[j], single.end_of_beat(initial_volumes[j], time_vector, tes), rtol=0,
+                                   atol=TOLERANCE)
+    np.testing.assert_allclose(np.sum(ends, axis=1), np.sum(initial_volumes, axis=1), rtol=1e-12) # volume conserved
@@ -0,0 +1,30 @@
+"""
+test_service.py
+Request validation of the simulation service: defaults, and the 400 errors for unknown, non-finite
+and out of range values
+"""
+import pytest
+from DogPVSimulation_6Comp_Python.service import parse_request, DEFAULT_OPTIONS, PARAMETER_RANGES
+
+
+def test_defaults_filled_in():
+    parameters, options = parse_request(b'{"parameters": {"HR": 100}}')
+    assert parameters == {"HR": 100.0}
+    assert options == DEFAULT_OPTIONS
+
+
+@pytest.mark.parametrize("body", [b'{"parameters": {"HR": NaN}}', b'{"parameters": {"SVR": Infinity}}',
+                                  b'{"parameters": {"BV": -Infinity}}', b'{"parameters": {"HR": 0}}',
+                                  b'{"parameters": {"LV_A": 2}}', b'{"parameters": {"HR": "fast"}}',
+                                  b'{"parameters": {"HRV": 1}}', b'{"options": {"nRows": 1}}',
+                                  b'{"options": {"integrator": "euler"}}'])
+def test_invalid_requests_rejected(body):
+    with pytest.raises(ValueError):
+        parse_request(body)
+
+
+def test_range_limits_accepted():
+    parameters, _ = parse_request(('{"parameters": {'
+                                   + ", ".join('"' + name + '": ' + str(high) for name, (_, high) in PARAMETER_RANGES.items())
+                                   + '}}').encode())
+    assert parameters == {name: float(high) for name, (_, high) in PARAMETER_RANGES.items()}
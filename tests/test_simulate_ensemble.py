@@ -0,0 +1,26 @@
+"""
+test_simulate_ensemble.py
+simulate_ensemble against separate simulate_heart_beat runs of its members
+"""
+import numpy as np
+import pytest
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.simulate_ensemble import simulate_ensemble
+from DogPVSimulation_6Comp_Python.simulate_heart_beat import simulate_heart_beat
+
+
+@pytest.mark.parametrize("decimation", [1, 7])
+def test_members_match_single_runs(decimation):
+    runs = [set_initial_conditions(HR=HR, nRows=500) for HR in (70, 90, 120)]
+    Volumes, Pressures, Valves, Flows, samples, nIterations = simulate_ensemble(
+        np.stack([run[4] for run in runs]), np.stack([run[5] for run in runs]), np.stack([run[3] for run in runs]),
+        np.stack([run[1] for run in runs]), [run[2] for run in runs], np.stack([run[0][0, :] for run in runs]),
+        decimation=decimation)
+    assert Volumes.shape == (3, len(range(0, 500, decimation)), 6)
+    for member, (V, time_vector, tes, ventricles, resistances, capacitances) in enumerate(runs):
+        V, P, Va, F = simulate_heart_beat(resistances, capacitances, ventricles, time_vector, tes, V.copy())
+        np.testing.assert_allclose(Volumes[member], V[samples], rtol=0, atol=1e-9)
+        np.testing.assert_allclose(Pressures[member], P[samples], rtol=0, atol=1e-9)
+        np.testing.assert_array_equal(Valves[member], Va[samples])
+        np.testing.assert_allclose(Flows[member], F[samples], rtol=0, atol=1e-9)
+    assert np.all(nIterations <= 100)
@@ -0,0 +1,74 @@
+"""
+test_steady_state_cache.py
+Exact and nearest neighbour lookups, LRU eviction and persistence of steady_state_cache.SteadyStateCache
+"""
+import numpy as np
+from DogPVSimulation_6Comp_Python.set_initial_conditions import set_initial_conditions
+from DogPVSimulation_6Comp_Python.steady_state_cache import SteadyStateCache, cache_key
+
+
+def key_and_volumes(**parameters):
+    Volumes, time_vector, tes, ventricles, resistances, capacitances = set_initial_conditions(**parameters)
+    key = cache_key(resistances, capacitances, ventricles, time_vector, tes, Volumes)
+    return key, Volumes[0, :] + np.arange(6) # distinguishable states with the BV of the key
+
+
+def test_exact_and_nearest_lookup():
+    cache = SteadyStateCache()
+    assert cache.lookup(key_and_volumes()[0]) == (None, False)
+    for HR in (60, 80, 100):
+        cache.store(*key_and_volumes(HR=HR))
+
+    key, volumes = key_and_volumes(HR=80)
+    found, exact = cache.lookup(key)
+    assert exact
+    np.testing.assert_array_equal(found, volumes)
+
+    # nearest is HR 100, rescaled to the requested blood volume
+    key, _ = key_and_volumes(HR=95, BV=300)
+    found, exact = cache.lookup(key)
+    assert not exact
+    _, nearest = key_and_volumes(HR=100)
+    np.testing.assert_allclose(found, nearest * 300 / np.sum(nearest))
+    assert (cache.hits, cache.near_hits, cache.misses) == (1, 1, 1)
+
+    cache.max_distance = 1e-3
+    assert cache.lookup(key) == (None, False)
+
+
+def test_lru_eviction_keeps_index_consistent():
+    cache = SteadyStateCache(max_entries=3)
+    states = [key_and_volumes(HR=HR) for HR in (60, 70, 80, 90, 100)]
+    for key, volumes in states[:3]:
+        cache.store(key, volumes)
+    cache.lookup(states[0][0]) # HR 60 becomes the most recently used
+    for key, volumes in states[3:]:
+        cache.store(key, volumes)
+
+    assert len(cache) == 3
+    assert cache.lookup(states[1][0])[1] is False and cache.lookup(states[2][0])[1] is False # evicted
+    for key, volumes in (states[0], states[3], states[4]):
+        found, exact = cache.lookup(key)
+        assert exact
+        np.testing.assert_array_equal(found, volumes)
+    # every remaining key is the nearest neighbour of a slightly perturbed copy of itself
+    for key, volumes in (states[0], states[3], states[4]):
+        perturbed = key.copy()
+        perturbed[0] = perturbed[0] * 1.001
+        found, exact = cache.lookup(perturbed)
+        assert not exact
+        np.testing.assert_allclose(found, volumes * key[-2] / np.sum(volumes))
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "steady_states.npz")
+    with SteadyStateCache(path, save_every=2) as cache:
+        for HR in (60, 80, 100):
+            cache.store(*key_and_volumes(HR=HR))
+    loaded = SteadyStateCache(path)
+    assert len(loaded) == 3
+    key, volumes = key_and_volumes(HR=100)
+    np.testing.assert_array_equal(loaded.lookup(key)[0], volumes)
+    key, volumes = key_and_volumes(HR=79)
+    _, nearest = key_and_volumes(HR=80)
+    np.testing.assert_allclose(loaded.lookup(key)[0], nearest * key[-2] / np.sum(nearest))
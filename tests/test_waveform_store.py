@@ -0,0 +1,75 @@
+"""
+test_waveform_store.py
+Round trip, partial reads and layout checks of waveform_store.WaveformStore
+"""
+import os
+import numpy as np
+import pytest
+from DogPVSimulation_6Comp_Python.waveform_store import WaveformStore, PARAMETER_COLUMNS
+
+N_ROWS = 50
+
+
+def beats(nBeats, seed=0):
+    """Random Volumes, Pressures, Valves, Flows and parameters of nBeats beats"""
+    rng = np.random.default_rng(seed)
+    Volumes, Pressures, Flows = rng.random((3, nBeats, N_ROWS, 6))
+    Valves = (rng.random((nBeats, N_ROWS, 4)) > 0.5).astype(float)
+    return Volumes, Pressures, Valves, Flows, rng.random((nBeats, 7)), rng.random((nBeats, 4)), rng.random((nBeats, 2, 4))
+
+
+def test_round_trip(tmp_path):
+    store = WaveformStore.create(str(tmp_path / "store"), N_ROWS, dtype="float64")
+    Volumes, Pressures, Valves, Flows, resistances, capacitances, ventricles = beats(3)
+    store.append_batch(Volumes, Pressures, Valves, Flows, resistances, capacitances, ventricles, 0.75, 0.2)
+    store.append(Volumes[0], Pressures[0], Valves[0], Flows[0], resistances[0], capacitances[0], ventricles[0],
+                 np.linspace(0, 0.5, N_ROWS), 0.1)
+
+    store = WaveformStore(str(tmp_path / "store"))
+    assert len(store) == 4
+    np.testing.assert_array_equal(store.Volumes[:3], Volumes)
+    np.testing.assert_array_equal(store.Pressures[3], Pressures[0])
+    np.testing.assert_array_equal(store.Flows[:3], Flows)
+    for beat in range(3):
+        np.testing.assert_array_equal(store.Valves(beat), Valves[beat])
+    np.testing.assert_array_equal(store.Valves(1, slice(3, 40, 7)), Valves[1, 3:40:7])
+    np.testing.assert_array_equal(store.parameters[:3, :7], resistances)
+    assert store.parameters[3, PARAMETER_COLUMNS.index("cycle_length")] == 0.5
+    np.testing.assert_allclose(store.time_vector(0), np.linspace(0, 0.75, N_ROWS))
+
+
+def test_beat_inputs(tmp_path):
+    store = WaveformStore.create(str(tmp_path / "store"), N_ROWS)
+    Volumes, Pressures, Valves, Flows, resistances, capacitances, ventricles = beats(2)
+    store.append_batch(Volumes, Pressures, Valves, Flows, resistances, capacitances, ventricles, [0.75, 0.5], [0.2, 0.1])
+    np.testing.assert_array_equal(store.resistances(1), resistances[1])
+    np.testing.assert_array_equal(store.capacitances(0), capacitances[0])
+    np.testing.assert_array_equal(store.ventricles(1), ventricles[1])
+    assert store.tes(1) == 0.1
+    assert store.time_vector(1)[-1] == 0.5
+
+
+@pytest.mark.parametrize("name, shape", [("Volumes", (2, N_ROWS, 7)), ("Pressures", (2, N_ROWS - 1, 6)),
+                                         ("Flows", (1, N_ROWS, 6)), ("Valves", (2, N_ROWS, 6))])
+def test_wrong_shape_is_rejected(tmp_path, name, shape):
+    store = WaveformStore.create(str(tmp_path / "store"), N_ROWS)
+    arrays = dict(zip(["Volumes", "Pressures", "Valves", "Flows"], beats(2)[:4]))
+    arrays[name] = np.zeros(shape)
+    with pytest.raises(ValueError):
+        store.append_batch(arrays["Volumes"], arrays["Pressures"], arrays["Valves"], arrays["Flows"],
+                           *beats(2)[4:], 0.75, 0.2)
+    assert len(store) == 0
+    for file in os.listdir(store.path):
+        if file.endswith(".bin"):
+            assert os.path.getsize(os.path.join(store.path, file)) == 0
+
+
+def test_interrupted_append_is_discarded(tmp_path):
+    store = WaveformStore.create(str(tmp_path / "store"), N_ROWS)
+    Volumes, Pressures, Valves, Flows, resistances, capacitances, ventricles = beats(2)
+    store.append_batch(Volumes, Pressures, Valves, Flows, resistances, capacitances, ventricles, 0.75, 0.2)
+    with open(os.path.join(store.path, "Volumes.bin"), "ab") as f:
+        f.write(b"\0" * 100) # a crash part way through the next append
+    store.append_batch(Volumes, Pressures, Valves, Flows, resistances, capacitances, ventricles, 0.75, 0.2)
+    assert len(store) == 4
+    np.testing.assert_allclose(store.Volumes[3], Volumes[1], rtol=1e-6)
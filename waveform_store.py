@@ -0,0 +1,176 @@
+"""
+waveform_store.py
+On-disk store for the Volumes, Pressures, Flows and Valves arrays of simulated beats, readable with
+np.memmap so compartments or time windows of any beat can be sliced without loading whole runs.
+
+A store is a directory
+    header.json     format version, dtype, nRows and the column mappings below
+    Volumes.bin     (nBeats, nRows, 6) dtype
+    Pressures.bin   (nBeats, nRows, 6) dtype
+    Flows.bin       (nBeats, nRows, 6) dtype
+    Valves.bin      (nBeats, ceil(nRows * 4 / 8)) uint8, Valves bit-packed row by row
+    parameters.bin  (nBeats, 21) float64, the inputs of each beat in PARAMETER_COLUMNS order
+
+Beats are appended to the end of every file, so a store grows without rewriting existing data.
+parameters.bin is written last and defines the number of complete beats; an append interrupted
+part way leaves bytes past that count in the other files, which the next append truncates before
+writing so every beat stays at its offset.
+The time vector of a beat is np.linspace(0, cycle_length, nRows), as in set_initial_conditions;
+time_vector(), resistances(), capacitances(), ventricles() and tes() return the inputs of a beat in
+the shapes set_initial_conditions uses, so readers need not know the parameters.bin layout.
+"""
+import json
+import os
+import numpy as np
+
+FORMAT_VERSION = 1
+COMPARTMENTS = ["pulmonary veins", "left ventricle - surviving myocardium", "systemic arteries",
+                "systemic veins", "right ventricle", "pulmonary arteries"]
+VALVES = ["MV", "AV", "TV", "PV"]
+FLOWS = ["pulmonary arteries to pulmonary veins", "pulmonary veins to left ventricle",
+         "left ventricle to systemic arteries", "systemic arteries to systemic veins",
+         "systemic veins to right ventricle", "right ventricle to pulmonary arteries"]
+PARAMETER_COLUMNS = ["Rvp", "Rcs", "Ras", "Rvs", "Rcp", "Rap", "Rmv", "Cvp", "Cas", "Cvs", "Cap",
+                     "LV_A", "LV_B", "LV_Ees", "LV_V0", "RV_A", "RV_B", "RV_Ees", "RV_V0", "cycle_length", "tes"]
+WAVEFORMS = ["Volumes", "Pressures", "Flows"]
+RESISTANCES = slice(0, 7) # parameters.bin columns of each input
+CAPACITANCES = slice(7, 11)
+VENTRICLES = slice(11, 19)
+
+
+class WaveformStore:
+    """
+    Opens the store at path. create() makes a new one; append() / append_batch() add beats.
+    Volumes, Pressures, Flows and parameters are read-only memmaps over every stored beat
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "header.json")) as f:
+            self.header = json.load(f)
+        if self.header["version"] != FORMAT_VERSION:
+            raise ValueError("Unsupported waveform store version: " + str(self.header["version"]))
+        self.dtype = np.dtype(self.header["dtype"])
+        self.nRows = self.header["nRows"]
+        self.valve_bytes = (self.nRows * 4 + 7) // 8
+        self._maps = {}
+
+    @classmethod
+    def create(cls, path, nRows, dtype="float32"):
+        if np.dtype(dtype) not in (np.float32, np.float64):
+            raise ValueError("Waveform dtype must be float32 or float64")
+        os.makedirs(path)
+        header = {"version": FORMAT_VERSION, "dtype": np.dtype(dtype).name, "nRows": nRows,
+                  "compartments": COMPARTMENTS, "valves": VALVES, "flows": FLOWS,
+                  "parameter_columns": PARAMETER_COLUMNS}
+        with open(os.path.join(path, "header.json"), "w") as f:
+            json.dump(header, f, indent=1)
+        for name in WAVEFORMS + ["Valves", "parameters"]:
+            open(os.path.join(path, name + ".bin"), "wb").close()
+        return cls(path)
+
+    def __len__(self):
+        return os.path.getsize(os.path.join(self.path, "parameters.bin")) // (8 * len(PARAMETER_COLUMNS))
+
+    def append(self, Volumes, Pressures, Valves, Flows, resistances, capacitances, ventricles, time_vector, tes):
+        """Adds one beat, arrays as returned by simulate_heart_beat"""
+        self.append_batch(Volumes[None], Pressures[None], Valves[None], Flows[None], np.asarray(resistances)[None],
+                          np.asarray(capacitances)[None], np.asarray(ventricles)[None], time_vector[-1], tes)
+
+    def append_batch(self, Volumes, Pressures, Valves, Flows, resistances, capacitances, ventricles, cycle_length, tes):
+        """
+        Adds N beats with a leading member axis, as returned by simulate_ensemble; cycle_length and
+        tes may be scalars or (N,). Every array must match the layout of the header, (N, nRows, 6) for
+        the waveforms and (N, nRows, 4) for Valves, since a wrong width would shift every later beat
+        """
+        nBeats = np.shape(Volumes)[0]
+        for name, array, width in (("Volumes", Volumes, 6), ("Pressures", Pressures, 6), ("Flows", Flows, 6),
+                                   ("Valves", Valves, 4)):
+            if np.shape(array) != (nBeats, self.nRows, width):
+                raise ValueError(name + " must have shape " + str((nBeats, self.nRows, width)) + " to match the store, got "
+                                 + str(np.shape(array)))
+        parameters = np.zeros((nBeats, len(PARAMETER_COLUMNS)))
+        parameters[:, RESISTANCES] = resistances
+        parameters[:, CAPACITANCES] = capacitances
+        parameters[:, VENTRICLES] = np.reshape(ventricles, (nBeats, 8))
+        parameters[:, PARAMETER_COLUMNS.index("cycle_length")] = cycle_length
+        parameters[:, PARAMETER_COLUMNS.index("tes")] = tes
+
+        self._discard_incomplete()
+        for name, array in zip(WAVEFORMS, (Volumes, Pressures, Flows)):
+            self._write(name, np.ascontiguousarray(array, dtype=self.dtype))
+        packed = np.packbits(np.reshape(np.asarray(Valves) > 0, (nBeats, self.nRows * 4)), axis=1)
+        self._write("Valves", packed)
+        self._write("parameters", parameters) # written last: it defines the number of complete beats
+        self._maps = {}
+
+    def _beat_bytes(self, name):
+        if name in WAVEFORMS:
+            return self.nRows * 6 * self.dtype.itemsize
+        if name == "Valves":
+            return self.valve_bytes
+        return 8 * len(PARAMETER_COLUMNS)
+
+    def _discard_incomplete(self):
+        """Truncates every file to the complete beats, dropping what an interrupted append left behind"""
+        nBeats = len(self)
+        for name in WAVEFORMS + ["Valves", "parameters"]:
+            path = os.path.join(self.path, name + ".bin")
+            if os.path.getsize(path) > nBeats * self._beat_bytes(name):
+                os.truncate(path, nBeats * self._beat_bytes(name))
+
+    def _write(self, name, array):
+        with open(os.path.join(self.path, name + ".bin"), "ab") as f:
+            f.write(array.tobytes())
+
+    def _map(self, name, dtype, row_shape):
+        if name not in self._maps:
+            nBeats = len(self)
+            self._maps[name] = (np.memmap(os.path.join(self.path, name + ".bin"), dtype=dtype, mode="r",
+                                          shape=(nBeats,) + row_shape) if nBeats > 0 else np.zeros((0,) + row_shape, dtype))
+        return self._maps[name]
+
+    @property
+    def Volumes(self):
+        return self._map("Volumes", self.dtype, (self.nRows, 6))
+
+    @property
+    def Pressures(self):
+        return self._map("Pressures", self.dtype, (self.nRows, 6))
+
+    @property
+    def Flows(self):
+        return self._map("Flows", self.dtype, (self.nRows, 6))
+
+    @property
+    def parameters(self):
+        return self._map("parameters", np.float64, (len(PARAMETER_COLUMNS),))
+
+    def Valves(self, beat, rows=slice(None)):
+        """Unpacked (rows, 4) valve states of one beat, rows any slice; only the bytes covering rows are read"""
+        selected = np.arange(self.nRows)[rows]
+        if selected.size == 0:
+            return np.zeros((0, 4))
+        start, stop = selected.min(), selected.max() + 1
+        packed = self._map("Valves", np.uint8, (self.valve_bytes,))[beat]
+        first_byte = (start * 4) // 8
+        last_byte = (stop * 4 + 7) // 8
+        bits = np.unpackbits(packed[first_byte:last_byte])
+        offset = start * 4 - first_byte * 8
+        valves = bits[offset:offset + (stop - start) * 4].reshape(-1, 4).astype(float)
+        return valves[selected - start]
+
+    def time_vector(self, beat):
+        return np.linspace(0, self.parameters[beat, PARAMETER_COLUMNS.index("cycle_length")], self.nRows)
+
+    def resistances(self, beat):
+        return np.array(self.parameters[beat, RESISTANCES])
+
+    def capacitances(self, beat):
+        return np.array(self.parameters[beat, CAPACITANCES])
+
+    def ventricles(self, beat):
+        return np.reshape(self.parameters[beat, VENTRICLES], (2, 4))
+
+    def tes(self, beat):
+        return float(self.parameters[beat, PARAMETER_COLUMNS.index("tes")])